@@ -9,6 +9,10 @@ import re, datetime, os
 import numpy as np
 import matplotlib.gridspec as gridspec
 from bitstring import BitArray
+from cupid_xray_decode import decode_xray, xray_records
+from cupid_count_rates import event_rates
+from lxi_bitfields import cupid_status
+from mcp_event_pipeline import PositionPipeline, threshold_filter
 #matplotlib.rcParams['pdf.fonttype'] = 42
 
 plt.rcParams['axes.grid'] = True
@@ -99,83 +103,60 @@ def read_xrfs(filename, varname):
 
     f.close()
 
+def histogram_image(ax, counts, xedges, yedges, **kwargs):
+    # Draws a 2D histogram computed with np.histogram2d, like ax.hist2d but without binning the
+    # events again, so the same counts can be drawn with a linear and a log scale
+    return ax.imshow(counts.T, origin='lower', extent=(xedges[0], xedges[-1], yedges[0], yedges[-1]),
+                     aspect='auto', interpolation='nearest', **kwargs)
+
+def save_figure(fig, name, formats=('png',), dpi=None):
+    # Saves a figure as name.png, name.svg, ... for each of the formats. dpi is either the same
+    # for all the formats or a dict of the dpi of each format, e.g. {'svg': 1000}, None keeping
+    # the dpi of the figure. The images of the figure are embedded at that dpi in the vector
+    # formats (svg, pdf), which are then slow to write.
+    for format in formats:
+        format_dpi = dpi.get(format) if isinstance(dpi, dict) else dpi
+        fig.savefig(name+'.'+format, format=format, dpi=format_dpi, bbox_inches=None, pad_inches=0.3)
+
+# The readers below keep the list of "xray_pkt" API, but all of them share the decode of
+# "decode_xray", which reads and decodes each file only once. The functions of this module use
+# the columns of "decode_xray" directly.
 def read_xray(filename, varname):
     # Function to read SCIENCE data out of xrbr file
-    file = open(filename, 'rb')
-    contents = file.read()
-    starts = [m.start() for m in re.finditer(b'\xfe\x6b', contents)]
-    stops = starts[1:]
-    stops.append(starts[-1]+16)
-    for idx, s in enumerate(starts):
-        stuff = unpack(xray_unpack, contents[s:s+16])
-        data = xray_pkt(stuff)
-        if (int(data.sync) == 4268435520) and (data.time < t_cut):
-            varname.append(data)
-    file.close()
+    columns = decode_xray(filename)
+    varname.extend(xray_pkt(stuff) for stuff in xray_records(columns, columns.sci))
 def read_xray_all(filename, varname):
     # Function to read ALL telemetry in the xrbr file
-    file = open(filename, 'rb')
-    contents = file.read()
-    starts = [m.start() for m in re.finditer(b'\xfe\x6b', contents)]
-    stops = starts[1:]
-    stops.append(starts[-1]+16)
-    for idx, s in enumerate(starts):
-        stuff = unpack(xray_unpack, contents[s:s+16])
-        data = xray_pkt(stuff)
-        varname.append(data)
-    file.close()
+    columns = decode_xray(filename)
+    varname.extend(xray_pkt(stuff) for stuff in xray_records(columns))
 def read_xray_commanded(filename, varname):
     # Function to read COMMANDED EVENT data out of XRBR file
-    file = open(filename, 'rb')
-    contents = file.read()
-    starts = [m.start() for m in re.finditer(b'\xfe\x6b', contents)]
-    stops = starts[1:]
-    stops.append(starts[-1]+16)
-    for idx, s in enumerate(starts):
-        stuff = unpack(xray_unpack, contents[s:s+16])
-        data = xray_pkt(stuff)
-        if (int(data.sync) == 4268435520) and (data.time > t_cut) and (data.time < 2147483647):
-            varname.append(data)
-    file.close()
+    columns = decode_xray(filename)
+    varname.extend(xray_pkt(stuff) for stuff in xray_records(columns, columns.commanded))
 def read_xray_hk(filename, varname):
     # Function to read HOUSEKEEPING data out of XRBR file
-    f = open(filename, 'rb')
-    contents = f.read()
-    starts = [m.start() for m in re.finditer(b'\xfe\x6b', contents)]
-    stops = starts[1:]
-    stops.append(starts[-1]+16)
-    for idx, s in enumerate(starts):
-        stuff = unpack(xray_unpack, contents[s:s+16])
-        data = xray_pkt(stuff)
-        # 2147483648
-        # This time demarkation is for HK packets from the xray that would have
-        # a Telemetry Type of 1 in bit 31 of the 0-31 bit 4 byte Time Tag data
-        # (bytes 4-7)
-        if (int(data.sync) == 4268435520) and (data.time >= 2147483647):
-            varname.append(data)
-    f.close()
-def plot_xrbr(filename):
-    xrdata = []
-    read_xray(filename,xrdata)
-    times = np.transpose([d.time for d in xrdata])
-    x0r, x1r, y0r, y1r = np.transpose([d.channels for d in xrdata])
+    # This time demarkation is for HK packets from the xray that would have
+    # a Telemetry Type of 1 in bit 31 of the 0-31 bit 4 byte Time Tag data
+    # (bytes 4-7)
+    columns = decode_xray(filename)
+    varname.extend(xray_pkt(stuff) for stuff in xray_records(columns, columns.hk))
+def plot_xrbr(filename, formats=('png',), dpi=None):
+    # formats=('png', 'svg'), dpi={'svg': 1000} also saves the SVG figures made before
+    xrdata = decode_xray(filename)
+    times = xrdata.time[xrdata.sci]
+    # MCP positions in the geometry "cupid_cm" (see mcp_event_pipeline)
+    pipeline = PositionPipeline("cupid_cm")
+    x0, x1, y0, y1 = pipeline.volts(xrdata.channels[xrdata.sci])
     # TIME CUTTING
     # print(times[5010])
     # Tmask = np.where((times > (2152680-2147484)*1000) & (times < (2152680+300-2147484)*1000))
     # Tmask = np.where((times < 2147483647) & (times > 152000))# (2154880-2147484)*1000) & (times < (2154880+300-2147484)*1000))
     # times = times[Tmask]
-    # x0r = x0r[Tmask]
-    # x1r = x1r[Tmask]
-    # y0r = y0r[Tmask]
-    # y1r = y1r[Tmask]
+    # x0 = x0[Tmask]
+    # x1 = x1[Tmask]
+    # y0 = y0[Tmask]
+    # y1 = y1[Tmask]
 
-    #####
-    ADC_Vrange = 4.5
-    VperC = ADC_Vrange/65536.
-    x0 = x0r * VperC
-    x1 = x1r * VperC
-    y0 = y0r * VperC
-    y1 = y1r * VperC
     # ### TEST PLOTTING ###
     hist_fig = plt.figure(figsize=(10, 6))
     ax1=hist_fig.add_subplot(121, label="x0x1color")
@@ -183,8 +164,10 @@ def plot_xrbr(filename):
     channelbins = 100
     #['viridis', 'plasma', 'inferno', 'magma']
     binedges = np.linspace(1,5,101)
-    h1, xedges, yedges, im1= ax1.hist2d(x0,x1,bins=binedges,cmap='inferno',norm=LogNorm())
-    h2, xedges, yedges, im2= ax2.hist2d(y0,y1,bins=binedges,cmap='inferno',norm=LogNorm())
+    h1, xedges, yedges = np.histogram2d(x0,x1,bins=binedges)
+    h2, xedges, yedges = np.histogram2d(y0,y1,bins=binedges)
+    im1 = histogram_image(ax1,h1,xedges,yedges,cmap='inferno',norm=LogNorm())
+    im2 = histogram_image(ax2,h2,xedges,yedges,cmap='inferno',norm=LogNorm())
     cb1 = hist_fig.colorbar(im1,ax=ax1,orientation='horizontal')
     cb2 = hist_fig.colorbar(im2,ax=ax2,orientation='horizontal')
 
@@ -197,31 +180,16 @@ def plot_xrbr(filename):
 
     Title1 = hist_fig.suptitle('X-ray Channel Comparison Histograms '+filename, fontsize = 'xx-large')
     Title1.set_y(0.94)
-    hist_fig.savefig(filename+'_channelcompare.png')
+    save_figure(hist_fig, filename+'_channelcompare', formats=formats, dpi=dpi)
     plt.close()
 
     lo_thold =2.1#16019.
     hi_thold = 3.3#62622.
-    # offset = 1.3
-    offsetx0 = 1#14563.
-    offsetx1 = 1#14563.
-    offsety0 = 1#14563.
-    offsety1 = 1#14563.
-
-    mask_x0 = np.where((x0 < hi_thold) & (x0 > lo_thold))
-    mask_x1 = np.where((x1 < hi_thold) & (x1 > lo_thold))
-    mask_y0 = np.where((y0 < hi_thold) & (y0 > lo_thold))
-    mask_y1 = np.where((y1 < hi_thold) & (y1 > lo_thold))
-
-    mask_x = np.intersect1d(mask_x0,mask_x1)
-    mask_y = np.intersect1d(mask_y0,mask_y1)
 
-    pass_mask = np.intersect1d(mask_x,mask_y)
-
-    x0pass = (x0[pass_mask]) - offsetx0
-    x1pass = (x1[pass_mask]) - offsetx1
-    y0pass = (y0[pass_mask]) - offsety0
-    y1pass = (y1[pass_mask]) - offsety1
+    # Events with all four channels between the thresholds, and the number of events rejected
+    # for each reason (e.g. "x0 low")
+    thresholds = threshold_filter(x0, x1, y0, y1, lo_thold=lo_thold, hi_thold=hi_thold)
+    pass_mask = np.flatnonzero(thresholds.passed)
 
     tvalid = times[pass_mask]
     tstart = tvalid[0]
@@ -230,40 +198,25 @@ def plot_xrbr(filename):
     print(tvalid[0])
     print(tvalid[-2])
     print(dt)
+    print(thresholds.rejects)
 
     nbins = 100
 
-    # NOMINAL CALCULATION OF MCP POSITION
-    x =(x0pass/(x0pass+x1pass))#-0.5
-    y =(y0pass/(y0pass+y1pass))#-0.5
-    # ALIGNMENT CORRECTION DEVELOPED BY C. O'Brien
-    x_offset = 0.0006
-    y_offset = 0.0061
-
-    x_offset = 0.4866
-    y_offset = 0.5201
-    M_inv = np.array([[1.0275, -0.14678],[-0.13380, 1.0293]])
-    x_shift = x - x_offset
-    y_shift = y - y_offset
-    x = (x_shift * M_inv[0,0] + y_shift * M_inv[0,1])
-    y = (x_shift * M_inv[1,0] + y_shift * M_inv[1,1])
-
-    #THE *2/0.0614 IS A NORMALIZATION FACTOR LIKE SIEGMUND et. al. 1986
-    #THIS SCALES IT TO CM SCALE ON THE DETECTOR
-    x = (x)*2/0.0614
-    y = (y)*2/0.0614
+    # MCP POSITION, WITH THE ALIGNMENT CORRECTION DEVELOPED BY C. O'Brien, IN CM ON THE DETECTOR
+    x, y = pipeline.positions(x0[pass_mask], x1[pass_mask], y0[pass_mask], y1[pass_mask])
     #####
     plotwidth = 4.6
+    # binedges = np.linspace(-nbins/2,nbins/2,nbins+1)
+    # binedges = np.linspace(-nbins,nbins,nbins+1)
+    binedges = np.linspace(-plotwidth/2,plotwidth/2,int(nbins))
 
-    XCenterPlus = np.where(y > -1)
-    XCenterMinus = np.where(y < 1)
-    XMask = np.intersect1d(XCenterPlus,XCenterMinus)
-    XCenter = x[XMask]
-
-    YCenterPlus = np.where(x > -1)
-    YCenterMinus = np.where(x < 1)
-    YMask = np.intersect1d(YCenterPlus,YCenterMinus)
-    YCenter = y[YMask]
+    # The 2D histogram and the 1D histograms of the center strips are computed once, and drawn
+    # on both the linear and the log scale plots
+    h2, xedges, yedges = np.histogram2d(x,y,bins=binedges)
+    XCenter = x[(y > -1) & (y < 1)]
+    YCenter = y[(x > -1) & (x < 1)]
+    XCenterHist, _ = np.histogram(XCenter, bins=binedges)
+    YCenterHist, _ = np.histogram(YCenter, bins=binedges)
 
     left, width = 0.15, 0.55
     bottom, height = 0.15, 0.55
@@ -281,12 +234,7 @@ def plot_xrbr(filename):
     ax_histx.tick_params(axis="x", labelbottom=False)
     ax_histy.tick_params(axis="y", labelleft=False)
     #['viridis', 'plasma', 'inferno', 'magma']
-    # binedges = np.linspace(-nbins/2,nbins/2,nbins+1)
-    # binedges = np.linspace(-nbins,nbins,nbins+1)
-    binedges = np.linspace(-plotwidth/2,plotwidth/2,int(nbins))
-
-    # binedges = np.linspace(0,nbins,nbins+1)
-    h2, xedges, yedges, im= ax.hist2d(x,y,bins=binedges,cmap='inferno')
+    im = histogram_image(ax,h2,xedges,yedges,cmap='inferno')
     cb = lin_fig.colorbar(im,cax=cax,orientation='horizontal')
     cb.set_ticks([0, 25, 50])
     cb.set_ticklabels([str(0/dt), str(np.around((25/dt),decimals=4)), str(np.around((50/dt),decimals=4))])
@@ -342,10 +290,10 @@ def plot_xrbr(filename):
     minmatrix = abs(h2-hmax)
     indhmax = np.where(minmatrix == np.amin(minmatrix))
 
-    ax_histx.hist(XCenter, bins=binedges,color='b')#the X axis histogram at y = .5
+    ax_histx.bar(binedges[:-1], XCenterHist, width=np.diff(binedges), align='edge', color='b')#the X axis histogram at y = .5
     ax_histx.set_title('1D Histogram at Y = 1/2')
     ax_histx.set_ylabel('Counts (total)')
-    ax_histy.hist(YCenter, bins=binedges, orientation='horizontal',color='r')
+    ax_histy.barh(binedges[:-1], YCenterHist, height=np.diff(binedges), align='edge', color='r')
     ax_histy.set_title('1D Histogram at X = 1/2')
     ax_histy.set_xlabel('Counts (total)')
     lowstring = 'Low: '
@@ -359,8 +307,7 @@ def plot_xrbr(filename):
     lin_fig.text(0.83, 0.81,  highstring+ (str(hi_thold)), fontsize=12, horizontalalignment='center',verticalalignment='center')
     lin_fig.text(0.83, 0.79,  BinNumber+(str(nbins)), fontsize=12, horizontalalignment='center',verticalalignment='center')
 
-    lin_fig.savefig(filename+'_linscale.png')
-    lin_fig.savefig(filename+'_linscale.svg', format='svg', dpi=1000, bbox_inches=None, pad_inches=0.3)
+    save_figure(lin_fig, filename+'_linscale', formats=formats, dpi=dpi)
 
     plt.close()
 #
@@ -375,9 +322,7 @@ def plot_xrbr(filename):
     ax_histx.tick_params(axis="x", labelbottom=False)
     ax_histy.tick_params(axis="y", labelleft=False)
 #
-    # binedges = np.linspace(-nbins/2,nbins/2,nbins+1)
-    binedges = np.linspace(-plotwidth/2,plotwidth/2,int(nbins))
-    h2, xedges, yedges, im= ax.hist2d(x,y,bins=binedges,cmap='inferno', norm=LogNorm(vmin=1,vmax=10*(1+np.floor(np.amax(h2)/10))))
+    im = histogram_image(ax,h2,xedges,yedges,cmap='inferno', norm=LogNorm(vmin=1,vmax=10*(1+np.floor(np.amax(h2)/10))))
     cb = log_fig.colorbar(im,cax=cax,orientation='horizontal')
     cb.set_ticks([1, 25, 50])
     cb.set_ticklabels([str(np.around((1/dt),decimals=4)), str(np.around((25/dt),decimals=4)), str(np.around((50/dt),decimals=4))])
@@ -419,11 +364,11 @@ def plot_xrbr(filename):
     #ax.axvline(0,color="r",alpha=0.5)
     #ax.axhline(0,color="b",alpha=0.5)
 #
-    ax_histx.hist(XCenter, bins=binedges,color='b')#the X axis histogram at y = .5
+    ax_histx.bar(binedges[:-1], XCenterHist, width=np.diff(binedges), align='edge', color='b')#the X axis histogram at y = .5
     ax_histx.set_yscale('log')
     ax_histx.set_title('1D Histogram at Y = 1/2')
     ax_histx.set_ylabel('Counts (total)')
-    ax_histy.hist(YCenter, bins=binedges, orientation='horizontal',color='r')
+    ax_histy.barh(binedges[:-1], YCenterHist, height=np.diff(binedges), align='edge', color='r')
     ax_histy.set_xscale('log')
     ax_histy.set_title('1D Histogram at X = 1/2')
     ax_histy.set_xlabel('Counts (total)')
@@ -436,8 +381,7 @@ def plot_xrbr(filename):
     log_fig.text(0.83, 0.81,  highstring+ (str(hi_thold)), fontsize=12, horizontalalignment='center',verticalalignment='center')
     log_fig.text(0.83, 0.79,  BinNumber+(str(nbins)), fontsize=12, horizontalalignment='center',verticalalignment='center')
 
-    log_fig.savefig(filename+'_logscale.png')
-    log_fig.savefig(filename+'_logscale.svg', format='svg', dpi=1000, bbox_inches=None, pad_inches=0.3)
+    save_figure(log_fig, filename+'_logscale', formats=formats, dpi=dpi)
 
     plt.close()
 
@@ -475,21 +419,16 @@ def plot_xrbr(filename):
     Title1.set_y(0.94)
     #Title2 = hist_fig.suptitle(filename)
     #Title2.set_y(0.92)
-    hist_fig.savefig(filename+'_channelhistogram.png')
+    save_figure(hist_fig, filename+'_channelhistogram', formats=formats, dpi=dpi)
     plt.close()
 
 def plot_xrbrcommanded(filename):
-    xrdata = []
-    read_xray_commanded(filename,xrdata)
-    times = np.transpose([d.time for d in xrdata])
-    x0r, x1r, y0r, y1r = np.transpose([d.channels for d in xrdata])
-    #####
-    ADC_Vrange = 4.5
-    VperC = ADC_Vrange/65536.
-    x0 = x0r * VperC
-    x1 = x1r * VperC
-    y0 = y0r * VperC
-    y1 = y1r * VperC
+    xrdata = decode_xray(filename)
+    times = xrdata.time[xrdata.commanded]
+    nbins = 80
+    # MCP positions in the geometry "cupid_bins" with nbins bins (see mcp_event_pipeline)
+    pipeline = PositionPipeline("cupid_bins", n_bins=nbins)
+    x0, x1, y0, y1 = pipeline.volts(xrdata.channels[xrdata.commanded])
     # ### TEST PLOTTING ###
     hist_fig = plt.figure(figsize=(10, 6))
     ax1=hist_fig.add_subplot(121, label="x0x1color")
@@ -516,46 +455,16 @@ def plot_xrbrcommanded(filename):
 
     lo_thold =0#16019.
     hi_thold = 4.5#62622.
-    offset = 1
-    # offsetx0 = 1#14563.
-    # offsetx1 = 1#14563.
-    # offsety0 = 1#14563.
-    # offsety1 = 1#14563.
     #
-    mask_x0 = np.where((x0 < hi_thold) & (x0 > lo_thold))
-    mask_x1 = np.where((x1 < hi_thold) & (x1 > lo_thold))
-    mask_y0 = np.where((y0 < hi_thold) & (y0 > lo_thold))
-    mask_y1 = np.where((y1 < hi_thold) & (y1 > lo_thold))
-
-    mask_x = np.intersect1d(mask_x0,mask_x1)
-    mask_y = np.intersect1d(mask_y0,mask_y1)
-
-    pass_mask = np.intersect1d(mask_x,mask_y)
-
-    x0pass = (x0[pass_mask]) - offset
-    x1pass = (x1[pass_mask]) - offset
-    y0pass = (y0[pass_mask]) - offset
-    y1pass = (y1[pass_mask]) - offset
+    # Events with all four channels between the thresholds, and the number of events rejected
+    # for each reason (e.g. "x0 low")
+    thresholds = threshold_filter(x0, x1, y0, y1, lo_thold=lo_thold, hi_thold=hi_thold)
+    pass_mask = np.flatnonzero(thresholds.passed)
 
     tvalid = times[pass_mask]
 
-    nbins = 80
-
-    # NOMINAL CALCULATION OF MCP POSITION
-    x =(x0pass/(x0pass+x1pass))
-    y =(y0pass/(y0pass+y1pass))
-    # ALIGNMENT CORRECTION DEVELOPED BY C. O'Brien
-    x_offset = 0.5006
-    y_offset = 0.5061
-    M_inv = np.array([[1.0275, -0.14678],[-0.13380, 1.0293]])
-    x_shift = x - x_offset
-    y_shift = y - y_offset
-    x = (x_shift * M_inv[0,0] + y_shift * M_inv[0,1]) + 0.5
-    y = (x_shift * M_inv[1,0] + y_shift * M_inv[1,1]) + 0.5
-    # THE -0.5 IS INTHERE TO SHIFT IT TO 0,0
-    # THE *7 IS A NORMALIZATION FACTOR LIKE SIEGMUND et. al. 1986
-    x = (x-0.5)*7*nbins
-    y = (y-0.5)*7*nbins
+    # MCP POSITION, WITH THE ALIGNMENT CORRECTION DEVELOPED BY C. O'Brien, IN BINS CENTERED ON 0,0
+    x, y = pipeline.positions(x0[pass_mask], x1[pass_mask], y0[pass_mask], y1[pass_mask])
     #x =((x0pass/(x0pass+x1pass))-0.5)*10*nbins
     #x =((x0pass/(x0pass+x1pass))-0.5)*7*nbins
     #y =((y0pass/(y0pass+y1pass))-0.5)*10*nbins
@@ -655,54 +564,25 @@ def plot_xrbrcommanded(filename):
     plt.close()
 
 def rate_xrbr(filename):
-    xrbr_all = []
-    read_xray(filename,xrbr_all)
-    times = np.transpose([d.time for d in xrbr_all])
-    x0r, x1r, y0r, y1r = np.transpose([d.channels for d in xrbr_all])
-    ADC_Vrange = 4.5
-    VperC = ADC_Vrange/65536.
-    x0 = x0r * VperC
-    x1 = x1r * VperC
-    y0 = y0r * VperC
-    y1 = y1r * VperC
+    xrbr_all = decode_xray(filename)
+    times = xrbr_all.time[xrbr_all.sci]
+    nbins = 80
+    # MCP positions in the geometry "cupid_bins" with nbins bins (see mcp_event_pipeline)
+    pipeline = PositionPipeline("cupid_bins", n_bins=nbins)
+    x0, x1, y0, y1 = pipeline.volts(xrbr_all.channels[xrbr_all.sci])
     lo_thold =2.1#16019.
     hi_thold = 3.3#62622.
-    offset = 1
 
-    mask_x0 = np.where((x0 < hi_thold) & (x0 > lo_thold))
-    mask_x1 = np.where((x1 < hi_thold) & (x1 > lo_thold))
-    mask_y0 = np.where((y0 < hi_thold) & (y0 > lo_thold))
-    mask_y1 = np.where((y1 < hi_thold) & (y1 > lo_thold))
-    mask_x = np.intersect1d(mask_x0,mask_x1)
-    mask_y = np.intersect1d(mask_y0,mask_y1)
-    pass_mask = np.intersect1d(mask_x,mask_y)
+    # Events with all four channels between the thresholds, and the number of events rejected
+    # for each reason (e.g. "x0 low")
+    thresholds = threshold_filter(x0, x1, y0, y1, lo_thold=lo_thold, hi_thold=hi_thold)
+    pass_mask = np.flatnonzero(thresholds.passed)
     tvalid = times[pass_mask]
-    x0pass = (x0[pass_mask]) - offset
-    x1pass = (x1[pass_mask]) - offset
-    y0pass = (y0[pass_mask]) - offset
-    y1pass = (y1[pass_mask]) - offset
 
-    nbins = 80
-    x =(x0pass/(x0pass+x1pass))
-    y =(y0pass/(y0pass+y1pass))
-    # ALIGNMENT CORRECTION DEVELOPED BY C. O'Brien
-    ###############
-    x_offset = 0.5006
-    y_offset = 0.5061
-    M_inv = np.array([[1.0275, -0.14678],[-0.13380, 1.0293]])
-    x_shift = x - x_offset
-    y_shift = y - y_offset
-    x = (x_shift * M_inv[0,0] + y_shift * M_inv[0,1]) + 0.5
-    y = (x_shift * M_inv[1,0] + y_shift * M_inv[1,1]) + 0.5
-    ###############
-    # THE -0.5 IS INTHERE TO SHIFT IT TO 0,0
-    # THE *7 IS A NORMALIZATION FACTOR LIKE SIEGMUND et. al. 1986
-    x = (x-0.5)*7*nbins
-    y = (y-0.5)*7*nbins
+    # MCP POSITION, WITH THE ALIGNMENT CORRECTION DEVELOPED BY C. O'Brien, IN BINS CENTERED ON 0,0
+    x, y = pipeline.positions(x0[pass_mask], x1[pass_mask], y0[pass_mask], y1[pass_mask])
 
     times = times/1000
-    intT = times.astype(int)
-    intTvalid = tvalid.astype(int)
     Rectx = -22
     Recty = 0
     Recth = 22
@@ -717,21 +597,17 @@ def rate_xrbr(filename):
     NCounts = len(X_sig)
     # print(NCounts)
     ###############
-    # Count = []
-    # CountRate = []
-    # CountRateValid = []
-    # for T in range(0,len(intT)-1):
-    #     Count.append([intT[T]])
-    #     if intT[T+1] == intT[T]:
-    #         pass
-    #     if intT[T+1] != intT[T]:
-    #         CountRate.append([intT[T],len(Count)])
-    #         Count = []
-    #
-    # np.savetxt(filename+'CountRate.csv',CountRate,delimiter=',',newline='\n',header='time,DeltaEventCount', fmt='%.5f')
+    # Counts of all, valid and signal events per second
+    valid = np.zeros(len(times), dtype=bool)
+    valid[pass_mask] = True
+    signal = np.zeros(len(times), dtype=bool)
+    signal[pass_mask[Insplotch]] = True
+    rates = event_rates(xrbr_all.time[xrbr_all.sci], bin_width=1000, masks={"valid": valid, "signal": signal})
+    CountRate = np.column_stack((rates["all"].bin_start/1000, rates["all"].counts, rates["valid"].counts, rates["signal"].counts))
+    np.savetxt(filename+'CountRate.csv',CountRate,delimiter=',',newline='\n',header='time,DeltaEventCount,DeltaValidEventCount,DeltaSignalEventCount', fmt='%.5f')
     #################
-    totalcounts = len(intT)
-    totalcountsvalid = len(intTvalid)
+    totalcounts = len(times)
+    totalcountsvalid = len(tvalid)
     duration = np.max(times) - times[0]
     ratetotal = totalcounts/duration
     ratevalid = totalcountsvalid/duration
@@ -740,28 +616,18 @@ def rate_xrbr(filename):
     np.savetxt(filename+'_CountRateSummary.csv',the_data,delimiter=',',newline='\n',header='totalcounts,totalvalidcounts,duration,ratetotal,ratevalid,ratesignal', fmt='%.5f')
 
 def countratecompare(filename):
-    xrbr_all = []
-    read_xray(filename,xrbr_all)
-    times = np.transpose([d.time for d in xrbr_all])
-    x0r, x1r, y0r, y1r = np.transpose([d.channels for d in xrbr_all])
-    ADC_Vrange = 4.5
-    VperC = ADC_Vrange/65536.
-    x0 = x0r * VperC
-    x1 = x1r * VperC
-    y0 = y0r * VperC
-    y1 = y1r * VperC
+    xrbr_all = decode_xray(filename)
+    times = xrbr_all.time[xrbr_all.sci]
+    # MCP positions in the geometry "cupid_bins" (see mcp_event_pipeline)
+    pipeline = PositionPipeline("cupid_bins")
+    x0, x1, y0, y1 = pipeline.volts(xrbr_all.channels[xrbr_all.sci])
     lo_thold =2.1#16019.
     hi_thold = 3.3#62622.
-    offset = 1
 
-    mask_x0 = np.where((x0 < hi_thold) & (x0 > lo_thold))
-    mask_x1 = np.where((x1 < hi_thold) & (x1 > lo_thold))
-    mask_y0 = np.where((y0 < hi_thold) & (y0 > lo_thold))
-    mask_y1 = np.where((y1 < hi_thold) & (y1 > lo_thold))
-    mask_x = np.intersect1d(mask_x0,mask_x1)
-    mask_y = np.intersect1d(mask_y0,mask_y1)
-    pass_mask = np.intersect1d(mask_x,mask_y)
-    tvalid = times[pass_mask]
+    # Events with all four channels between the thresholds, and the number of events rejected
+    # for each reason (e.g. "x0 low")
+    thresholds = threshold_filter(x0, x1, y0, y1, lo_thold=lo_thold, hi_thold=hi_thold)
+    pass_mask = np.flatnonzero(thresholds.passed)
     # x0pass = (x0[pass_mask]) - offset
     # x1pass = (x1[pass_mask]) - offset
     # y0pass = (y0[pass_mask]) - offset
@@ -785,10 +651,6 @@ def countratecompare(filename):
     # x = (x-0.5)*7*nbins
     # y = (y-0.5)*7*nbins
 
-    times = times/1000
-    tvalid = tvalid/1000
-    intT = times.astype(int)
-    intTvalid = tvalid.astype(int)
     # Rectx = -22
     # Recty = 0
     # Recth = 22
@@ -803,28 +665,12 @@ def countratecompare(filename):
     # NCounts = len(X_sig)
     # print(NCounts)
     ###############
-    Count_T = []
-    CountRate_T = []
-    for T in range(0,len(intT)-1):
-        Count_T.append([intT[T]])
-        if intT[T+1] == intT[T]:
-            pass
-        if intT[T+1] != intT[T]:
-            CountRate_T.append([intT[T],len(Count_T)])
-            Count_T = []
-    ###############
-    Count_Tvalid = []
-    CountRate_Tvalid = []
-    for T in range(0,len(intTvalid)-1):
-        Count_Tvalid.append([intTvalid[T]])
-        if intTvalid[T+1] == intTvalid[T]:
-            pass
-        if intTvalid[T+1] != intTvalid[T]:
-            CountRate_Tvalid.append([intTvalid[T],len(Count_Tvalid)])
-            Count_Tvalid = []
-
-    AllCounts = np.asarray(CountRate_T)
-    ValidCounts = np.asarray(CountRate_Tvalid)
+    # Counts of all and valid events per second, on the same bins
+    valid = np.zeros(len(times), dtype=bool)
+    valid[pass_mask] = True
+    rates = event_rates(xrbr_all.time[xrbr_all.sci], bin_width=1000, masks={"valid": valid})
+    AllCounts = np.column_stack((rates["all"].bin_start/1000, rates["all"].counts))
+    ValidCounts = np.column_stack((rates["valid"].bin_start/1000, rates["valid"].counts))
 
     # np.savetxt(filename+'CountRateAllvsValid.csv',CountRate,delimiter=',',newline='\n',header='time,DeltaEventCount,DeltaValidEventCount', fmt='%.5f')
     f, (Counts) = plt.subplots(1,1,figsize=(8,5))
@@ -856,69 +702,43 @@ def countratecompare(filename):
 
 
 def csvw_xrbr_hk(filename):
-    xrbr_arr = []
-    read_xray_hk(filename,xrbr_arr)
-    npkts = len(xrbr_arr)
+    xrbr_arr = decode_xray(filename)
+    npkts = np.count_nonzero(xrbr_arr.hk)
+    status = cupid_status(xrbr_arr.channels[xrbr_arr.hk, 0])
     csv_staging = np.zeros([npkts,8])
-    for i in range(npkts):
-        pkt = xrbr_arr[i]
-        csv_staging[i,0] = pkt.time/1000.
-        Status = pkt.channels[0]
-        StatusBit = "{0:016b}".format(Status)
-        if StatusBit[0] == '1': #
-            MCP_xHV = 1
-            if StatusBit[1] == '1':
-                MCP_xAuto = 1
-            else:
-                MCP_xAuto = 0
-            HVData = int(StatusBit[4:],2)
-            TempData = np.nan
-        else:
-            MCP_xHV = 0
-            MCP_xAuto = np.nan
-            HVData = np.nan
-            TempData = int(StatusBit[4:],2)
-        csv_staging[i,1] = MCP_xHV
-        csv_staging[i,2] = MCP_xAuto
-        csv_staging[i,3] = HVData
-        csv_staging[i,4] = TempData
-        csv_staging[i,5:8] = pkt.channels[1:4]
+    csv_staging[:,0] = xrbr_arr.time[xrbr_arr.hk]/1000.
+    csv_staging[:,1] = status["hv_changed"]
+    csv_staging[:,2] = status["hv_auto"]
+    csv_staging[:,3] = status["hv_setting"]
+    csv_staging[:,4] = status["temperature_data"]
+    csv_staging[:,5:8] = xrbr_arr.channels[xrbr_arr.hk, 1:4]
     np.savetxt(filename+'_hk.csv',csv_staging,delimiter=',',newline='\n',header='time,MCP_Delta_HV,MCP_Auto/Manual,HV_Setting,Temp_Data,Delta_Event_Count,Delta_Dropped_Event_Count,Delta_Lost_Event_Count', fmt='%.5f')
 
 def csvw_xrbr_all(filename):
-    xrbr_arr = []
-    read_xray_all(filename,xrbr_arr)
-    npkts = len(xrbr_arr)
+    xrbr_arr = decode_xray(filename)
+    npkts = len(xrbr_arr.time)
     csv_staging = np.zeros([npkts,6])
-    for i in range(npkts):
-        pkt = xrbr_arr[i]
-        csv_staging[i,0] = pkt.time/1000.
-        csv_staging[i,1:5] = pkt.channels[:]
-        csv_staging[i,5] = pkt.sync
+    csv_staging[:,0] = xrbr_arr.time/1000.
+    csv_staging[:,1:5] = xrbr_arr.channels
+    csv_staging[:,5] = xrbr_arr.sync
     np.savetxt(filename+'_all.csv',csv_staging,delimiter=',',newline='\n',header='time,x0,x1,y0,y1,sync', fmt='%.5f')
 
 def csvw_xrbr_commanded(filename):
-    xrbr_arr = []
-    read_xray_commanded(filename,xrbr_arr)
-    npkts = len(xrbr_arr)
+    xrbr_arr = decode_xray(filename)
+    npkts = len(xrbr_arr.time[xrbr_arr.commanded])
     csv_staging = np.zeros([npkts,6])
-    for i in range(npkts):
-        pkt = xrbr_arr[i]
-        csv_staging[i,0] = pkt.time/1000.
-        csv_staging[i,1:5] = pkt.channels[:]
-        csv_staging[i,5] = pkt.sync
+    csv_staging[:,0] = xrbr_arr.time[xrbr_arr.commanded]/1000.
+    csv_staging[:,1:5] = xrbr_arr.channels[xrbr_arr.commanded]
+    csv_staging[:,5] = xrbr_arr.sync[xrbr_arr.commanded]
     np.savetxt(filename+'_commanded.csv',csv_staging,delimiter=',',newline='\n',header='time,x0,x1,y0,y1,sync', fmt='%.5f')
 
 def csvw_xrbr_science(filename):
-    xrbr_arr = []
-    read_xray(filename,xrbr_arr)
-    npkts = len(xrbr_arr)
+    xrbr_arr = decode_xray(filename)
+    npkts = len(xrbr_arr.time[xrbr_arr.sci])
     csv_staging = np.zeros([npkts,6])
-    for i in range(npkts):
-        pkt = xrbr_arr[i]
-        csv_staging[i,0] = pkt.time/1000.
-        csv_staging[i,1:5] = pkt.channels[:]
-        csv_staging[i,5] = pkt.sync
+    csv_staging[:,0] = xrbr_arr.time[xrbr_arr.sci]/1000.
+    csv_staging[:,1:5] = xrbr_arr.channels[xrbr_arr.sci]
+    csv_staging[:,5] = xrbr_arr.sync[xrbr_arr.sci]
     np.savetxt(filename+'_science.csv',csv_staging,delimiter=',',newline='\n',header='time,x0,x1,y0,y1,sync', fmt='%.5f')
 
 def plot_xrfs(filename):
@@ -1021,5 +841,5 @@ if __name__ == '__main__':
         #csvw_xrbr_science(name)
     if name[0:4] == 'xrfs':
         #rate_xrbr(name)
-        #plot_xrfs(name)
-        csvw_xrbr(name)
+        plot_xrfs(name)
+        # For a whole directory of files, see cupid_batch_calibration
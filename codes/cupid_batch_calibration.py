@@ -0,0 +1,387 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from pathlib import Path
+from sys import argv
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import Cupid_Xray_Calibration as calibration
+from cupid_xray_decode import clear_xray_cache, decode_xray
+from lxi_batch_convert import file_hash
+from mcp_event_pipeline import PositionPipeline, threshold_filter
+
+# Version of the manifest, to be increased whenever the content of the products changes, so that
+# all the products are made again
+manifest_version = 2
+
+
+class cupid_product(NamedTuple):
+    """
+    Product of "Cupid_Xray_Calibration" which can be made by the batch.
+    - kind: str, prefix of the names of the files the product is made from ("xrbr" or "xrfs")
+    - outputs: tuple, suffixes added to the name of the file to get the names of the outputs
+    """
+    kind: str
+    outputs: tuple
+
+
+# Products with the name of their function in "Cupid_Xray_Calibration" as key
+products = {
+    "plot_xrbr": cupid_product("xrbr", (
+        "_channelcompare.png", "_linscale.png", "_logscale.png", "_channelhistogram.png",
+    )),
+    "plot_xrbrcommanded": cupid_product("xrbr", (
+        "_commandedchannelcompare.png", "_linscaleCommanded.png",
+    )),
+    "rate_xrbr": cupid_product("xrbr", ("CountRate.csv", "_CountRateSummary.csv")),
+    "countratecompare": cupid_product("xrbr", ("CountCompare.png",)),
+    "csvw_xrbr_all": cupid_product("xrbr", ("_all.csv",)),
+    "csvw_xrbr_hk": cupid_product("xrbr", ("_hk.csv",)),
+    "csvw_xrbr_commanded": cupid_product("xrbr", ("_commanded.csv",)),
+    "csvw_xrbr_science": cupid_product("xrbr", ("_science.csv",)),
+    "plot_xrfs": cupid_product("xrfs", ("_linscale.png",)),
+}
+
+# Products made by default, the same as the "__main__" block of "Cupid_Xray_Calibration"
+default_products = ("plot_xrbr", "plot_xrfs")
+
+# Columns of the summary table, one row per file
+summary_columns = (
+    "file", "kind", "size", "n_packets", "n_science", "n_commanded", "n_hk", "n_valid",
+    "duration", "rate_total", "rate_valid", "products", "error",
+)
+
+
+def key_kind(key):
+    """
+    Returns the kind of a file from its name ("xrbr" or "xrfs").
+    """
+    return Path(key).name[0:4]
+
+
+def is_output(path):
+    """
+    Checks if a file is an output of one of the products, e.g. "xrbr_1.bin_all.csv".
+    """
+    return any(path.name.endswith(suffix) for product in products.values()
+               for suffix in product.outputs)
+
+
+def find_xray_files(path, pattern="**/xr*"):
+    """
+    Finds the XRBR and XRFS files of a directory and its sub-directories, or matching a glob.
+
+    Parameters
+    ----------
+    path : str
+        Directory with the files, or glob pattern of the files (e.g. "../data/xrbr_2022*").
+    pattern : str
+        Glob pattern of the files, relative to "path" if it is a directory. Default is "**/xr*".
+
+    Returns
+    -------
+    xray_files : list
+        Paths of the files whose names start with "xrbr" or "xrfs", without the outputs of the
+        products, sorted by name.
+    """
+    if Path(path).is_dir():
+        paths = Path(path).glob(pattern)
+    else:
+        paths = (Path(name) for name in glob(path, recursive=True))
+    return sorted(
+        path for path in paths
+        if path.is_file() and path.name[0:4] in ("xrbr", "xrfs") and not is_output(path)
+    )
+
+
+def load_manifest(manifest_file_name):
+    """
+    Loads the manifest of the products made by the batch.
+
+    Parameters
+    ----------
+    manifest_file_name : str
+        Name of the manifest file, including its path.
+
+    Returns
+    -------
+    manifest : dict
+        Entry of every file, with its path as key. Empty if the manifest does not exist or was
+        written by another version.
+    """
+    if not Path(manifest_file_name).is_file():
+        return {}
+    with open(manifest_file_name) as file:
+        manifest = json.load(file)
+    if manifest.get("version") != manifest_version:
+        return {}
+    return manifest["files"]
+
+
+def save_manifest(manifest, manifest_file_name):
+    """
+    Saves the manifest of the products, through a temporary file (see
+    "lxi_batch_convert.save_manifest").
+    """
+    temporary_file_name = f"{manifest_file_name}.tmp"
+    with open(temporary_file_name, "w") as file:
+        json.dump({"version": manifest_version, "files": manifest}, file, indent=1, sort_keys=True)
+    Path(temporary_file_name).replace(manifest_file_name)
+
+
+def pending_products(entry, filename, selected):
+    """
+    Selects the products of a file which need to be made.
+
+    A product is made again if the file changed since it was made (see
+    "lxi_batch_convert.is_unchanged"), or if one of its outputs is missing.
+
+    Parameters
+    ----------
+    entry : dict
+        Manifest entry of the file, or None if no product of the file was ever made.
+    filename : str
+        Name of the file, including its path.
+    selected : tuple
+        Names of the selected products of the kind of the file.
+
+    Returns
+    -------
+    pending : list
+        Names of the products to make.
+    """
+    if entry is None:
+        return list(selected)
+
+    stat = Path(filename).stat()
+    if stat.st_size != entry["size"]:
+        return list(selected)
+    if stat.st_mtime_ns != entry["mtime_ns"]:
+        if file_hash(filename) != entry["hash"]:
+            return list(selected)
+        # Same content, only remember the new modification time
+        entry["mtime_ns"] = stat.st_mtime_ns
+
+    return [
+        name for name in selected
+        if name not in entry["products"]
+        or not all(Path(output).is_file() for output in entry["products"][name])
+    ]
+
+
+def xray_summary(filename, lo_thold=2.1, hi_thold=3.3):
+    """
+    Summarizes the packets of an XRBR file, with the same thresholds as "plot_xrbr" and
+    "rate_xrbr".
+
+    Parameters
+    ----------
+    filename : str
+        Name of the XRBR file, including its path.
+    lo_thold : float
+        Low threshold of the channels in volts. Default is 2.1.
+    hi_thold : float
+        High threshold of the channels in volts. Default is 3.3.
+
+    Returns
+    -------
+    summary : dict
+        Number of packets of each type, number of valid science events, duration of the science
+        events in seconds, and rates of all and valid science events in counts per second.
+    """
+    columns = decode_xray(filename)
+    times = columns.time[columns.sci] / 1000
+    x0, x1, y0, y1 = PositionPipeline("cupid_cm").volts(columns.channels[columns.sci])
+    n_valid = int(np.count_nonzero(
+        threshold_filter(x0, x1, y0, y1, lo_thold=lo_thold, hi_thold=hi_thold).passed
+    ))
+    duration = float(np.max(times) - times[0]) if len(times) else 0.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "n_packets": len(columns.time),
+            "n_science": len(times),
+            "n_commanded": int(np.count_nonzero(columns.commanded)),
+            "n_hk": int(np.count_nonzero(columns.hk)),
+            "n_valid": n_valid,
+            "duration": duration,
+            "rate_total": float(np.float64(len(times)) / duration),
+            "rate_valid": float(np.float64(n_valid) / duration),
+        }
+
+
+def process_file(filename, pending, entry):
+    """
+    Makes the pending products of one file and returns its manifest entry.
+
+    All the products run in the same process, so that the file is decoded only once by
+    "decode_xray", whose cache is emptied afterwards.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file, including its path.
+    pending : list
+        Names of the products to make.
+    entry : dict
+        Manifest entry of the file, or None. The products which are not pending are kept.
+
+    Returns
+    -------
+    entry : dict
+        Manifest entry of the file.
+    """
+    # Get the size and modification time before reading the file, so that a file modified while
+    # the products are made is processed again the next time
+    stat = Path(filename).stat()
+    digest = file_hash(filename)
+    # The products and summary of another content of the file are dropped
+    if entry is None or entry["hash"] != digest:
+        entry = {"products": {}, "summary": None}
+    entry = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": digest,
+        "products": {
+            name: outputs for name, outputs in entry["products"].items() if name not in pending
+        },
+        "summary": entry["summary"],
+    }
+    try:
+        for name in pending:
+            getattr(calibration, name)(filename)
+            entry["products"][name] = [filename + suffix for suffix in products[name].outputs]
+        if entry["summary"] is None and key_kind(filename) == "xrbr":
+            entry["summary"] = xray_summary(filename)
+    finally:
+        clear_xray_cache()
+        calibration.plt.close("all")
+    return entry
+
+
+def summary_row(key, entry=None, error=""):
+    """
+    Builds the row of a file in the summary table.
+    """
+    row = dict.fromkeys(summary_columns, np.nan)
+    row.update(file=key, kind=key_kind(key), error=error)
+    if entry is not None:
+        row.update(size=entry["size"], products=" ".join(sorted(entry["products"])))
+        row.update(entry["summary"] or {})
+    return row
+
+
+def batch_calibration(
+    path,
+    selected=default_products,
+    pattern="**/xr*",
+    summary_file_name=None,
+    max_workers=None,
+    force=False
+    ):
+    """
+    Makes the products of "Cupid_Xray_Calibration" for all the XRBR and XRFS files of a directory
+    or glob, using a pool of processes, and writes one summary table of all the files.
+
+    Each file is handled by a single process, which decodes it once for all its products. A
+    manifest with the size, modification time and hash of every file and the outputs of its
+    products is kept next to the summary table, and only the products of the files which changed,
+    or whose outputs are missing, are made again. The summary of the unchanged files is read from
+    the manifest.
+
+    Parameters
+    ----------
+    path : str
+        Directory with the files, or glob pattern of the files.
+    selected : tuple
+        Names of the products to make (see "products"). Each file gets the products of its kind.
+        Default is "default_products".
+    pattern : str
+        Glob pattern of the files, relative to "path" if it is a directory. Default is "**/xr*".
+    summary_file_name : str
+        Name of the summary table, including its path. Default is None, in which case it is
+        "cupid_summary.csv" in "path", or in the current directory if "path" is a glob.
+    max_workers : int
+        Number of processes. Default is None, in which case all the cores are used.
+    force : bool
+        If True, all the products are made, even if the files did not change. Default is False.
+
+    Raises
+    ------
+    ValueError :
+        If a product is unknown.
+
+    Returns
+    -------
+    summary : pandas.DataFrame
+        Summary of every file, as written to the summary table.
+    failed : dict
+        Error message of every file whose products could not all be made.
+    """
+    unknown = set(selected) - set(products)
+    if unknown:
+        raise ValueError(f"Unknown products {', '.join(sorted(unknown))}.")
+
+    if summary_file_name is None:
+        summary_file_name = str(Path(path if Path(path).is_dir() else ".") / "cupid_summary.csv")
+    manifest_file_name = str(Path(summary_file_name).with_suffix(".json"))
+    manifest = load_manifest(manifest_file_name)
+
+    to_process = []
+    rows = {}
+    for xray_file in find_xray_files(path, pattern):
+        key = str(xray_file)
+        kind_products = tuple(name for name in selected if products[name].kind == key_kind(key))
+        if force:
+            pending = list(kind_products)
+        else:
+            pending = pending_products(manifest.get(key), key, kind_products)
+        if (pending or key not in manifest
+                or (key_kind(key) == "xrbr" and manifest[key]["summary"] is None)):
+            to_process.append((key, pending))
+        else:
+            rows[key] = summary_row(key, manifest[key])
+
+    # Start with the largest files, so that the processes finish at about the same time
+    to_process.sort(key=lambda item: Path(item[0]).stat().st_size, reverse=True)
+
+    failed = {}
+    if to_process:
+        max_workers = min(max_workers or os.cpu_count(), len(to_process))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(process_file, key, pending, manifest.get(key)): key
+                for key, pending in to_process
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as error:
+                    failed[key] = f"{type(error).__name__}: {error}"
+                    manifest.pop(key, None)
+                    rows[key] = summary_row(key, error=failed[key])
+                    continue
+                manifest[key] = entry
+                rows[key] = summary_row(key, entry)
+                save_manifest(manifest, manifest_file_name)
+
+    # Save the modification times updated by "pending_products"
+    save_manifest(manifest, manifest_file_name)
+
+    summary = pd.DataFrame([rows[key] for key in sorted(rows)], columns=summary_columns)
+    summary.to_csv(summary_file_name, index=False)
+    return summary, failed
+
+
+if __name__ == "__main__":
+    path = argv[1] if len(argv) > 1 else "."
+    selected = tuple(argv[2].split(",")) if len(argv) > 2 else default_products
+
+    summary, failed = batch_calibration(path, selected)
+    print(f"{len(summary)} files summarized in the table")
+    for key, error in failed.items():
+        print(f"Failed to process {key}: {error}")
@@ -0,0 +1,172 @@
+from sys import argv
+from typing import NamedTuple
+
+import numpy as np
+
+
+class count_rate(NamedTuple):
+    """
+    Count rate of events in time bins.
+    - bin_start: numpy.ndarray, start of each bin in milliseconds
+    - counts: numpy.ndarray, number of events in each bin
+    - rate: numpy.ndarray, number of events per second in each bin
+    """
+    bin_start: np.ndarray
+    counts: np.ndarray
+    rate: np.ndarray
+
+
+def time_keys(times, bin_width=1000, start=None):
+    """
+    Converts the times of events to the integer index of their time bin.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        Times of the events in milliseconds.
+    bin_width : int
+        Width of the bins in milliseconds. Default is 1000.
+    start : int
+        Start of the first bin in milliseconds. Default is None, in which case the first bin
+        starts at the earliest event, rounded down to a multiple of "bin_width".
+
+    Returns
+    -------
+    keys : numpy.ndarray
+        Index of the bin of each event.
+    start : int
+        Start of the first bin in milliseconds.
+    """
+    times = np.asarray(times).astype(np.int64)
+    if start is None:
+        start = (int(times.min()) // bin_width) * bin_width if len(times) else 0
+    return (times - start) // bin_width, start
+
+
+# Largest number of bins counted with "np.bincount", beyond which only the bins with events are
+# kept (e.g. 1 ms bins over a day, or a few corrupted timestamps far from the others)
+max_dense_bins = 2**24
+
+
+def count_rates(times, bin_width=1000, start=None, stop=None, mask=None):
+    """
+    Computes the count rate of events in time bins of any width.
+
+    The events are counted with "np.bincount" on their integer bin index, so the events do not
+    need to be sorted. Empty bins are kept, with a count of zero, unless there are more than
+    "max_dense_bins" bins, in which case the events are counted with "np.unique" and only the
+    bins with events (of any mask) are returned.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        Times of the events in milliseconds.
+    bin_width : int
+        Width of the bins in milliseconds, from 1 to any number of hours. Default is 1000.
+    start : int
+        Start of the first bin in milliseconds. Default is None (see "time_keys").
+    stop : int
+        End of the last bin in milliseconds. Default is None, in which case the last bin is the
+        one of the latest event.
+    mask : numpy.ndarray
+        Mask of the events to count, e.g. the valid events. The bins are the same as without the
+        mask, so that the rates of different masks can be compared bin by bin. Default is None,
+        in which case all the events are counted.
+
+    Returns
+    -------
+    rates : count_rate
+        Start, counts and rate of each bin.
+    """
+    keys, start = time_keys(times, bin_width, start)
+    n_bins = int(keys.max()) + 1 if len(keys) else 0
+    if stop is not None:
+        n_bins = max(-(-(stop - start) // bin_width), 0)
+    inside = (keys >= 0) & (keys < n_bins)
+    if n_bins > max_dense_bins:
+        bins, inverse = np.unique(keys[inside], return_inverse=True)
+        if mask is not None:
+            inverse = inverse[np.asarray(mask, dtype=bool)[inside]]
+        counts = np.bincount(inverse, minlength=len(bins))
+    else:
+        bins = np.arange(n_bins, dtype=np.int64)
+        if mask is not None:
+            inside &= np.asarray(mask, dtype=bool)
+        counts = np.bincount(keys[inside], minlength=n_bins)
+    return count_rate(
+        bin_start=start + bins * bin_width,
+        counts=counts,
+        rate=counts / (bin_width / 1000),
+    )
+
+
+def event_rates(times, bin_width=1000, masks=None):
+    """
+    Computes the count rates of all the events and of subsets of them on the same bins, e.g. the
+    valid events and the events in a region of interest.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        Times of all the events in milliseconds.
+    bin_width : int
+        Width of the bins in milliseconds. Default is 1000.
+    masks : dict
+        Mask of the events of each subset, e.g. {"valid": valid, "roi": roi}. Default is None.
+
+    Returns
+    -------
+    rates : dict
+        "count_rate" of all the events ("all") and of each subset.
+    """
+    start = time_keys(times, bin_width)[1]
+    stop = int(np.max(times)) + 1 if len(times) else start
+    rates = {"all": count_rates(times, bin_width, start=start, stop=stop)}
+    for name, mask in (masks or {}).items():
+        rates[name] = count_rates(times, bin_width, start=start, stop=stop, mask=mask)
+    return rates
+
+
+def sliding_rates(times, window=1000, step=None):
+    """
+    Computes the count rate of events in a window sliding over time.
+
+    The number of events in each window is the difference of the positions of its two ends in
+    the sorted times, found with a binary search, so overlapping windows cost no more than
+    adjacent ones.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        Times of the events in milliseconds.
+    window : int
+        Width of the window in milliseconds. Default is 1000.
+    step : int
+        Time between the starts of two windows in milliseconds. Default is None, in which case
+        it is a tenth of the window (at least 1 millisecond).
+
+    Returns
+    -------
+    rates : count_rate
+        Start, counts and rate of each window.
+    """
+    if step is None:
+        step = max(window // 10, 1)
+    times = np.sort(np.asarray(times).astype(np.int64))
+    if len(times) == 0:
+        return count_rate(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0))
+    window_start = np.arange(times[0], max(times[-1] - window + 1, times[0]) + 1, step)
+    counts = (
+        np.searchsorted(times, window_start + window, side="left")
+        - np.searchsorted(times, window_start, side="left")
+    )
+    return count_rate(bin_start=window_start, counts=counts, rate=counts / (window / 1000))
+
+
+if __name__ == "__main__":
+    from cupid_xray_decode import decode_xray
+
+    columns = decode_xray(argv[1])
+    bin_width = int(argv[2]) if len(argv) > 2 else 1000
+    rates = count_rates(columns.time[columns.sci], bin_width)
+    print(f"{len(rates.counts)} bins of {bin_width} ms, mean rate {rates.rate.mean():.3f} counts/s")
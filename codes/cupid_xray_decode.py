@@ -0,0 +1,161 @@
+from functools import lru_cache
+from pathlib import Path
+from sys import argv
+from typing import NamedTuple
+
+import numpy as np
+
+from lxi_data_read_funcs import gather_packets, packet_size
+
+# Full sync word of a valid packet, 0xFE6B2840
+xray_sync = 4268435520
+# Limit between a science packet which is not commanded, and one which is commanded (bit 30 of the
+# time tag)
+t_cut = 1073741824
+# Time tags from this one on are house-keeping packets (bit 31 of the time tag)
+t_hk = 2147483647
+
+
+class xray_columns(NamedTuple):
+    """
+    Columns of all the packets of an XRBR file, in the order of the file.
+    - sync: numpy.ndarray, sync word of each packet
+    - time: numpy.ndarray, time tag of each packet, with the telemetry type and commanded bits
+    - channels: numpy.ndarray, the four 16 bit words of each packet, one row per packet
+    - sci: numpy.ndarray, mask of the science packets (as read by "read_xray")
+    - commanded: numpy.ndarray, mask of the commanded science packets (as read by
+      "read_xray_commanded")
+    - hk: numpy.ndarray, mask of the house-keeping packets (as read by "read_xray_hk")
+    """
+    sync: np.ndarray
+    time: np.ndarray
+    channels: np.ndarray
+    sci: np.ndarray
+    commanded: np.ndarray
+    hk: np.ndarray
+
+
+def find_xray_starts(raw):
+    """
+    Finds the start of every packet of an XRBR file, in the same way as the Cupid readers.
+
+    A packet is unpacked at every occurrence of the first two bytes of the sync word (0xFE6B), so
+    the packets may overlap, and the full sync word is only checked afterwards. Occurrences less
+    than 16 bytes before the end of the data, which can not be unpacked, are skipped.
+
+    Parameters
+    ----------
+    raw : bytes
+        Raw binary data.
+
+    Returns
+    -------
+    starts : numpy.ndarray
+        Byte offsets of the packets.
+    """
+    data = np.frombuffer(raw, dtype=np.uint8)
+    starts = np.flatnonzero((data[:-1] == 0xfe) & (data[1:] == 0x6b))
+    return starts[starts + packet_size <= len(data)]
+
+
+def decode_xray_bytes(raw):
+    """
+    Decodes all the packets of raw XRBR data.
+
+    Parameters
+    ----------
+    raw : bytes
+        Raw binary data.
+
+    Returns
+    -------
+    columns : xray_columns
+        Columns and masks of the packets.
+    """
+    packets = gather_packets(raw, find_xray_starts(raw))
+    sync = packets["sync"].astype(np.int64)
+    time = packets["time"].astype(np.int64)
+    channels = packets["channels"].astype(np.uint16)
+    valid = sync == xray_sync
+    return xray_columns(
+        sync=sync,
+        time=time,
+        channels=channels,
+        sci=valid & (time < t_cut),
+        commanded=valid & (time > t_cut) & (time < t_hk),
+        hk=valid & (time >= t_hk),
+    )
+
+
+@lru_cache(maxsize=8)
+def _decode_xray_file(filename, size, mtime_ns):
+    with open(filename, 'rb') as file:
+        columns = decode_xray_bytes(file.read())
+    # The arrays are shared by all the callers of the cache, so they must not be modified
+    for column in columns:
+        column.flags.writeable = False
+    return columns
+
+
+def decode_xray(filename):
+    """
+    Decodes an XRBR file once, and returns the cached columns on the next calls.
+
+    The cache is keyed by the path, size and modification time of the file, so a file which
+    changed is decoded again. The returned arrays are read-only, since they are shared by all the
+    callers.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the XRBR file, including its path.
+
+    Returns
+    -------
+    columns : xray_columns
+        Columns and masks of the packets.
+    """
+    path = Path(filename).resolve()
+    stat = path.stat()
+    return _decode_xray_file(str(path), stat.st_size, stat.st_mtime_ns)
+
+
+def clear_xray_cache():
+    """
+    Empties the cache of "decode_xray", e.g. once all the products of a file are made, so that a
+    long batch does not keep the columns of the last files in memory.
+    """
+    _decode_xray_file.cache_clear()
+
+
+def xray_records(columns, mask=None):
+    """
+    Converts the packets of the columns to (sync, time, ch1, ch2, ch3, ch4) tuples, as unpacked
+    with ">II4H".
+
+    Parameters
+    ----------
+    columns : xray_columns
+        Columns of the packets.
+    mask : numpy.ndarray
+        Mask of the packets to convert. Default is None, in which case all the packets are
+        converted.
+
+    Returns
+    -------
+    records : list
+        One tuple per packet.
+    """
+    sync, time, channels = columns.sync, columns.time, columns.channels
+    if mask is not None:
+        sync, time, channels = sync[mask], time[mask], channels[mask]
+    return list(zip(sync.tolist(), time.tolist(), *channels.T.tolist()))
+
+
+if __name__ == "__main__":
+    columns = decode_xray(argv[1])
+    print(
+        f"{len(columns.time)} packets: {np.count_nonzero(columns.sci)} science, "
+        f"{np.count_nonzero(columns.commanded)} commanded, {np.count_nonzero(columns.hk)} "
+        f"house-keeping"
+    )
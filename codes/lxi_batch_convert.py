@@ -0,0 +1,345 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from sys import argv
+
+from lxi_data_read_funcs import check_format, decode_raw_file, decoder_version, stream_raw_file
+
+# Version of the manifest, to be increased whenever the content of the processed files changes,
+# so that all the files are converted again. Each entry also keeps the "decoder_version" it was
+# converted with, so that a change of the decoder alone converts the files again.
+manifest_version = 2
+
+
+def find_raw_files(raw_data_path="../data/raw_data/", pattern="**/*raw*.txt"):
+    """
+    Finds the raw binary files in a directory and its sub-directories.
+
+    Parameters
+    ----------
+    raw_data_path : str
+        Directory with the raw binary files. Default is "../data/raw_data/".
+    pattern : str
+        Glob pattern of the raw binary files, relative to "raw_data_path". Default is
+        "**/*raw*.txt".
+
+    Returns
+    -------
+    raw_files : list
+        Paths of the raw binary files, relative to "raw_data_path", sorted by name.
+    """
+    return sorted(
+        path.relative_to(raw_data_path) for path in Path(raw_data_path).glob(pattern)
+        if path.is_file()
+    )
+
+
+def file_hash(file_name, chunk_size=2**24):
+    """
+    Computes the BLAKE2 hash of a file, reading it one chunk at a time.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the file, including its path.
+    chunk_size : int
+        Number of bytes read at a time. Default is 16 MB.
+
+    Returns
+    -------
+    hash : str
+        Hexadecimal digest of the file.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_name, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_file_name):
+    """
+    Loads the manifest of the converted files.
+
+    Parameters
+    ----------
+    manifest_file_name : str
+        Name of the manifest file, including its path.
+
+    Returns
+    -------
+    manifest : dict
+        Entry of every converted file, with its path relative to the raw data directory as key.
+        Empty if the manifest does not exist or was written by another version.
+    """
+    if not Path(manifest_file_name).is_file():
+        return {}
+    with open(manifest_file_name) as file:
+        manifest = json.load(file)
+    if manifest.get("version") != manifest_version:
+        return {}
+    return manifest["files"]
+
+
+def save_manifest(manifest, manifest_file_name):
+    """
+    Saves the manifest of the converted files.
+
+    The manifest is first written to a temporary file which then replaces the manifest file, so
+    that an interrupted conversion never leaves a half-written manifest.
+
+    Parameters
+    ----------
+    manifest : dict
+        Entry of every converted file, as returned by "load_manifest".
+    manifest_file_name : str
+        Name of the manifest file, including its path.
+    """
+    temporary_file_name = f"{manifest_file_name}.tmp"
+    with open(temporary_file_name, "w") as file:
+        json.dump({"version": manifest_version, "files": manifest}, file, indent=1, sort_keys=True)
+    Path(temporary_file_name).replace(manifest_file_name)
+
+
+def is_unchanged(entry, input_file_name, settings):
+    """
+    Checks if a raw file is unchanged since it was converted.
+
+    The size and the modification time are compared first, the hash of the file is computed only
+    if the modification time changed (e.g. after the file was copied), so that checking an
+    unchanged directory does not read the files. The output files must also still exist, and
+    have been written by the current "decoder_version".
+
+    Parameters
+    ----------
+    entry : dict
+        Manifest entry of the file, or None if the file was never converted.
+    input_file_name : str
+        Name of the raw file, including its path.
+    settings : dict
+        Settings of the conversion, which must be the ones of the manifest entry.
+
+    Returns
+    -------
+    unchanged : bool
+        True if the file does not need to be converted again.
+    """
+    if entry is None or entry["settings"] != settings:
+        return False
+    if entry.get("decoder_version") != decoder_version:
+        return False
+    if not all(Path(output).is_file() for output in entry["outputs"]):
+        return False
+
+    stat = Path(input_file_name).stat()
+    if stat.st_size != entry["size"]:
+        return False
+    if stat.st_mtime_ns == entry["mtime_ns"]:
+        return True
+    if file_hash(input_file_name) == entry["hash"]:
+        # Same content, only remember the new modification time
+        entry["mtime_ns"] = stat.st_mtime_ns
+        return True
+    return False
+
+
+def convert_file(
+    raw_data_path,
+    raw_file,
+    save_file_path_sci,
+    save_file_path_hk,
+    number_of_decimals=6,
+    format="csv"
+    ):
+    """
+    Converts one raw file and returns its manifest entry.
+
+    The processed files are saved in the same sub-directory of the save paths as the raw file in
+    the raw data directory. The csv files are written with "stream_raw_file", so that the memory
+    used by each process of the pool does not depend on the size of the file.
+
+    Parameters
+    ----------
+    raw_data_path : str
+        Directory with the raw binary files.
+    raw_file : str
+        Path of the raw file, relative to "raw_data_path".
+    save_file_path_sci : str
+        Path to the output files of the science data.
+    save_file_path_hk : str
+        Path to the output files of the housekeeping data.
+    number_of_decimals : int
+        Number of decimals to save for the science data. Default is 6.
+    format : str
+        Format of the output files (see "file_formats"). Default is "csv".
+
+    Returns
+    -------
+    entry : dict
+        Manifest entry of the file.
+    """
+    raw_file = Path(raw_file)
+    in_file_path = str(Path(raw_data_path) / raw_file.parent) + "/"
+    save_file_path_sci = str(Path(save_file_path_sci) / raw_file.parent) + "/"
+    save_file_path_hk = str(Path(save_file_path_hk) / raw_file.parent) + "/"
+    save_file_name = check_format(format, f"{raw_file.stem}.csv")
+
+    # Get the size and modification time before reading the file, so that a file modified during
+    # the conversion is converted again the next time
+    input_file_name = in_file_path + raw_file.name
+    stat = Path(input_file_name).stat()
+    digest = file_hash(input_file_name)
+
+    if format == "csv":
+        n_sci, n_hk = stream_raw_file(
+            in_file_path=in_file_path,
+            in_file_name=raw_file.name,
+            save_file_path_sci=save_file_path_sci,
+            save_file_path_hk=save_file_path_hk,
+            save_file_name=save_file_name,
+            number_of_decimals=number_of_decimals,
+        )
+    else:
+        sci_columns, hk_data = decode_raw_file(
+            in_file_path=in_file_path,
+            in_file_name=raw_file.name,
+            save_file_path_sci=save_file_path_sci,
+            save_file_path_hk=save_file_path_hk,
+            save_file_name=save_file_name,
+            number_of_decimals=number_of_decimals,
+            format=format,
+        )
+        n_sci = len(sci_columns["timestamp"])
+        n_hk = len(hk_data["TimeStamp"])
+
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": digest,
+        "decoder_version": decoder_version,
+        "outputs": [save_file_path_sci + save_file_name, save_file_path_hk + save_file_name],
+        "n_sci": int(n_sci),
+        "n_hk": int(n_hk),
+    }
+
+
+def batch_convert(
+    raw_data_path="../data/raw_data/",
+    save_file_path_sci="../data/processed_data/sci/",
+    save_file_path_hk="../data/processed_data/hk/",
+    number_of_decimals=6,
+    format="csv",
+    pattern="**/*raw*.txt",
+    max_workers=None,
+    force=False
+    ):
+    """
+    Converts all the raw binary files of a directory, using a pool of processes.
+
+    A manifest with the size, modification time and hash of every converted file is kept in the
+    science output directory, and the files which did not change since their last conversion are
+    skipped. The manifest is saved after every converted file, so that an interrupted batch
+    continues where it stopped.
+
+    Parameters
+    ----------
+    raw_data_path : str
+        Directory with the raw binary files. Default is "../data/raw_data/".
+    save_file_path_sci : str
+        Path to the output files of the science data. Default is "../data/processed_data/sci/".
+    save_file_path_hk : str
+        Path to the output files of the housekeeping data. Default is
+        "../data/processed_data/hk/".
+    number_of_decimals : int
+        Number of decimals to save for the science data. Default is 6.
+    format : str
+        Format of the output files (see "file_formats"). Default is "csv".
+    pattern : str
+        Glob pattern of the raw binary files, relative to "raw_data_path". Default is
+        "**/*raw*.txt".
+    max_workers : int
+        Number of processes. Default is None, in which case all the cores are used.
+    force : bool
+        If True, all the files are converted, even if they did not change. Default is False.
+
+    Raises
+    ------
+    ValueError :
+        If the format is not supported.
+
+    Returns
+    -------
+    converted : list
+        Files which were converted.
+    skipped : list
+        Files which were skipped because they did not change.
+    failed : dict
+        Error message of every file which could not be converted.
+    """
+    check_format(format, "manifest.csv")
+
+    Path(save_file_path_sci).mkdir(parents=True, exist_ok=True)
+    manifest_file_name = str(Path(save_file_path_sci) / "manifest.json")
+    manifest = load_manifest(manifest_file_name)
+    settings = {"number_of_decimals": number_of_decimals, "format": format}
+
+    converted = []
+    skipped = []
+    failed = {}
+    to_convert = []
+    for raw_file in find_raw_files(raw_data_path, pattern):
+        key = raw_file.as_posix()
+        entry = manifest.get(key)
+        if not force and is_unchanged(entry, str(Path(raw_data_path) / raw_file), settings):
+            skipped.append(key)
+        else:
+            to_convert.append(raw_file)
+
+    # Start with the largest files, so that the processes finish at about the same time
+    to_convert.sort(key=lambda raw_file: (Path(raw_data_path) / raw_file).stat().st_size,
+                    reverse=True)
+
+    if to_convert:
+        max_workers = min(max_workers or os.cpu_count(), len(to_convert))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    convert_file, raw_data_path, raw_file, save_file_path_sci,
+                    save_file_path_hk, number_of_decimals, format
+                ): raw_file.as_posix()
+                for raw_file in to_convert
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as error:
+                    failed[key] = f"{type(error).__name__}: {error}"
+                    manifest.pop(key, None)
+                    continue
+                entry["settings"] = settings
+                manifest[key] = entry
+                converted.append(key)
+                save_manifest(manifest, manifest_file_name)
+
+    # Save the modification times updated by "is_unchanged"
+    save_manifest(manifest, manifest_file_name)
+
+    return sorted(converted), skipped, failed
+
+
+if __name__ == "__main__":
+    raw_data_path = argv[1] if len(argv) > 1 else "../data/raw_data/"
+
+    converted, skipped, failed = batch_convert(
+        raw_data_path=raw_data_path,
+        save_file_path_sci="../data/processed_data/sci/",
+        save_file_path_hk="../data/processed_data/hk/",
+        number_of_decimals=6,
+        format="csv",
+    )
+    print(f"{len(converted)} files converted, {len(skipped)} unchanged files skipped")
+    for key, error in failed.items():
+        print(f"Failed to convert {key}: {error}")
@@ -0,0 +1,282 @@
+import argparse
+import json
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+import lxi_data_read_funcs as lxi
+from lxi_synthetic_data import parse_size, write_synthetic_file
+
+
+def bench_decode_packets(input_file_name, output_path):
+    with open(input_file_name, 'rb') as file:
+        raw = file.read()
+    return len(lxi.decode_packets(raw))
+
+
+def bench_iter_raw_packets(input_file_name, output_path):
+    return sum(len(packets) for packets in lxi.iter_raw_packets(input_file_name))
+
+
+def bench_read_binary_data_sci(input_file_name, output_path):
+    metrics = lxi.DecodeMetrics()
+    lxi.read_binary_data_sci(
+        str(Path(input_file_name).parent) + "/", Path(input_file_name).name, output_path,
+        "sci.csv", metrics=metrics
+    )
+    return metrics.n_packets
+
+
+def bench_read_binary_data_hk(input_file_name, output_path):
+    metrics = lxi.DecodeMetrics()
+    lxi.read_binary_data_hk(
+        str(Path(input_file_name).parent) + "/", Path(input_file_name).name, output_path,
+        "hk.csv", metrics=metrics
+    )
+    return metrics.n_packets
+
+
+def bench_decode_raw_file(input_file_name, output_path):
+    metrics = lxi.DecodeMetrics()
+    lxi.decode_raw_file(
+        str(Path(input_file_name).parent) + "/", Path(input_file_name).name, output_path,
+        output_path, "decoded.csv", metrics=metrics
+    )
+    return metrics.n_packets
+
+
+def bench_stream_raw_file(input_file_name, output_path):
+    metrics = lxi.DecodeMetrics()
+    lxi.stream_raw_file(
+        str(Path(input_file_name).parent) + "/", Path(input_file_name).name, output_path,
+        output_path, "streamed.csv", metrics=metrics
+    )
+    return metrics.n_packets
+
+
+def bench_cupid(reader_name):
+    def bench(input_file_name, output_path):
+        # Imported here, since the Cupid module needs matplotlib and bitstring
+        import Cupid_Xray_Calibration as cupid
+        packets = []
+        getattr(cupid, reader_name)(input_file_name, packets)
+        return len(packets)
+    return bench
+
+
+def bench_cupid_decode_xray(input_file_name, output_path):
+    from cupid_xray_decode import decode_xray
+    return len(decode_xray(input_file_name).time)
+
+
+# Decoder paths which can be benchmarked, with a function which decodes the input file and returns
+# the number of packets
+decoder_paths = {
+    "decode_packets": bench_decode_packets,
+    "iter_raw_packets": bench_iter_raw_packets,
+    "read_binary_data_sci": bench_read_binary_data_sci,
+    "read_binary_data_hk": bench_read_binary_data_hk,
+    "decode_raw_file": bench_decode_raw_file,
+    "stream_raw_file": bench_stream_raw_file,
+    "cupid_decode_xray": bench_cupid_decode_xray,
+    "cupid_read_xray": bench_cupid("read_xray"),
+    "cupid_read_xray_all": bench_cupid("read_xray_all"),
+    "cupid_read_xray_commanded": bench_cupid("read_xray_commanded"),
+    "cupid_read_xray_hk": bench_cupid("read_xray_hk"),
+}
+
+
+def run_decoder(path, input_file_name, output_path):
+    """
+    Runs one decoder path and measures its run time and peak memory.
+
+    This is meant to be run in a fresh process, so that the peak resident memory of the process is
+    the one of the decoder.
+
+    Parameters
+    ----------
+    path : str
+        Name of the decoder path, one of the keys of "decoder_paths".
+    input_file_name : str
+        Name of the raw binary file, including its path.
+    output_path : str
+        Directory for the output files of the decoder.
+
+    Returns
+    -------
+    result : dict
+        Number of packets, run time in seconds and peak resident memory in bytes (None if it can
+        not be measured on this platform).
+    """
+    start = time.perf_counter()
+    n_packets = decoder_paths[path](input_file_name, output_path)
+    elapsed = time.perf_counter() - start
+    return {"packets": n_packets, "elapsed": elapsed, "peak_rss": peak_rss()}
+
+
+def peak_rss():
+    """
+    Returns the peak resident memory of the process in bytes, or None if it can not be measured.
+
+    On Linux, "VmHWM" is used instead of "ru_maxrss", since "ru_maxrss" is carried over from the
+    parent process to a new process and would include the memory of the benchmark harness.
+    """
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is not None:
+        # "ru_maxrss" is in kilobytes on Linux and in bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return None
+
+
+def benchmark(input_file_name, paths=None, repeats=3):
+    """
+    Benchmarks the decoder paths on a raw binary file.
+
+    Every run is done in a new process. The fastest of the repeated runs is kept, along with the
+    largest peak memory.
+
+    Parameters
+    ----------
+    input_file_name : str
+        Name of the raw binary file, including its path.
+    paths : list
+        Names of the decoder paths. Default is None, in which case all the paths of
+        "decoder_paths" are run.
+    repeats : int
+        Number of runs of each path. Default is 3.
+
+    Returns
+    -------
+    results : dict
+        For every path, the number of packets, the run time, the packets and bytes per second and
+        the peak resident memory, or the error if the path could not be run.
+    """
+    if paths is None:
+        paths = list(decoder_paths)
+    n_bytes = Path(input_file_name).stat().st_size
+
+    results = {}
+    with tempfile.TemporaryDirectory() as output_path:
+        for path in paths:
+            runs = []
+            try:
+                for _ in range(repeats):
+                    with ProcessPoolExecutor(
+                        max_workers=1, mp_context=get_context("spawn")
+                    ) as executor:
+                        runs.append(
+                            executor.submit(
+                                run_decoder, path, input_file_name, output_path + "/"
+                            ).result()
+                        )
+            except ImportError as error:
+                results[path] = {"error": f"{type(error).__name__}: {error}"}
+                continue
+
+            elapsed = min(run["elapsed"] for run in runs)
+            peak_rss_runs = [run["peak_rss"] for run in runs if run["peak_rss"] is not None]
+            results[path] = {
+                "packets": runs[0]["packets"],
+                "elapsed": elapsed,
+                "packets_per_second": runs[0]["packets"] / elapsed,
+                "bytes_per_second": n_bytes / elapsed,
+                "peak_rss": max(peak_rss_runs) if peak_rss_runs else None,
+            }
+    return results
+
+
+def find_regressions(results, baseline, threshold=0.2):
+    """
+    Compares the throughput of the decoder paths with a baseline.
+
+    Parameters
+    ----------
+    results : dict
+        Results of "benchmark".
+    baseline : dict
+        Results of "benchmark" for the baseline.
+    threshold : float
+        Largest allowed relative drop of the packets per second. Default is 0.2.
+
+    Returns
+    -------
+    regressions : dict
+        Relative drop of the packets per second of every path slower than allowed.
+    """
+    regressions = {}
+    for path, result in results.items():
+        if "error" in result or "error" in baseline.get(path, {"error": None}):
+            continue
+        drop = 1 - result["packets_per_second"] / baseline[path]["packets_per_second"]
+        if drop > threshold:
+            regressions[path] = drop
+    return regressions
+
+
+def print_results(results, n_bytes):
+    print(f"Input: {n_bytes / 2**20:.1f} MB")
+    print(f"{'path':<28}{'packets':>12}{'seconds':>10}{'packets/s':>14}{'MB/s':>10}"
+          f"{'peak RSS MB':>13}")
+    for path, result in results.items():
+        if "error" in result:
+            print(f"{path:<28}skipped ({result['error']})")
+            continue
+        peak_rss = result["peak_rss"] / 2**20 if result["peak_rss"] else float("nan")
+        print(
+            f"{path:<28}{result['packets']:>12}{result['elapsed']:>10.3f}"
+            f"{result['packets_per_second']:>14.0f}{result['bytes_per_second'] / 2**20:>10.1f}"
+            f"{peak_rss:>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the decoders of the raw telemetry.")
+    parser.add_argument("--size", default="16MB",
+                        help="size of the synthetic input file, e.g. 1MB or 10GB")
+    parser.add_argument("--input", help="raw binary file to use instead of a synthetic one")
+    parser.add_argument("--paths", nargs="+", choices=list(decoder_paths),
+                        help="decoder paths to run, all by default")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--baseline", help="json file with the results of a previous run")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="save the results to the baseline file instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="largest allowed relative drop of the packets per second")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        input_file_name = args.input
+        if input_file_name is None:
+            input_file_name = str(Path(directory) / "synthetic_raw.txt")
+            write_synthetic_file(input_file_name, parse_size(args.size))
+        results = benchmark(input_file_name, paths=args.paths, repeats=args.repeats)
+        print_results(results, Path(input_file_name).stat().st_size)
+
+    if args.baseline is not None:
+        if args.save_baseline:
+            with open(args.baseline, "w") as file:
+                json.dump(results, file, indent=1)
+        else:
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+            regressions = find_regressions(results, baseline, threshold=args.threshold)
+            for path, drop in regressions.items():
+                print(f"Throughput regression of {path}: {drop:.0%} slower than the baseline")
+            if regressions:
+                sys.exit(1)
@@ -0,0 +1,88 @@
+import numpy as np
+
+# Fields of the 16 bit words of the packets, as (shift, width) in bits, the shift being the
+# position of the least significant bit of the field.
+
+# First word of a LEXI house-keeping packet
+lxi_hk_fields = {
+    "hk_id": (12, 4),    # which parameter the packet carries
+    "hk_data": (0, 12),  # value of the parameter
+}
+
+# Status word of a Cupid house-keeping packet
+cupid_status_fields = {
+    "hv_changed": (15, 1),  # 1 = MCP HV changed, 0 = 1 second HK packet
+    "hv_auto": (14, 1),     # if "hv_changed", 1 = auto MCP HV change, 0 = manual, else unused
+    "data": (0, 12),        # if "hv_changed", MCP HV, else thermistor data
+}
+
+
+def bitfield(words, shift, width):
+    """
+    Extracts one bit field of an array of words.
+
+    Parameters
+    ----------
+    words : numpy.ndarray
+        Array of unsigned integers.
+    shift : int
+        Position of the least significant bit of the field.
+    width : int
+        Number of bits of the field.
+
+    Returns
+    -------
+    field : numpy.ndarray
+        Values of the field, as int64.
+    """
+    return (np.asarray(words).astype(np.int64) >> shift) & ((1 << width) - 1)
+
+
+def decode_bitfields(words, fields):
+    """
+    Extracts several bit fields of an array of words, e.g. with "lxi_hk_fields" or
+    "cupid_status_fields".
+
+    Parameters
+    ----------
+    words : numpy.ndarray
+        Array of unsigned integers.
+    fields : dict
+        (shift, width) of each field.
+
+    Returns
+    -------
+    fields : dict
+        Values of each field, as int64 arrays.
+    """
+    words = np.asarray(words).astype(np.int64)
+    return {name: bitfield(words, shift, width) for name, (shift, width) in fields.items()}
+
+
+def cupid_status(status):
+    """
+    Decodes the status words of Cupid house-keeping packets.
+
+    The 12 bit data field holds the MCP HV when the packet was sent because the HV changed, and
+    the thermistor data otherwise. Both interpretations are returned, with nan where the other
+    one applies, just as the auto/manual flag which is only meaningful for HV changes.
+
+    Parameters
+    ----------
+    status : numpy.ndarray
+        Status words (first channel of the house-keeping packets).
+
+    Returns
+    -------
+    status : dict
+        Arrays "hv_changed" (0 or 1), "hv_auto" (0, 1 or nan), "hv_setting" and "temperature_data"
+        (12 bit values or nan).
+    """
+    fields = decode_bitfields(status, cupid_status_fields)
+    hv_changed = fields["hv_changed"].astype(bool)
+    return {
+        "hv_changed": fields["hv_changed"],
+        "hv_auto": np.where(hv_changed, fields["hv_auto"], np.nan),
+        "hv_setting": np.where(hv_changed, fields["data"], np.nan),
+        "temperature_data": np.where(hv_changed, np.nan, fields["data"]),
+    }
@@ -0,0 +1,164 @@
+from functools import cached_property
+
+import numpy as np
+
+# Every channel and "hk_value" is a 16 bit ADC code, so any conversion of the codes to engineering
+# units can be precomputed for all of the 65536 codes and applied with a single lookup.
+n_adc_codes = 2**16
+adc_codes = np.arange(n_adc_codes)
+
+# Number of values of "hk_id"
+n_hk_ids = 16
+
+
+class Calibration():
+    """
+    Lookup tables of the conversions of the ADC codes of one instrument unit to engineering units.
+
+    The tables are computed the first time they are needed, by applying the conversions to all the
+    ADC codes at once. A conversion of a whole array of codes is then a single gather from the
+    table, e.g. "calibration.channel_table[channels]", no matter how complex the conversion is.
+    The tables are computed in float64 by default, which gives the same values as applying the
+    conversions to the codes directly. Float32 tables take half the memory and bandwidth, at the
+    cost of about 7 significant digits.
+
+    Attributes
+    ----------
+    unit : str
+        Name of the instrument unit, e.g. "lxi" or "cupid".
+    version : int
+        Version of the calibration of the unit.
+    volts_per_count : float
+        Volts per increment of digitization of the science channels.
+    hk_conversions : dict
+        Function converting an array of ADC codes to the units of the parameter, for each
+        "hk_id", called with the codes and "volts_per_count" so that the house-keeping values and
+        the channels are converted with the same volts per count. The "hk_id" without a
+        conversion give nan.
+    dtype : numpy.dtype
+        Data type of the tables.
+    """
+    def __init__(self, unit, version, volts_per_count, hk_conversions=None, dtype=np.float64):
+        self.unit = unit
+        self.version = version
+        self.volts_per_count = volts_per_count
+        self.hk_conversions = dict(hk_conversions or {})
+        self.dtype = np.dtype(dtype)
+
+    def __repr__(self):
+        return (
+            f"Calibration({self.unit!r}, version={self.version}, "
+            f"volts_per_count={self.volts_per_count}, dtype={self.dtype.name})"
+        )
+
+    @cached_property
+    def channel_table(self):
+        return (adc_codes * self.volts_per_count).astype(self.dtype)
+
+    @cached_property
+    def hk_tables(self):
+        # One row per "hk_id", so that "hk_id" and "hk_value" index the table together
+        tables = np.full((n_hk_ids, n_adc_codes), np.nan, dtype=self.dtype)
+        for hk_id, conversion in self.hk_conversions.items():
+            tables[hk_id] = conversion(adc_codes, self.volts_per_count)
+        return tables
+
+    def astype(self, dtype):
+        """
+        Returns the same calibration with tables of another data type, e.g. np.float32.
+        """
+        return Calibration(
+            self.unit, self.version, self.volts_per_count, self.hk_conversions, dtype=dtype
+        )
+
+    def channel_volts(self, codes):
+        """
+        Converts the ADC codes of the science channels to volts.
+
+        Parameters
+        ----------
+        codes : numpy.ndarray
+            Array of ADC codes, of any shape.
+
+        Returns
+        -------
+        volts : numpy.ndarray
+            Array of volts, of the same shape as "codes".
+        """
+        # The gather is faster from codes in the native byte order
+        return self.channel_table.take(np.asarray(codes).astype(np.uint16))
+
+    def hk_units(self, hk_id, hk_value):
+        """
+        Converts the "hk_value" of house-keeping packets to the units of their "hk_id".
+
+        Parameters
+        ----------
+        hk_id : numpy.ndarray
+            "hk_id" of the packets.
+        hk_value : numpy.ndarray
+            "hk_value" of the packets.
+
+        Returns
+        -------
+        values : numpy.ndarray
+            Converted values, nan for the "hk_id" without a conversion.
+        """
+        return self.hk_tables[hk_id, hk_value]
+
+
+# Calibrations of all the units and versions, with (unit, version) as key
+calibrations = {}
+
+
+def register_calibration(calibration):
+    """
+    Adds a calibration to the registry, replacing the one of the same unit and version if any.
+
+    Parameters
+    ----------
+    calibration : Calibration
+        Calibration to add.
+
+    Returns
+    -------
+    calibration : Calibration
+        The added calibration.
+    """
+    calibrations[(calibration.unit, calibration.version)] = calibration
+    return calibration
+
+
+def get_calibration(unit="lxi", version=None):
+    """
+    Gets a calibration from the registry.
+
+    Parameters
+    ----------
+    unit : str
+        Name of the instrument unit. Default is "lxi".
+    version : int
+        Version of the calibration. Default is None, in which case the latest version of the unit
+        is used.
+
+    Raises
+    ------
+    KeyError :
+        If there is no such calibration in the registry.
+
+    Returns
+    -------
+    calibration : Calibration
+        Calibration of the unit.
+    """
+    if version is None:
+        versions = [key[1] for key in calibrations if key[0] == unit]
+        if not versions:
+            raise KeyError(f"No calibration registered for the unit {unit}.")
+        version = max(versions)
+    return calibrations[(unit, version)]
+
+
+# The Cupid X-ray calibration setup digitizes 4.5 V over the 16 bits of the ADC. The calibration
+# of LEXI, with its house-keeping conversions, is registered by "lxi_data_read_funcs".
+register_calibration(Calibration("cupid", 1, 4.5 / n_adc_codes))
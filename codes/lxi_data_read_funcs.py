@@ -1,9 +1,22 @@
-import csv
+import mmap
 import struct
+import time
+import tracemalloc
+from contextlib import nullcontext
 from pathlib import Path
 from typing import NamedTuple
 
 import numpy as np
+import pandas as pd
+
+from lxi_bitfields import bitfield, decode_bitfields, lxi_hk_fields
+from lxi_calibration import Calibration, get_calibration, register_calibration
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
 
 packet_format_sci = ">II4H"
 # signed lower case, unsigned upper case (b)
@@ -13,6 +26,21 @@ packet_format_hk =">II4H"
 sync = b'\xfe\x6b\x28\x40'
 volts_per_count = 0.000068817 # volts per increment of digitization
 
+# Version of the decoding of the raw files, to be increased whenever the decoded packets or the
+# written files change (e.g. version 2 decodes the last full packet of a file), so that the files
+# converted by an older decoder are converted again
+decoder_version = 2
+
+# Every packet (science or house-keeping) is 16 bytes long and starts with the sync word. The
+# structured dtype below is the NumPy equivalent of ">II4H" and is used to decode all the packets
+# of a file in one go.
+packet_size = 16
+packet_dtype = np.dtype([
+    ("sync", ">u4"),
+    ("time", ">u4"),
+    ("channels", ">u2", (4,)),
+])
+
 
 class sci_packet(NamedTuple):
     """
@@ -113,28 +141,888 @@ class hk_packet_cls(NamedTuple):
                 delta_lost_event_count=delta_lost_event_count,
             )
 
-def read_binary_data_sci(
-    in_file_path=None,
-    in_file_name=None,
-    save_file_path="../data/",
-    save_file_name="output_sci_2.csv",
-    number_of_decimals=6
-    ):
+
+def find_sync_offsets(raw):
+    """
+    Finds the byte offset of every sync word in the raw data.
+
+    Instead of comparing the raw data with the sync word one byte at a time, the raw data is viewed
+    as an array of bytes and the four bytes of the sync word are compared for all offsets at once.
+    Only the offsets at which a complete packet can be read are returned, including a packet which
+    ends exactly at the end of the raw data. (The byte-by-byte loop which was used before,
+    `while index < len(raw) - 16`, dropped that last packet.)
+
+    Parameters
+    ----------
+    raw : bytes
+        Raw binary data.
+
+    Returns
+    -------
+    offsets : numpy.ndarray
+        Sorted byte offsets of the sync words.
+    """
+    data = np.frombuffer(raw, dtype=np.uint8)
+    n_offsets = len(data) - packet_size + 1
+    if n_offsets <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Look for the first byte of the sync word, and then check the remaining three bytes only at
+    # those offsets.
+    offsets = np.flatnonzero(data[:n_offsets] == sync[0])
+    for ii in range(1, len(sync)):
+        offsets = offsets[data[offsets + ii] == sync[ii]]
+    return offsets.astype(np.int64, copy=False)
+
+
+def select_packet_offsets(offsets):
+    """
+    Selects the sync words that start a packet.
+
+    Once a packet is found, the 16 bytes of the packet are skipped, so a sync word which shows up
+    inside the data of the previous packet does not start a new packet. A sync word which is at
+    least 16 bytes away from the previous sync word always starts a packet, hence only the (rare)
+    sync words closer than that need to be checked one at a time.
+
+    Parameters
+    ----------
+    offsets : numpy.ndarray
+        Sorted byte offsets of the sync words, as returned by "find_sync_offsets".
+
+    Returns
+    -------
+    offsets : numpy.ndarray
+        Byte offsets of the packets.
+    """
+    keep = np.ones(len(offsets), dtype=bool)
+    previous = None
+    for idx in np.flatnonzero(np.diff(offsets) < packet_size) + 1:
+        if keep[idx - 1]:
+            previous = offsets[idx - 1]
+        if offsets[idx] - previous < packet_size:
+            keep[idx] = False
+    return offsets[keep]
+
+
+def gather_packets(raw, offsets):
+    """
+    Gathers the packets starting at the given byte offsets into a structured array.
+
+    The raw data is viewed as an array of 16-byte records for each of the 16 possible alignments,
+    so the packets are copied as whole records instead of byte by byte.
+
+    Parameters
+    ----------
+    raw : bytes
+        Raw binary data.
+    offsets : numpy.ndarray
+        Byte offsets of the packets.
+
+    Returns
+    -------
+    packets : numpy.ndarray
+        Structured array with "packet_dtype".
+    """
+    data = np.frombuffer(raw, dtype=np.uint8)
+    # The packets are copied as opaque 16-byte blocks, which is much faster than copying the
+    # fields of the structured array one at a time.
+    block_dtype = np.dtype(f"V{packet_size}")
+    alignments = offsets % packet_size
+    if len(offsets) and np.all(alignments == alignments[0]):
+        # Usual case of a clean stream, where all the packets have the same alignment
+        unique_alignments = alignments[:1]
+    else:
+        unique_alignments = np.unique(alignments)
+
+    packets = np.empty(len(offsets), dtype=block_dtype)
+    for alignment in unique_alignments:
+        n_records = (len(data) - alignment) // packet_size
+        records = data[alignment:alignment + n_records * packet_size].view(block_dtype)
+        if len(unique_alignments) == 1:
+            packets = records[offsets // packet_size]
+        else:
+            mask = alignments == alignment
+            packets[mask] = records[offsets[mask] // packet_size]
+    return packets.view(packet_dtype)
+
+
+class DecodeMetrics():
+    """
+    Throughput and framing health of a decode.
+
+    The metrics are updated with the packets of every decoded chunk (see "decode_packets",
+    "PacketFramer" and "iter_raw_packets"), and the elapsed time and peak memory are measured by
+    using the object as a context manager around the decode:
+
+        metrics = DecodeMetrics()
+        with metrics:
+            decode_raw_file(..., metrics=metrics)
+        print(metrics)
+
+    A resync event is a packet which does not start right after the previous packet (or at the
+    start of the data), i.e. the bytes before it had to be skipped to find the next sync word. The
+    timestamps are checked separately for the science and the house-keeping packets, since the
+    two kinds of packets are interleaved.
+
+    Attributes
+    ----------
+    n_bytes : int
+        Number of bytes decoded.
+    n_packets : int
+        Number of packets decoded.
+    n_hk : int
+        Number of house-keeping packets decoded.
+    resync_events : int
+        Number of times the sync was lost and found again.
+    timestamp_gaps : dict
+        Number of jumps forward in the timestamps larger than "gap_threshold", for the "sci" and
+        the "hk" packets.
+    backwards_jumps : dict
+        Number of jumps backwards in the timestamps, for the "sci" and the "hk" packets.
+    max_timestamp_gap : dict
+        Largest jump forward in the timestamps, for the "sci" and the "hk" packets.
+    gap_threshold : int
+        Smallest jump forward in the timestamps which counts as a gap. Default is 1500, i.e. one
+        and a half times the period of the house-keeping packets.
+    elapsed : float
+        Time spent inside the context manager, in seconds.
+    peak_rss : int
+        Peak resident memory of the process when leaving the context manager, in bytes, or None
+        if it can not be measured on this platform.
+    peak_memory : int
+        Peak memory allocated inside the context manager, in bytes. Only measured if
+        "track_memory" is True.
+    track_memory : bool
+        If True, the memory allocations are traced with "tracemalloc". Tracing slows down the
+        code which creates many Python objects (e.g. the csv writers) a lot, so the throughput is
+        only meaningful with the default of False.
+    """
+    def __init__(self, gap_threshold=1500, track_memory=False):
+        self.gap_threshold = gap_threshold
+        self.track_memory = track_memory
+        self.n_bytes = 0
+        self.n_packets = 0
+        self.n_hk = 0
+        self.resync_events = 0
+        self.timestamp_gaps = {"sci": 0, "hk": 0}
+        self.backwards_jumps = {"sci": 0, "hk": 0}
+        self.max_timestamp_gap = {"sci": 0, "hk": 0}
+        self.elapsed = 0.0
+        self.peak_rss = None
+        self.peak_memory = 0
+        self._next_offset = 0
+        self._last_timestamp = {"sci": None, "hk": None}
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.track_memory:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+            elif hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed += time.perf_counter() - self._start
+        if resource is not None:
+            # "ru_maxrss" is in kilobytes on Linux
+            self.peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        if self.track_memory:
+            self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+            if self._started_tracing:
+                tracemalloc.stop()
+        return False
+
+    def update(self, packets, offsets, n_bytes):
+        """
+        Updates the metrics with the packets decoded from the next bytes of the data.
+
+        Parameters
+        ----------
+        packets : numpy.ndarray
+            Structured array with "packet_dtype".
+        offsets : numpy.ndarray
+            Byte offsets of the packets from the start of the data (not of the chunk).
+        n_bytes : int
+            Number of new bytes.
+        """
+        self.n_bytes += n_bytes
+        self.n_packets += len(packets)
+        if len(packets) == 0:
+            return
+
+        previous_ends = np.concatenate(([self._next_offset], offsets[:-1] + packet_size))
+        self.resync_events += int(np.count_nonzero(offsets > previous_ends))
+        self._next_offset = int(offsets[-1]) + packet_size
+
+        time = packets["time"].astype(np.uint32)
+        is_hk = (time & 0x80000000).astype(bool)
+        self.n_hk += int(np.count_nonzero(is_hk))
+        timestamp = (time & 0x3fffffff).astype(np.int64)
+        for kind, mask in (("sci", ~is_hk), ("hk", is_hk)):
+            timestamps = timestamp[mask]
+            if len(timestamps) == 0:
+                continue
+            last_timestamp = self._last_timestamp[kind]
+            if last_timestamp is not None:
+                timestamps = np.concatenate(([last_timestamp], timestamps))
+            self._last_timestamp[kind] = int(timestamps[-1])
+            jumps = np.diff(timestamps)
+            if len(jumps) == 0:
+                continue
+            self.timestamp_gaps[kind] += int(np.count_nonzero(jumps > self.gap_threshold))
+            self.backwards_jumps[kind] += int(np.count_nonzero(jumps < 0))
+            self.max_timestamp_gap[kind] = max(self.max_timestamp_gap[kind], int(jumps.max()))
+
+    @property
+    def bytes_skipped(self):
+        """
+        Number of bytes which are not part of any packet.
+        """
+        return self.n_bytes - self.n_packets * packet_size
+
+    @property
+    def bytes_per_second(self):
+        return self.n_bytes / self.elapsed if self.elapsed else float("nan")
+
+    @property
+    def packets_per_second(self):
+        return self.n_packets / self.elapsed if self.elapsed else float("nan")
+
+    def as_dict(self):
+        """
+        Returns the metrics as a dictionary.
+        """
+        return {
+            "n_bytes": self.n_bytes,
+            "n_packets": self.n_packets,
+            "n_sci": self.n_packets - self.n_hk,
+            "n_hk": self.n_hk,
+            "elapsed": self.elapsed,
+            "bytes_per_second": self.bytes_per_second,
+            "packets_per_second": self.packets_per_second,
+            "bytes_skipped": self.bytes_skipped,
+            "resync_events": self.resync_events,
+            "timestamp_gaps": dict(self.timestamp_gaps),
+            "backwards_jumps": dict(self.backwards_jumps),
+            "max_timestamp_gap": dict(self.max_timestamp_gap),
+            "peak_rss": self.peak_rss,
+            "peak_memory": self.peak_memory,
+        }
+
+    def __str__(self):
+        return "\n".join((
+            f"Decoded {self.n_bytes} bytes, {self.n_packets} packets ({self.n_hk} house-keeping) "
+            f"in {self.elapsed:.3f} s",
+            f"Throughput: {self.bytes_per_second / 1e6:.1f} MB/s, "
+            f"{self.packets_per_second:.0f} packets/s",
+            f"Framing: {self.bytes_skipped} bytes skipped, {self.resync_events} resync events",
+            f"Timestamps: gaps {self.timestamp_gaps}, backwards jumps {self.backwards_jumps}",
+            f"Peak memory: {self.peak_rss / 2**20 if self.peak_rss else float('nan'):.1f} MB "
+            f"resident, {self.peak_memory / 2**20:.1f} MB traced",
+        ))
+
+
+def decode_packets(raw, metrics=None):
+    """
+    Decodes all the packets in the raw binary data.
+
+    This is the vectorized equivalent of scanning the raw data one byte at a time for the sync
+    word and unpacking each packet with "struct.unpack(packet_format_sci, ...)".
+
+    Parameters
+    ----------
+    raw : bytes
+        Raw binary data.
+    metrics : DecodeMetrics
+        Metrics to update with the decoded packets. Default is None.
+
+    Returns
+    -------
+    packets : numpy.ndarray
+        Structured array with "packet_dtype", one record per packet.
+    """
+    offsets = select_packet_offsets(find_sync_offsets(raw))
+    packets = gather_packets(raw, offsets)
+    if metrics is not None:
+        metrics.update(packets, offsets, len(raw))
+    return packets
+
+
+class PacketFramer():
+    """
+    Decodes the packets of a raw data stream which is read in chunks.
+
+    The chunks are passed to "feed" one after the other, and the packets that were completely
+    received are returned. The bytes at the end of a chunk which might still be the start of a
+    packet (at most 15 bytes) are kept, and decoded along with the next chunk. Hence a sync word
+    or a packet which straddles two chunks is decoded exactly as if the whole stream had been
+    read at once with "decode_packets".
+
+    Attributes
+    ----------
+    pending : bytes
+        Bytes at the end of the last chunk which are yet to be decoded.
+    position : int
+        Position of the first pending byte in the stream.
+    metrics : DecodeMetrics
+        Metrics updated with the packets of every chunk, or None.
+    offsets : numpy.ndarray
+        Byte offsets in the stream of the packets returned by the last call to "feed" or "flush".
+    """
+    def __init__(self, pending=b"", position=0, metrics=None):
+        self.pending = pending
+        self.position = position
+        self.metrics = metrics
+        self.offsets = np.empty(0, dtype=np.int64)
+
+    def feed(self, chunk):
+        """
+        Decodes the packets which are complete after adding the chunk to the pending bytes.
+
+        Parameters
+        ----------
+        chunk : bytes
+            Next chunk of the raw binary data.
+
+        Returns
+        -------
+        packets : numpy.ndarray
+            Structured array with "packet_dtype".
+        """
+        raw = b"".join((self.pending, chunk))
+        # Only the sync words of complete packets are looked at (see "find_sync_offsets"), the
+        # rest are decoded along with the next chunk.
+        offsets = select_packet_offsets(find_sync_offsets(raw))
+        packets = gather_packets(raw, offsets)
+        self.offsets = offsets + self.position
+        if self.metrics is not None:
+            self.metrics.update(packets, self.offsets, len(chunk))
+
+        next_start = max(len(raw) - packet_size + 1, 0)
+        if len(offsets):
+            next_start = max(next_start, int(offsets[-1]) + packet_size)
+        self.pending = raw[next_start:]
+        self.position += next_start
+        return packets
+
+    def flush(self):
+        """
+        Decodes the pending bytes at the end of the stream.
+
+        Returns
+        -------
+        packets : numpy.ndarray
+            Structured array with "packet_dtype".
+        """
+        # The pending bytes are too few for a packet, so they are only skipped
+        packets = decode_packets(self.pending)
+        self.offsets = np.empty(0, dtype=np.int64)
+        self.position += len(self.pending)
+        self.pending = b""
+        return packets
+
+
+def iter_raw_packets(input_file_name, chunk_size=2**24, metrics=None, index_builder=None):
+    """
+    Decodes the packets of a raw binary file one chunk at a time.
+
+    The file is memory-mapped and decoded in windows of "chunk_size" bytes, so the memory used
+    does not depend on the size of the file. The packets are the same as the ones returned by
+    "decode_packets" for the whole file.
+
+    Parameters
+    ----------
+    input_file_name : str
+        Name of the input file, including its path.
+    chunk_size : int
+        Number of bytes decoded at a time. Default is 16 MB.
+    metrics : DecodeMetrics
+        Metrics to update with the decoded packets. Default is None.
+    index_builder : PacketIndexBuilder
+        Builder of the time index of the file, updated with the decoded packets. Default is None.
+
+    Yields
+    ------
+    packets : numpy.ndarray
+        Structured array with "packet_dtype", for the packets in each window.
+    """
+    framer = PacketFramer(metrics=metrics)
+    with open(input_file_name, 'rb') as file:
+        # A file of size zero can not be memory-mapped
+        if Path(input_file_name).stat().st_size > 0:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as raw:
+                for start in range(0, len(raw), chunk_size):
+                    packets = framer.feed(raw[start:start + chunk_size])
+                    if index_builder is not None:
+                        index_builder.add(packets, framer.offsets)
+                    if len(packets):
+                        yield packets
+    packets = framer.flush()
+    if len(packets):
+        yield packets
+
+
+# Version of the time index files, to be increased whenever their content changes
+packet_index_version = 1
+
+
+class PacketIndexBuilder():
+    """
+    Builds the sparse time index of a raw binary file.
+
+    The packets are grouped in blocks of "block_packets" consecutive packets, and the byte offset
+    of the first packet of each block is saved along with the smallest and largest timestamp of the
+    block. Since decoding from the start of a packet gives the same packets as decoding the whole
+    file, the packets of a time range can then be decoded by reading only the blocks which overlap
+    the range (see "read_time_range"). The smallest and largest timestamps are used, instead of
+    the first and last ones, so that the index stays correct when the timestamps jump backwards.
+
+    Attributes
+    ----------
+    block_packets : int
+        Number of packets per block.
+    n_packets : int
+        Number of packets added so far.
+    """
+    def __init__(self, block_packets=4096):
+        self.block_packets = block_packets
+        self.n_packets = 0
+        self._offsets = []
+        self._t_min = []
+        self._t_max = []
+
+    def add(self, packets, offsets):
+        """
+        Adds the next packets of the file.
+
+        Parameters
+        ----------
+        packets : numpy.ndarray
+            Structured array with "packet_dtype".
+        offsets : numpy.ndarray
+            Byte offsets of the packets in the file.
+        """
+        if len(packets) == 0:
+            return
+        timestamp = (packets["time"] & 0x3fffffff).astype(np.int64)
+        packet_number = self.n_packets + np.arange(len(packets))
+        block_starts = np.flatnonzero(packet_number % self.block_packets == 0)
+        # The first packets complete the last block of the previous call, unless a new block
+        # starts with them
+        bounds = np.union1d([0], block_starts)
+        t_min = np.minimum.reduceat(timestamp, bounds)
+        t_max = np.maximum.reduceat(timestamp, bounds)
+        if bounds[0] not in block_starts:
+            self._t_min[-1] = min(self._t_min[-1], int(t_min[0]))
+            self._t_max[-1] = max(self._t_max[-1], int(t_max[0]))
+            t_min = t_min[1:]
+            t_max = t_max[1:]
+        self._offsets.extend(offsets[block_starts].tolist())
+        self._t_min.extend(t_min.tolist())
+        self._t_max.extend(t_max.tolist())
+        self.n_packets += len(packets)
+
+    def index(self, input_file_name):
+        """
+        Returns the index of the packets added so far.
+
+        Parameters
+        ----------
+        input_file_name : str
+            Name of the indexed file, including its path, whose size and modification time are
+            saved in the index.
+
+        Returns
+        -------
+        index : dict
+            Dictionary with the "offsets", "t_min" and "t_max" of the blocks, along with
+            "block_packets", "n_packets", "file_size", "file_mtime_ns" and "version".
+        """
+        stat = Path(input_file_name).stat()
+        return {
+            "offsets": np.array(self._offsets, dtype=np.int64),
+            "t_min": np.array(self._t_min, dtype=np.int64),
+            "t_max": np.array(self._t_max, dtype=np.int64),
+            "block_packets": self.block_packets,
+            "n_packets": self.n_packets,
+            "file_size": stat.st_size,
+            "file_mtime_ns": stat.st_mtime_ns,
+            "version": packet_index_version,
+        }
+
+
+def packet_index_file_name(input_file_name):
+    """
+    Name of the sidecar file with the time index of a raw binary file.
+    """
+    return f"{input_file_name}.index.npz"
+
+
+def build_packet_index(input_file_name, block_packets=4096, chunk_size=2**24):
+    """
+    Builds the time index of a raw binary file and saves it to its sidecar file.
+
+    Parameters
+    ----------
+    input_file_name : str
+        Name of the input file, including its path.
+    block_packets : int
+        Number of packets per block of the index. Default is 4096.
+    chunk_size : int
+        Number of bytes decoded at a time. Default is 16 MB.
+
+    Returns
+    -------
+    index : dict
+        Time index, as returned by "PacketIndexBuilder.index".
+    """
+    index_builder = PacketIndexBuilder(block_packets=block_packets)
+    for _ in iter_raw_packets(input_file_name, chunk_size=chunk_size, index_builder=index_builder):
+        pass
+    index = index_builder.index(input_file_name)
+    np.savez(packet_index_file_name(input_file_name), **index)
+    return index
+
+
+def load_packet_index(input_file_name, block_packets=4096):
+    """
+    Loads the time index of a raw binary file from its sidecar file.
+
+    The index is built if the sidecar file does not exist, or built again if the raw file
+    changed since the index was saved.
+
+    Parameters
+    ----------
+    input_file_name : str
+        Name of the input file, including its path.
+    block_packets : int
+        Number of packets per block, used if the index has to be built. Default is 4096.
+
+    Returns
+    -------
+    index : dict
+        Time index, as returned by "PacketIndexBuilder.index".
+    """
+    index_file_name = packet_index_file_name(input_file_name)
+    if Path(index_file_name).is_file():
+        with np.load(index_file_name) as data:
+            index = {key: data[key] for key in data.files}
+        stat = Path(input_file_name).stat()
+        if (
+            index["version"] == packet_index_version
+            and index["file_size"] == stat.st_size
+            and index["file_mtime_ns"] == stat.st_mtime_ns
+        ):
+            return index
+    return build_packet_index(input_file_name, block_packets=block_packets)
+
+
+def read_time_range(input_file_name, t_start, t_end, index=None):
+    """
+    Decodes only the packets of a raw binary file whose timestamp is in a time range.
+
+    The blocks of the time index which overlap the time range are read from the file and decoded,
+    so the time taken depends on the length of the time range and not on the size of the file.
+
+    Parameters
+    ----------
+    input_file_name : str
+        Name of the input file, including its path.
+    t_start : int
+        Start of the time range (timestamp in milliseconds, as in the packets), inclusive.
+    t_end : int
+        End of the time range, inclusive.
+    index : dict
+        Time index of the file. Default is None, in which case it is loaded with
+        "load_packet_index".
+
+    Returns
+    -------
+    packets : numpy.ndarray
+        Structured array with "packet_dtype", for the packets in the time range.
+    """
+    if index is None:
+        index = load_packet_index(input_file_name)
+
+    offsets = index["offsets"]
+    ends = np.append(offsets[1:], index["file_size"])
+    blocks = np.flatnonzero((index["t_max"] >= t_start) & (index["t_min"] <= t_end))
+
+    parts = []
+    with open(input_file_name, 'rb') as file:
+        # Consecutive blocks are read at once
+        for run in np.split(blocks, np.flatnonzero(np.diff(blocks) != 1) + 1):
+            if len(run) == 0:
+                continue
+            file.seek(offsets[run[0]])
+            packets = decode_packets(file.read(ends[run[-1]] - offsets[run[0]]))
+            timestamp = packets["time"] & 0x3fffffff
+            parts.append(packets[(timestamp >= t_start) & (timestamp <= t_end)])
+    if not parts:
+        return np.empty(0, dtype=packet_dtype)
+    return np.concatenate(parts).astype(packet_dtype, copy=False)
+
+
+def sci_packet_columns(packets, calibration=None):
+    """
+    Converts the decoded packets to the columns of the science data.
+
+    Parameters
+    ----------
+    packets : numpy.ndarray
+        Structured array with "packet_dtype".
+    calibration : Calibration
+        Calibration used to convert the channels to volts. Default is None, in which case the
+        latest calibration of "lxi" is used.
+
+    Returns
+    -------
+    columns : dict
+        Dictionary with the same keys as the fields of "sci_packet".
+    """
+    if calibration is None:
+        calibration = get_calibration("lxi")
+    time = packets["time"].astype(np.uint32)
+    # One row per channel, so that each channel is contiguous
+    volts = calibration.channel_volts(packets["channels"].T)
+    return {
+        "is_commanded": (time & 0x40000000).astype(bool),  # mask to test for commanded event type
+        "timestamp": time & 0x3fffffff,                     # mask for getting all timestamp bits
+        "channel1": volts[0],
+        "channel2": volts[1],
+        "channel3": volts[2],
+        "channel4": volts[3],
+    }
+
+
+def hk_packet_columns(packets):
+    """
+    Converts the decoded packets to the columns of the house-keeping data.
+
+    Parameters
+    ----------
+    packets : numpy.ndarray
+        Structured array with "packet_dtype".
+
+    Returns
+    -------
+    columns : dict
+        Dictionary with the same keys as the fields of "hk_packet_cls", along with "is_hk" which
+        tells which of the packets are house-keeping packets.
+    """
+    time = packets["time"].astype(np.uint32)
+    channels = packets["channels"].astype(np.int64)
+    fields = decode_bitfields(channels[:, 0], lxi_hk_fields)
+    hk_id = fields["hk_id"]
+    hk_value = fields["hk_data"]
+    # Up-shift 4 bits to get the hk_value, except for the command count and pin puller armed
+    shift = ~np.isin(hk_id, (10, 11))
+    hk_value[shift] = hk_value[shift] << 4
+    return {
+        "is_hk": (time & 0x80000000).astype(bool),
+        "timestamp": (time & 0x3fffffff).astype(np.int64),  # mask for getting all timestamp bits
+        "hk_id": hk_id,
+        "hk_value": hk_value,
+        "delta_event_count": channels[:, 1],
+        "delta_drop_event_count": channels[:, 2],
+        "delta_lost_event_count": channels[:, 3],
+    }
+
+
+class PacketTable():
+    """
+    Compact table of packets, stored as the structured array returned by "decode_packets".
+
+    Each packet takes the 16 bytes it has in the raw data, instead of the Python objects of a list
+    of "sci_packet" or "hk_packet_cls". The fields of the packet class given by "kind" can be
+    accessed as columns (e.g. "table.timestamp" or "table['channel1']"), which are computed from
+    the raw words when they are accessed. Indexing with an integer returns the packet as a
+    "sci_packet" or "hk_packet_cls", while slicing and indexing with a boolean mask or an array of
+    indices return a new "PacketTable". Iterating over the table yields the packets one at a time.
+
+    Attributes
+    ----------
+    packets : numpy.ndarray
+        Structured array with "packet_dtype".
+    kind : str
+        Type of the packets, "sci" or "hk".
+    calibration : Calibration
+        Calibration used to convert the channels to volts. Default is None, in which case the
+        latest calibration of "lxi" is used.
+    """
+    packet_classes = {"sci": sci_packet, "hk": hk_packet_cls}
+
+    def __init__(self, packets, kind="sci", calibration=None):
+        if kind not in self.packet_classes:
+            raise ValueError(f"The kind must be one of {', '.join(self.packet_classes)}, not {kind}.")
+        self.packets = packets
+        self.kind = kind
+        self.calibration = calibration
+
+    @property
+    def packet_class(self):
+        return self.packet_classes[self.kind]
+
+    @property
+    def fields(self):
+        return self.packet_class._fields
+
+    @property
+    def nbytes(self):
+        return self.packets.nbytes
+
+    def column(self, name):
+        """
+        Computes one column of the table.
+
+        Parameters
+        ----------
+        name : str
+            Name of a field of the packet class.
+
+        Raises
+        ------
+        KeyError :
+            If the packet class has no such field.
+
+        Returns
+        -------
+        column : numpy.ndarray
+            Values of the field for all the packets.
+        """
+        if name not in self.fields:
+            raise KeyError(name)
+
+        time = self.packets["time"].astype(np.uint32)
+        channels = self.packets["channels"]
+        if name == "timestamp":
+            timestamp = time & 0x3fffffff  # mask for getting all timestamp bits
+            return timestamp.astype(np.int64) if self.kind == "hk" else timestamp
+        if self.kind == "sci":
+            if name == "is_commanded":
+                return (time & 0x40000000).astype(bool)  # mask to test for commanded event type
+            # "channel1" to "channel4"
+            calibration = self.calibration or get_calibration("lxi")
+            return calibration.channel_volts(channels[:, int(name[-1]) - 1])
+        if name == "hk_id":
+            return bitfield(channels[:, 0], *lxi_hk_fields["hk_id"])
+        if name == "hk_value":
+            return hk_packet_columns(self.packets)["hk_value"]
+        # "delta_event_count", "delta_drop_event_count" and "delta_lost_event_count"
+        return channels[:, self.fields.index(name) - 2].astype(np.int64)
+
+    def columns(self):
+        """
+        Computes all the columns of the table.
+
+        Returns
+        -------
+        columns : dict
+            Dictionary with the fields of the packet class as keys.
+        """
+        if self.kind == "sci":
+            return sci_packet_columns(self.packets, calibration=self.calibration)
+        hk_columns = hk_packet_columns(self.packets)
+        return {field: hk_columns[field] for field in self.fields}
+
+    def __getattr__(self, name):
+        # Only called for the names which are not attributes, i.e. the columns
+        if name in self.packet_classes[self.__dict__.get("kind", "sci")]._fields:
+            return self.column(name)
+        raise AttributeError(f"'PacketTable' object has no attribute '{name}'")
+
+    def __len__(self):
+        return len(self.packets)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.column(key)
+        if isinstance(key, (int, np.integer)):
+            if not -len(self) <= key < len(self):
+                raise IndexError("PacketTable index out of range")
+            return next(iter(self[key:key + 1 or None]))
+        return PacketTable(self.packets[key], kind=self.kind, calibration=self.calibration)
+
+    def __iter__(self, batch_size=65536):
+        # The packets are converted to the packet class in batches, so that iterating is fast
+        # without ever converting the whole table to Python objects.
+        for start in range(0, len(self), batch_size):
+            columns = PacketTable(
+                self.packets[start:start + batch_size], self.kind, self.calibration
+            ).columns()
+            yield from map(
+                self.packet_class._make,
+                zip(*(columns[field].tolist() for field in self.fields)),
+            )
+
+    def __repr__(self):
+        return f"PacketTable(kind={self.kind!r}, packets={len(self)})"
+
+
+def iter_packet_batches(input_file_name, kind="sci", batch_size=65536, chunk_size=2**24):
+    """
+    Decodes the science or house-keeping packets of a raw binary file in batches of fixed size.
+
+    The file is decoded lazily with "iter_raw_packets", so the memory used depends only on
+    "batch_size" and "chunk_size", and not on the size of the file. This allows reductions over
+    the packets (histograms, count rates, limit checks...) without writing intermediate files.
+
+    Parameters
+    ----------
+    input_file_name : str
+        Name of the input file, including its path.
+    kind : str
+        Type of the packets, "sci" or "hk". Default is "sci".
+    batch_size : int
+        Number of packets per batch. Only the last batch can be smaller. Default is 65536.
+    chunk_size : int
+        Number of bytes decoded at a time. Default is 16 MB.
+
+    Raises
+    ------
+    ValueError :
+        If the kind is not "sci" or "hk".
+
+    Yields
+    ------
+    columns : dict
+        Columns of the batch, with the fields of "sci_packet" or "hk_packet_cls" as keys.
+    """
+    if kind not in ("sci", "hk"):
+        raise ValueError(f"The kind must be either sci or hk, not {kind}.")
+
+    def batch_columns(packets):
+        return PacketTable(packets, kind=kind).columns()
+
+    pending = np.empty(0, dtype=packet_dtype)
+    for packets in iter_raw_packets(input_file_name, chunk_size=chunk_size):
+        is_hk = (packets["time"] & 0x80000000).astype(bool)
+        packets = packets[is_hk if kind == "hk" else ~is_hk]
+        if len(pending):
+            packets = np.concatenate((pending, packets))
+        n_full = len(packets) - len(packets) % batch_size
+        for start in range(0, n_full, batch_size):
+            yield batch_columns(packets[start:start + batch_size])
+        pending = packets[n_full:]
+    if len(pending):
+        yield batch_columns(pending)
+
+
+def check_input_file(in_file_path, in_file_name, number_of_decimals):
     """
-    Reads science packet of the binary data from a file and saves it to a csv file.
+    Checks the name of the input file and the number of decimals to save.
 
     Parameters
     ----------
     in_file_path : str
-        Path to the input file. Default is None.
+        Path to the input file.
     in_file_name : str
-        Name of the input file. Default is None.
-    save_file_path : str
-        Path to the output file. Default is "../data/".
-    save_file_name : str
-        Name of the output file. Default is "output_sci.csv".
+        Name of the input file.
     number_of_decimals : int
-        Number of decimals to save. Default is 6.
+        Number of decimals to save.
 
     Raises
     ------
@@ -143,15 +1031,12 @@ def read_binary_data_sci(
     TypeError :
         If the name of the input file or input directory is not a string. Or if the number of
         deminals is not an integer.
+
     Returns
     -------
-        None.
+    input_file_name : str
+        Full name of the input file.
     """
-    if in_file_path is None:
-        in_file_path = "../data/raw_data/"
-    if in_file_name is None:
-        in_file_name = "2022_03_03_1030_LEXI_raw_2100_newMCP_copper.txt"
-
     # Check if the file exists, if does not exist raise an error
     if not Path(in_file_path + in_file_name).is_file():
         raise FileNotFoundError(
@@ -173,85 +1058,791 @@ def read_binary_data_sci(
             "The number of decimals to save must be an integer."
             )
 
-    input_file_name = in_file_path + in_file_name
+    return in_file_path + in_file_name
 
-    with open(input_file_name, 'rb') as file:
-        raw = file.read()
 
-    index = 0
-    packets = []
+sci_csv_columns = (
+    'TimeStamp',
+    'IsCommanded',
+    'Channel1',
+    'Channel2',
+    'Channel3',
+    'Channel4',
+)
 
-    while index < len(raw) - 16:
-        if raw[index:index + 4] == sync:
-            packets.append(sci_packet.from_bytes(raw[index:index + 16]))
-            index += 16
-            continue
+# NOTE: "Unused" is there twice, once each for hk_id 12 and 13.
+hk_csv_columns = (
+    "TimeStamp",
+    "HK_id",
+    "PinPullerTemp",
+    "OpticsTemp",
+    "LEXIbaseTemp",
+    "HVsupplyTemp",
+    "+5.2V_Imon",
+    "+10V_Imon",
+    "+3.3V_Imon",
+    "AnodeVoltMon",
+    "+28V_Imon",
+    "ADC_Ground",
+    "Cmd_count",
+    "Pinpuller_Armed",
+    "Unused",
+    "Unused",
+    "HVmcpAuto",
+    "HVmcpMan",
+    "DeltaEvntCount",
+    "DeltaDroppedCount",
+    "DeltaLostevntCount"
+)
 
-        index += 1
-
-    # Check if the save folder exists, if not then create it
-    if not Path(save_file_path).exists():
-        Path(save_file_path).mkdir(parents=True, exist_ok=True)
-
-    # Name of the output file
-    output_file_name = save_file_path + save_file_name
-
-    with open(output_file_name, 'w', newline='') as file:
-        dict_writer = csv.DictWriter(
-            file,
-            fieldnames=(
-                'TimeStamp',
-                'IsCommanded',
-                'Channel1',
-                'Channel2',
-                'Channel3',
-                'Channel4',
-            ),
-        )
-        dict_writer.writeheader()
-        dict_writer.writerows(
-            {
-                'TimeStamp': sci_packet.timestamp,
-                'IsCommanded': sci_packet.is_commanded,
-                'Channel1': np.round(sci_packet.channel1, decimals=number_of_decimals),
-                'Channel2': np.round(sci_packet.channel2, decimals=number_of_decimals),
-                'Channel3': np.round(sci_packet.channel3, decimals=number_of_decimals),
-                'Channel4': np.round(sci_packet.channel4, decimals=number_of_decimals),
-            }
-            for sci_packet in packets
-        )
+# Columns of the house-keeping table which get their values from "hk_value"
+hk_value_columns = (
+    "PinPullerTemp",
+    "OpticsTemp",
+    "LEXIbaseTemp",
+    "HVsupplyTemp",
+    "+5.2V_Imon",
+    "+10V_Imon",
+    "+3.3V_Imon",
+    "AnodeVoltMon",
+    "+28V_Imon",
+    "ADC_Ground",
+    "Cmd_count",
+    "Pinpuller_Armed",
+    "Unused",
+    "HVmcpAuto",
+    "HVmcpMan",
+)
 
-    return None
 
-def read_binary_data_hk(
-    in_file_path=None,
-    in_file_name=None,
-    save_file_path="../data/",
-    save_file_name="output_hk.csv",
-    number_of_decimals=6
-    ):
+def csv_lines(columns):
     """
-    Reads housekeeping packet of the binary data from a file and saves it to a csv file.
+    Formats the columns of a table as the lines of a csv file.
+
+    The values are written exactly as "csv.writer" writes them, i.e. with "repr" for the floats
+    (shortest representation which gives back the same float) and "str" for the integers and
+    booleans, and the lines end with "\\r\\n". Converting whole columns with "tolist" and joining
+    the strings is much faster than passing the rows one by one to "csv.writer".
 
     Parameters
     ----------
-    in_file_path : str
-        Path to the input file. Default is None.
-    in_file_name : str
-        Name of the input file. Default is None.
-    save_file_path : str
-        Path to the output file. Default is "../data/".
-    save_file_name : str
-        Name of the output file. Default is "output_hk.csv".
-    number_of_decimals : int
-        Number of decimals to save. Default is 6.
+    columns : list
+        Columns of the table, as numpy arrays of the same length.
+
+    Returns
+    -------
+    lines : str
+        Lines of the csv file, without the header.
+    """
+    if len(columns[0]) == 0:
+        return ""
+    rows = map(",".join, zip(*(csv_values(column) for column in columns)))
+    return "\r\n".join(rows) + "\r\n"
+
+
+def csv_values(column):
+    """
+    Formats the values of a column for "csv_lines".
+
+    The float columns have few distinct values (the channels are digitized on 16 bits, and the
+    house-keeping values are forward-filled), so only the distinct values are formatted.
+    """
+    if column.dtype.kind != "f":
+        return map(repr, column.tolist())
+    values, inverse = np.unique(column, return_inverse=True)
+    return np.array(list(map(repr, values.tolist())), dtype=object)[inverse.ravel()].tolist()
+
+
+def write_csv(columns, header, output_file_name, append=False, chunk_rows=2**18):
+    """
+    Saves a table to a csv file, writing "chunk_rows" rows at a time.
+
+    Parameters
+    ----------
+    columns : list
+        Columns of the table, as numpy arrays of the same length.
+    header : list
+        Names of the columns.
+    output_file_name : str
+        Name of the output file, including its path.
+    append : bool
+        If True, the rows are appended to an existing file, without the header. Default is False.
+    chunk_rows : int
+        Number of rows formatted and written at a time. Default is 262144.
+    """
+    n_rows = len(columns[0])
+    with open(output_file_name, 'a' if append else 'w', newline='') as file:
+        if not append:
+            file.write(",".join(header) + "\r\n")
+        for start in range(0, n_rows, chunk_rows):
+            file.write(csv_lines([column[start:start + chunk_rows] for column in columns]))
+
+
+def write_sci_csv(sci_columns, output_file_name, number_of_decimals=6, append=False):
+    """
+    Saves the science data to a csv file.
+
+    The channels are rounded to "number_of_decimals" decimals.
+
+    Parameters
+    ----------
+    sci_columns : dict
+        Science data, as returned by "sci_packet_columns".
+    output_file_name : str
+        Name of the output file, including its path.
+    number_of_decimals : int
+        Number of decimals to save. Default is 6.
+    append : bool
+        If True, the rows are appended to an existing file, without the header. Default is False.
+
+    Returns
+    -------
+        None.
+    """
+    columns = [sci_columns["timestamp"], sci_columns["is_commanded"]] + [
+        np.round(sci_columns[f"channel{ii}"], decimals=number_of_decimals) for ii in range(1, 5)
+    ]
+    write_csv(columns, sci_csv_columns, output_file_name, append=append)
+
+
+def hk_temperature(hk_value, volts_per_count=volts_per_count):
+    """
+    Converts the "hk_value" of a thermistor to temperature.
+
+    Parameters
+    ----------
+    hk_value : numpy.ndarray
+        ADC codes of the "hk_value" of the packets.
+    volts_per_count : float
+        Volts per increment of digitization, given by the calibration the conversion is
+        registered with (see "Calibration.hk_conversions"). Default is the one of LEXI.
+
+    Returns
+    -------
+    values : numpy.ndarray
+        Values of the parameter in degrees Celsius.
+    """
+    return (hk_value * volts_per_count - 2.73) * 100
+
+
+def hk_voltage(hk_value, volts_per_count=volts_per_count):
+    """
+    Converts the "hk_value" of a voltage or current monitor to volts.
+
+    Parameters
+    ----------
+    hk_value : numpy.ndarray
+        ADC codes of the "hk_value" of the packets.
+    volts_per_count : float
+        Volts per increment of digitization, given by the calibration the conversion is
+        registered with (see "Calibration.hk_conversions"). Default is the one of LEXI.
+
+    Returns
+    -------
+    values : numpy.ndarray
+        Values of the parameter in volts.
+    """
+    return hk_value * volts_per_count
+
+
+def hk_count(hk_value, volts_per_count=None):
+    """
+    Keeps the "hk_value" of a counter or flag as it is.
+
+    Parameters
+    ----------
+    hk_value : numpy.ndarray
+        ADC codes of the "hk_value" of the packets.
+    volts_per_count : float
+        Not used, only accepted so that all the conversions are called in the same way (see
+        "Calibration.hk_conversions").
+
+    Returns
+    -------
+    values : numpy.ndarray
+        Values of the parameter, as floats.
+    """
+    return hk_value.astype(float)
+
+
+# Column of the house-keeping table and conversion of "hk_value" to the units of that column, for
+# each "hk_id"
+hk_conversion_table = {
+    0: ("PinPullerTemp", hk_temperature),
+    1: ("OpticsTemp", hk_temperature),
+    2: ("LEXIbaseTemp", hk_temperature),
+    3: ("HVsupplyTemp", hk_temperature),
+    4: ("+5.2V_Imon", hk_voltage),
+    5: ("+10V_Imon", hk_voltage),
+    6: ("+3.3V_Imon", hk_voltage),
+    7: ("AnodeVoltMon", hk_voltage),
+    8: ("+28V_Imon", hk_voltage),
+    9: ("ADC_Ground", hk_voltage),
+    10: ("Cmd_count", hk_count),
+    11: ("Pinpuller_Armed", hk_count),
+    12: ("Unused", hk_count),
+    13: ("Unused", hk_count),
+    14: ("HVmcpAuto", hk_voltage),
+    15: ("HVmcpMan", hk_voltage),
+}
+
+# Calibration of LEXI, with lookup tables of the conversions above. Another unit or calibration
+# version can be used by registering its own "Calibration" (see "lxi_calibration"), the latest
+# version being the default.
+register_calibration(Calibration(
+    "lxi", 1, volts_per_count,
+    hk_conversions={hk_id: conversion for hk_id, (_, conversion) in hk_conversion_table.items()},
+))
+
+# Index in "hk_value_columns" of the column of each "hk_id"
+hk_id_columns = np.array([hk_value_columns.index(key) for key, _ in hk_conversion_table.values()])
+
+
+def forward_fill(values, initial=np.nan):
+    """
+    Replaces the nans in an array with the last value before them which is not a nan.
+
+    The index of the last valid value at every position is found with a running maximum over the
+    indices of the valid values, so the array is filled without a loop.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Array of floats.
+    initial : float
+        Value used for the nans before the first valid value. Default is nan.
+
+    Returns
+    -------
+    filled : numpy.ndarray
+        Array with the nans replaced.
+    """
+    index = np.where(np.isnan(values), -1, np.arange(len(values)))
+    np.maximum.accumulate(index, out=index)
+    return np.where(index >= 0, values[index], initial)
+
+
+def hk_table(hk_packets, previous_row=None, calibration=None):
+    """
+    Converts the house-keeping packets to the house-keeping table.
+
+    Each row of the table corresponds to one house-keeping packet. The value of the parameter
+    given by "hk_id" is converted to its units (see "hk_conversion_table") and stored in the
+    corresponding column. The columns which do not get a value from a packet are filled with the
+    last known value.
+
+    Parameters
+    ----------
+    hk_packets : numpy.ndarray
+        Structured array of house-keeping packets, with "packet_dtype".
+    previous_row : dict
+        Last row of the house-keeping table of the previous packets, used to fill the first rows
+        when the packets are decoded in chunks. Default is None.
+    calibration : Calibration
+        Calibration used to convert "hk_value". Default is None, in which case the latest
+        calibration of "lxi" is used.
+
+    Returns
+    -------
+    hk_table : dict
+        Dictionary of arrays, with the names in "hk_csv_columns" as keys.
+    """
+    if calibration is None:
+        calibration = get_calibration("lxi")
+    hk_columns = hk_packet_columns(hk_packets)
+    hk_id = hk_columns["hk_id"]
+
+    hk_data = {
+        "TimeStamp": hk_columns["timestamp"].astype(float),
+        "HK_id": hk_id.astype(float),
+    }
+
+    # Scatter the converted value of each packet into the column of its "hk_id"
+    values = np.full((len(hk_value_columns), len(hk_id)), np.nan)
+    values[hk_id_columns[hk_id], np.arange(len(hk_id))] = calibration.hk_units(
+        hk_id, hk_columns["hk_value"]
+    )
+    for key, column in zip(hk_value_columns, values):
+        hk_data[key] = column
+
+    # For observations which get their values from "HK_value", replace the nans at any index with
+    # the last value before it. This is to make sure that the file isn't inundated with nans.
+    for key in hk_value_columns:
+        initial = np.nan if previous_row is None else previous_row[key]
+        hk_data[key] = forward_fill(hk_data[key], initial=initial)
+
+    hk_data["DeltaEvntCount"] = hk_columns["delta_event_count"].astype(float)
+    hk_data["DeltaDroppedCount"] = hk_columns["delta_drop_event_count"].astype(float)
+    hk_data["DeltaLostevntCount"] = hk_columns["delta_lost_event_count"].astype(float)
+
+    return hk_data
+
+
+# House-keeping columns attached to the science data by default by "join_hk_state"
+hk_state_columns = ("HVmcpAuto", "HVmcpMan", "AnodeVoltMon", "LEXIbaseTemp")
+
+
+def join_hk_state(sci_columns, hk_data, columns=hk_state_columns):
+    """
+    Attaches the house-keeping state in effect at each science packet to the science data.
+
+    This is an as-of join on the timestamps: every science packet gets the values of the last
+    row of the house-keeping table with a timestamp smaller than or equal to its own. Since the
+    house-keeping table is forward filled, this is the last known value of each column. The rows
+    are found with a binary search of the sorted house-keeping timestamps, so the join takes
+    O(N log M) for N science and M house-keeping packets. Science packets before the first
+    house-keeping packet get nan.
+
+    Parameters
+    ----------
+    sci_columns : dict
+        Science data, as returned by "sci_packet_columns".
+    hk_data : dict
+        House-keeping table, as returned by "hk_table".
+    columns : tuple
+        Names of the house-keeping columns to attach. Default is "hk_state_columns".
+
+    Raises
+    ------
+    KeyError :
+        If one of the columns is not in the house-keeping table.
+
+    Returns
+    -------
+    sci_columns : dict
+        Copy of the science data, with one more array for each of the house-keeping columns.
+    """
+    hk_timestamp = np.asarray(hk_data["TimeStamp"])
+    order = None
+    if np.any(np.diff(hk_timestamp) < 0):
+        order = np.argsort(hk_timestamp, kind="stable")
+        hk_timestamp = hk_timestamp[order]
+
+    rows = np.searchsorted(hk_timestamp, sci_columns["timestamp"], side="right") - 1
+    before_first = rows < 0
+    rows[before_first] = 0
+
+    joined = dict(sci_columns)
+    for key in columns:
+        values = np.asarray(hk_data[key], dtype=float)
+        if order is not None:
+            values = values[order]
+        if len(values) == 0:
+            joined[key] = np.full(len(rows), np.nan)
+            continue
+        joined[key] = values[rows]
+        joined[key][before_first] = np.nan
+    return joined
+
+
+# Delta counters of the house-keeping packets, with the names of their columns
+hk_delta_columns = {
+    "delta_event_count": "DeltaEvntCount",
+    "delta_drop_event_count": "DeltaDroppedCount",
+    "delta_lost_event_count": "DeltaLostevntCount",
+}
+
+
+def hk_frame_table(hk_packets, frame="cycle", delta_stats=False, calibration=None):
+    """
+    Converts the house-keeping packets to a table with one row per frame.
+
+    Since every house-keeping packet carries only one of the parameters, the table of "hk_table"
+    repeats every value in about 16 rows. Here the packets are instead grouped in frames, either
+    one full cycle of "hk_id" (a new frame starts whenever "hk_id" does not increase) or a fixed
+    length of time, and each parameter is sampled once per frame (the last value in the frame,
+    or the last known value if the frame has none). The delta counters are summed over the frame,
+    and their minimum, maximum and mean per packet can be added.
+
+    Parameters
+    ----------
+    hk_packets : numpy.ndarray
+        Structured array of house-keeping packets, with "packet_dtype".
+    frame : str or int
+        Either "cycle", or the length of the frames in milliseconds (e.g. 1000 for one row per
+        second). Default is "cycle".
+    delta_stats : bool
+        If True, the columns "<counter>_min", "<counter>_max" and "<counter>_mean" are added for
+        each of the delta counters. Default is False.
+    calibration : Calibration
+        Calibration used to convert "hk_value". Default is None, in which case the latest
+        calibration of "lxi" is used.
+
+    Raises
+    ------
+    ValueError :
+        If the frame is neither "cycle" nor a positive number of milliseconds.
+
+    Returns
+    -------
+    hk_frames : dict
+        Dictionary of arrays with the keys "TimeStamp" (timestamp of the first packet of the
+        frame), "HK_packets" (number of packets in the frame), the names in "hk_value_columns"
+        and the names of the delta counters.
+    """
+    if calibration is None:
+        calibration = get_calibration("lxi")
+    hk_columns = hk_packet_columns(hk_packets)
+    hk_id = hk_columns["hk_id"]
+    timestamp = hk_columns["timestamp"]
+
+    if frame == "cycle":
+        frame_start = np.diff(hk_id) <= 0
+    elif not isinstance(frame, str) and frame > 0:
+        frame_start = np.diff(timestamp // frame) != 0
+    else:
+        raise ValueError(f"The frame must be either cycle or a number of milliseconds, not {frame}.")
+    frame_start = np.concatenate(([True], frame_start))[:len(hk_id)]
+    frame_number = np.cumsum(frame_start) - 1
+    starts = np.flatnonzero(frame_start)
+    n_frames = len(starts)
+    n_packets = np.diff(np.append(starts, len(hk_id)))
+
+    hk_frames = {
+        "TimeStamp": timestamp[starts].astype(float),
+        "HK_packets": n_packets.astype(float),
+    }
+    for key in hk_value_columns:
+        hk_frames[key] = np.full(n_frames, np.nan)
+
+    # Value of every packet in the units of its column
+    values = calibration.hk_units(hk_id, hk_columns["hk_value"])
+
+    for column, key in enumerate(hk_value_columns):
+        # "Unused" gets the values of two "hk_id"
+        mask = hk_id_columns[hk_id] == column
+        frames = frame_number[mask]
+        # The packets are in the order of the frames, so the last packet of a frame is the one
+        # before the next frame starts
+        last = np.append(np.diff(frames) != 0, True)[:len(frames)]
+        hk_frames[key][frames[last]] = values[mask][last]
+        hk_frames[key] = forward_fill(hk_frames[key])
+
+    for field, key in hk_delta_columns.items():
+        delta = hk_columns[field]
+        if n_frames == 0:
+            delta_sum = np.empty(0)
+        else:
+            delta_sum = np.add.reduceat(delta, starts)
+        hk_frames[key] = delta_sum.astype(float)
+        if delta_stats:
+            if n_frames == 0:
+                hk_frames[f"{key}_min"] = np.empty(0)
+                hk_frames[f"{key}_max"] = np.empty(0)
+            else:
+                hk_frames[f"{key}_min"] = np.minimum.reduceat(delta, starts).astype(float)
+                hk_frames[f"{key}_max"] = np.maximum.reduceat(delta, starts).astype(float)
+            hk_frames[f"{key}_mean"] = delta_sum / np.maximum(n_packets, 1)
+
+    return hk_frames
+
+
+def write_hk_csv(hk_data, output_file_name, append=False):
+    """
+    Saves the house-keeping table to a csv file.
+
+    Parameters
+    ----------
+    hk_data : dict
+        House-keeping table, as returned by "hk_table".
+    output_file_name : str
+        Name of the output file, including its path.
+    append : bool
+        If True, the rows are appended to an existing file, without the header. Default is False.
+
+    Returns
+    -------
+        None.
+    """
+    # "Unused" is twice in "hk_csv_columns", so the column is written twice
+    write_csv([hk_data[key] for key in hk_csv_columns], hk_csv_columns, output_file_name,
+              append=append)
+
+
+# Extensions of the supported output formats. Except for "csv", the tables are saved with typed
+# columns, and are compressed. "parquet" and "feather" need pyarrow, and "hdf5" needs PyTables.
+file_formats = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "feather": ".feather",
+    "hdf5": ".h5",
+}
+
+
+def sci_dataframe(sci_columns):
+    """
+    Converts the science data to a dataframe with typed columns.
+
+    Parameters
+    ----------
+    sci_columns : dict
+        Science data, as returned by "sci_packet_columns".
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Dataframe with the columns in "sci_csv_columns".
+    """
+    return pd.DataFrame({
+        'TimeStamp': sci_columns["timestamp"].astype(np.uint32),
+        'IsCommanded': sci_columns["is_commanded"].astype(bool),
+        'Channel1': sci_columns["channel1"].astype(np.float32),
+        'Channel2': sci_columns["channel2"].astype(np.float32),
+        'Channel3': sci_columns["channel3"].astype(np.float32),
+        'Channel4': sci_columns["channel4"].astype(np.float32),
+    })
+
+
+def hk_dataframe(hk_data):
+    """
+    Converts the house-keeping table to a dataframe with typed columns.
+
+    Parameters
+    ----------
+    hk_data : dict
+        House-keeping table, as returned by "hk_table".
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Dataframe with the columns in "hk_csv_columns", except that "Unused" is there only once.
+    """
+    df = pd.DataFrame({key: hk_data[key].astype(np.float32) for key in hk_data})
+    df["TimeStamp"] = hk_data["TimeStamp"].astype(np.uint32)
+    df["HK_id"] = hk_data["HK_id"].astype(np.uint8)
+    for key in ("DeltaEvntCount", "DeltaDroppedCount", "DeltaLostevntCount"):
+        df[key] = hk_data[key].astype(np.uint16)
+    return df
+
+
+def write_table(df, output_file_name, format="parquet"):
+    """
+    Saves a dataframe to a compressed columnar file.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dataframe to save.
+    output_file_name : str
+        Name of the output file, including its path.
+    format : str
+        One of "parquet", "feather" or "hdf5". Default is "parquet".
+
+    Raises
+    ------
+    ValueError :
+        If the format is not supported.
+
+    Returns
+    -------
+        None.
+    """
+    if format == "parquet":
+        df.to_parquet(output_file_name, compression="zstd", index=False)
+    elif format == "feather":
+        df.to_feather(output_file_name, compression="zstd")
+    elif format == "hdf5":
+        df.to_hdf(output_file_name, key="data", mode="w", complevel=5, complib="blosc:zstd")
+    else:
+        raise ValueError(
+            f"The format must be one of {', '.join(file_formats)}, not {format}."
+            )
+
+
+def read_table(file_name):
+    """
+    Reads a science or house-keeping file written by any of the readers of this module.
+
+    The format of the file is inferred from its extension (see "file_formats").
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the file, including its path.
+
+    Raises
+    ------
+    ValueError :
+        If the extension of the file is not one of the supported formats.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Dataframe with the data in the file.
+    """
+    suffix = Path(file_name).suffix
+    if suffix == file_formats["csv"]:
+        return pd.read_csv(file_name)
+    elif suffix == file_formats["parquet"]:
+        return pd.read_parquet(file_name)
+    elif suffix == file_formats["feather"]:
+        return pd.read_feather(file_name)
+    elif suffix in (file_formats["hdf5"], ".hdf5"):
+        return pd.read_hdf(file_name, key="data")
+    raise ValueError(
+        f"The extension of the file must be one of {', '.join(file_formats.values())}, not "
+        f"{suffix}."
+        )
+
+
+def check_format(format, save_file_name):
+    """
+    Checks the output format, and returns the name of the output file with the extension of
+    the format.
+
+    Parameters
+    ----------
+    format : str
+        Output format, one of the keys of "file_formats".
+    save_file_name : str
+        Name of the output file.
+
+    Raises
+    ------
+    ValueError :
+        If the format is not supported.
+
+    Returns
+    -------
+    save_file_name : str
+        Name of the output file, with the extension of the format.
+    """
+    if format not in file_formats:
+        raise ValueError(
+            f"The format must be one of {', '.join(file_formats)}, not {format}."
+            )
+    if format == "csv":
+        return save_file_name
+    return str(Path(save_file_name).with_suffix(file_formats[format]))
+
+
+def write_sci_data(sci_columns, output_file_name, number_of_decimals=6, format="csv"):
+    """
+    Saves the science data to a file in the given format.
+
+    Parameters
+    ----------
+    sci_columns : dict
+        Science data, as returned by "sci_packet_columns".
+    output_file_name : str
+        Name of the output file, including its path.
+    number_of_decimals : int
+        Number of decimals to save, only used for the "csv" format. Default is 6.
+    format : str
+        Output format, one of the keys of "file_formats". Default is "csv".
+
+    Returns
+    -------
+        None.
+    """
+    if format == "csv":
+        write_sci_csv(sci_columns, output_file_name, number_of_decimals=number_of_decimals)
+    else:
+        write_table(sci_dataframe(sci_columns), output_file_name, format=format)
+
+
+def write_hk_data(hk_data, output_file_name, format="csv"):
+    """
+    Saves the house-keeping table to a file in the given format.
+
+    Parameters
+    ----------
+    hk_data : dict
+        House-keeping table, as returned by "hk_table".
+    output_file_name : str
+        Name of the output file, including its path.
+    format : str
+        Output format, one of the keys of "file_formats". Default is "csv".
+
+    Returns
+    -------
+        None.
+    """
+    if format == "csv":
+        write_hk_csv(hk_data, output_file_name)
+    else:
+        write_table(hk_dataframe(hk_data), output_file_name, format=format)
+
+
+def hk_frame_file_name(output_file_name):
+    """
+    Returns the name of the file of the house-keeping frames, which is the name of the
+    house-keeping file with "_frames" added before the extension.
+    """
+    output_file_name = Path(output_file_name)
+    return str(output_file_name.with_name(
+        f"{output_file_name.stem}_frames{output_file_name.suffix}"
+    ))
+
+
+def write_hk_frames(hk_frames, output_file_name, format="csv"):
+    """
+    Saves the house-keeping frames to a file in the given format.
+
+    Parameters
+    ----------
+    hk_frames : dict
+        House-keeping frames, as returned by "hk_frame_table".
+    output_file_name : str
+        Name of the output file, including its path.
+    format : str
+        Output format, one of the keys of "file_formats". Default is "csv".
 
-    Raises
-    ------
-    FileNotFoundError :
-        If the input file does not exist.
-    TypeError :
-        If the name of the input file or input directory is not a string. Or if the number of deminals is not an integer.
+    Returns
+    -------
+        None.
+    """
+    if format == "csv":
+        write_csv(list(hk_frames.values()), list(hk_frames), output_file_name)
+    else:
+        df = pd.DataFrame(hk_frames)
+        df["TimeStamp"] = df["TimeStamp"].astype(np.uint32)
+        df["HK_packets"] = df["HK_packets"].astype(np.uint32)
+        write_table(df, output_file_name, format=format)
+
+
+def read_binary_data_sci(
+    in_file_path=None,
+    in_file_name=None,
+    save_file_path="../data/",
+    save_file_name="output_sci_2.csv",
+    number_of_decimals=6,
+    format="csv",
+    metrics=None
+    ):
+    """
+    Reads science packet of the binary data from a file and saves it to a csv file, or to a
+    columnar file depending on "format".
+
+    Parameters
+    ----------
+    in_file_path : str
+        Path to the input file. Default is None.
+    in_file_name : str
+        Name of the input file. Default is None.
+    save_file_path : str
+        Path to the output file. Default is "../data/".
+    save_file_name : str
+        Name of the output file. Default is "output_sci.csv".
+    number_of_decimals : int
+        Number of decimals to save. Default is 6.
+    format : str
+        Output format, one of "csv", "parquet", "feather" or "hdf5". For the formats other than
+        "csv", the extension of "save_file_name" is replaced by the one of the format. Default is
+        "csv".
+    metrics : DecodeMetrics
+        Metrics of the decode, updated with the packets and the time and memory spent.
+        Default is None.
+
+    Raises
+    ------
+    FileNotFoundError :
+        If the input file does not exist.
+    TypeError :
+        If the name of the input file or input directory is not a string. Or if the number of
+        deminals is not an integer.
+    ValueError :
+        If the format is not supported.
     Returns
     -------
         None.
@@ -261,228 +1852,361 @@ def read_binary_data_hk(
     if in_file_name is None:
         in_file_name = "2022_03_03_1030_LEXI_raw_2100_newMCP_copper.txt"
 
-    # Check if the file exists, if does not exist raise an error
-    if not Path(in_file_path + in_file_name).is_file():
-        raise FileNotFoundError(
-            "The file " + in_file_path + in_file_name + " does not exist."
-            )
-    # Check if the file name and folder name are strings, if not then raise an error
-    if not isinstance(in_file_name, str):
-        raise TypeError(
-            "The file name must be a string."
-            )
-    if not isinstance(in_file_path, str):
-        raise TypeError(
-            "The file path must be a string."
-            )
+    input_file_name = check_input_file(in_file_path, in_file_name, number_of_decimals)
+    save_file_name = check_format(format, save_file_name)
 
-    # Check the number of decimals to save
-    if not isinstance(number_of_decimals, int):
-        raise TypeError(
-            "The number of decimals to save must be an integer."
+    with metrics if metrics is not None else nullcontext():
+        with open(input_file_name, 'rb') as file:
+            raw = file.read()
+
+        packets = sci_packet_columns(decode_packets(raw, metrics=metrics))
+
+        # Check if the save folder exists, if not then create it
+        if not Path(save_file_path).exists():
+            Path(save_file_path).mkdir(parents=True, exist_ok=True)
+
+        # Name of the output file
+        output_file_name = save_file_path + save_file_name
+        write_sci_data(
+            packets, output_file_name, number_of_decimals=number_of_decimals, format=format
+        )
+
+    return None
+
+def read_binary_data_hk(
+    in_file_path=None,
+    in_file_name=None,
+    save_file_path="../data/",
+    save_file_name="output_hk.csv",
+    number_of_decimals=6,
+    format="csv",
+    metrics=None,
+    hk_frame=None,
+    delta_stats=False
+    ):
+    """
+    Reads housekeeping packet of the binary data from a file and saves it to a csv file, or to a
+    columnar file depending on "format".
+
+    Parameters
+    ----------
+    in_file_path : str
+        Path to the input file. Default is None.
+    in_file_name : str
+        Name of the input file. Default is None.
+    save_file_path : str
+        Path to the output file. Default is "../data/".
+    save_file_name : str
+        Name of the output file. Default is "output_hk.csv".
+    number_of_decimals : int
+        Number of decimals to save. Default is 6.
+    format : str
+        Output format, one of "csv", "parquet", "feather" or "hdf5". For the formats other than
+        "csv", the extension of "save_file_name" is replaced by the one of the format. Default is
+        "csv".
+    metrics : DecodeMetrics
+        Metrics of the decode, updated with the packets and the time and memory spent.
+        Default is None.
+    hk_frame : str or int
+        If given, the house-keeping frames (see "hk_frame_table") are also saved, with one row per
+        cycle of "hk_id" ("cycle") or per the given number of milliseconds, to a file with
+        "_frames" added to the name of the house-keeping file. Default is None.
+    delta_stats : bool
+        If True, the minimum, maximum and mean of the delta counters are added to the
+        house-keeping frames. Default is False.
+
+    Raises
+    ------
+    FileNotFoundError :
+        If the input file does not exist.
+    TypeError :
+        If the name of the input file or input directory is not a string. Or if the number of deminals is not an integer.
+    ValueError :
+        If the format is not supported.
+    Returns
+    -------
+    packets : PacketTable
+        House-keeping packets.
+    """
+    if in_file_path is None:
+        in_file_path = "../data/raw_data/"
+    if in_file_name is None:
+        in_file_name = "2022_03_03_1030_LEXI_raw_2100_newMCP_copper.txt"
+
+    input_file_name = check_input_file(in_file_path, in_file_name, number_of_decimals)
+    save_file_name = check_format(format, save_file_name)
+
+    with metrics if metrics is not None else nullcontext():
+        with open(input_file_name, 'rb') as file:
+            raw = file.read()
+
+        packets = decode_packets(raw, metrics=metrics)
+
+        # Get only those packets that have the HK data
+        hk_packets = packets[(packets["time"] & 0x80000000).astype(bool)]
+
+        # Check if the save folder exists, if not then create it
+        if not Path(save_file_path).exists():
+            Path(save_file_path).mkdir(parents=True, exist_ok=True)
+
+        # Name of the output file
+        output_file_name = save_file_path + save_file_name
+        write_hk_data(hk_table(hk_packets), output_file_name, format=format)
+        if hk_frame is not None:
+            write_hk_frames(
+                hk_frame_table(hk_packets, frame=hk_frame, delta_stats=delta_stats),
+                hk_frame_file_name(output_file_name), format=format
             )
 
-    input_file_name = in_file_path + in_file_name
+    return PacketTable(hk_packets, kind="hk")
 
-    with open(input_file_name, 'rb') as file:
-        raw = file.read()
 
-    index = 0
-    packets = []
+def decode_raw_file(
+    in_file_path=None,
+    in_file_name=None,
+    save_file_path_sci="../data/processed_data/sci/",
+    save_file_path_hk="../data/processed_data/hk/",
+    save_file_name=None,
+    number_of_decimals=6,
+    format="csv",
+    metrics=None,
+    hk_frame=None,
+    delta_stats=False,
+    hk_state=None,
+    calibration=None
+    ):
+    """
+    Reads the binary data from a file and saves the science and the housekeeping packets to their
+    respective csv (or columnar, depending on "format") files.
+
+    Unlike calling "read_binary_data_sci" and "read_binary_data_hk" one after the other, the file
+    is read and scanned for the packets only once. The packets are then split into the science and
+    the housekeeping packets using the telemetry type bit (bit 31 of the time tag).
 
-    while index < len(raw) - 16:
-        if raw[index:index + 4] == sync:
-            packets.append(hk_packet_cls.from_bytes(raw[index:index + 16]))
-            index += 16
-            continue
+    Parameters
+    ----------
+    in_file_path : str
+        Path to the input file. Default is None.
+    in_file_name : str
+        Name of the input file. Default is None.
+    save_file_path_sci : str
+        Path to the output file of the science data. Default is "../data/processed_data/sci/".
+    save_file_path_hk : str
+        Path to the output file of the housekeeping data. Default is
+        "../data/processed_data/hk/".
+    save_file_name : str
+        Name of the output files. Default is None, in which case the name of the input file with
+        a ".csv" extension is used.
+    number_of_decimals : int
+        Number of decimals to save for the science data. Default is 6.
+    format : str
+        Output format, one of "csv", "parquet", "feather" or "hdf5". Default is "csv".
+    metrics : DecodeMetrics
+        Metrics of the decode, updated with the packets and the time and memory spent.
+        Default is None.
+    hk_frame : str or int
+        If given, the house-keeping frames (see "hk_frame_table") are also saved, with one row per
+        cycle of "hk_id" ("cycle") or per the given number of milliseconds, to a file with
+        "_frames" added to the name of the house-keeping file. Default is None.
+    delta_stats : bool
+        If True, the minimum, maximum and mean of the delta counters are added to the
+        house-keeping frames. Default is False.
+    hk_state : tuple
+        Names of house-keeping columns (e.g. "hk_state_columns") to attach to the returned
+        science data with "join_hk_state". The saved files are not changed. Default is None.
+    calibration : Calibration
+        Calibration used to convert the ADC codes (see "lxi_calibration"). Default is None, in
+        which case the latest calibration of "lxi" is used.
 
-        index += 1
-
-    # Get only those packets that have the HK data
-    hk_idx = []
-    for idx, hk_packet in enumerate(packets):
-        if hk_packet is not None:
-            hk_idx.append(idx)
-
-    TimeStamp = np.full(len(hk_idx), np.nan)
-    HK_id = np.full(len(hk_idx), np.nan)
-    PinPullerTemp = np.full(len(hk_idx), np.nan)
-    OpticsTemp = np.full(len(hk_idx), np.nan)
-    LEXIbaseTemp = np.full(len(hk_idx), np.nan)
-    HVsupplyTemp = np.full(len(hk_idx), np.nan)
-    V_Imon_5_2 = np.full(len(hk_idx), np.nan)
-    V_Imon_10 = np.full(len(hk_idx), np.nan)
-    V_Imon_3_3 = np.full(len(hk_idx), np.nan)
-    AnodeVoltMon = np.full(len(hk_idx), np.nan)
-    V_Imon_28 = np.full(len(hk_idx), np.nan)
-    ADC_Ground = np.full(len(hk_idx), np.nan)
-    Cmd_count = np.full(len(hk_idx), np.nan)
-    Pinpuller_Armed = np.full(len(hk_idx), np.nan)
-    Unused = np.full(len(hk_idx), np.nan)
-    Unused = np.full(len(hk_idx), np.nan)
-    HVmcpAuto = np.full(len(hk_idx), np.nan)
-    HVmcpMan = np.full(len(hk_idx), np.nan)
-    DeltaEvntCount = np.full(len(hk_idx), np.nan)
-    DeltaDroppedCount = np.full(len(hk_idx), np.nan)
-    DeltaLostevntCount = np.full(len(hk_idx), np.nan)
-
-    for ii,idx in enumerate(hk_idx):
-        hk_packet = packets[idx]
-        TimeStamp[ii] = hk_packet.timestamp
-        HK_id[ii] = hk_packet.hk_id
-        if hk_packet.hk_id==0:
-            PinPullerTemp[ii] = (hk_packet.hk_value * volts_per_count - 2.73) * 100
-        elif hk_packet.hk_id==1:
-            OpticsTemp[ii] = (hk_packet.hk_value * volts_per_count - 2.73) * 100
-        elif hk_packet.hk_id==2:
-            LEXIbaseTemp[ii] = (hk_packet.hk_value * volts_per_count - 2.73) * 100 
-        elif hk_packet.hk_id==3:
-            HVsupplyTemp[ii] = (hk_packet.hk_value * volts_per_count - 2.73) * 100 
-        elif hk_packet.hk_id==4:
-            V_Imon_5_2[ii] = hk_packet.hk_value * volts_per_count
-        elif hk_packet.hk_id==5:
-            V_Imon_10[ii] = hk_packet.hk_value * volts_per_count
-        elif hk_packet.hk_id==6:
-            V_Imon_3_3[ii] = hk_packet.hk_value * volts_per_count
-        elif hk_packet.hk_id==7:
-            AnodeVoltMon[ii] = hk_packet.hk_value * volts_per_count
-        elif hk_packet.hk_id==8:
-            V_Imon_28[ii] = hk_packet.hk_value * volts_per_count
-        elif hk_packet.hk_id==9:
-            ADC_Ground[ii] = hk_packet.hk_value * volts_per_count
-        elif hk_packet.hk_id==10:
-            Cmd_count[ii] = hk_packet.hk_value
-        elif hk_packet.hk_id==11:
-            Pinpuller_Armed[ii] = hk_packet.hk_value
-        elif hk_packet.hk_id==12:
-            Unused[ii] = hk_packet.hk_value
-        elif hk_packet.hk_id==13:
-            Unused[ii] = hk_packet.hk_value
-        elif hk_packet.hk_id==14:
-            HVmcpAuto[ii] = hk_packet.hk_value * volts_per_count
-        elif hk_packet.hk_id==15:
-            HVmcpMan[ii] = hk_packet.hk_value * volts_per_count
-
-        DeltaEvntCount[ii] = hk_packet.delta_event_count
-        DeltaDroppedCount[ii] = hk_packet.delta_drop_event_count
-        DeltaLostevntCount[ii] = hk_packet.delta_lost_event_count
-
-    # For observations which get their values from "HK_value", go through the whole array and
-    # replace the nans at any index with the value from the previous index.
-    # This is to make sure that the file isn't inundated with nans.
-    for ii in range(1,len(TimeStamp)):
-        if np.isnan(PinPullerTemp[ii]):
-            PinPullerTemp[ii] = PinPullerTemp[ii-1]
-        if np.isnan(OpticsTemp[ii]):
-            OpticsTemp[ii] = OpticsTemp[ii-1]
-        if np.isnan(LEXIbaseTemp[ii]):
-            LEXIbaseTemp[ii] = LEXIbaseTemp[ii-1]
-        if np.isnan(HVsupplyTemp[ii]):
-            HVsupplyTemp[ii] = HVsupplyTemp[ii-1]
-        if np.isnan(V_Imon_5_2[ii]):
-            V_Imon_5_2[ii] = V_Imon_5_2[ii-1]
-        if np.isnan(V_Imon_10[ii]):
-            V_Imon_10[ii] = V_Imon_10[ii-1]
-        if np.isnan(V_Imon_3_3[ii]):
-            V_Imon_3_3[ii] = V_Imon_3_3[ii-1]
-        if np.isnan(AnodeVoltMon[ii]):
-            AnodeVoltMon[ii] = AnodeVoltMon[ii-1]
-        if np.isnan(V_Imon_28[ii]):
-            V_Imon_28[ii] = V_Imon_28[ii-1]
-        if np.isnan(ADC_Ground[ii]):
-            ADC_Ground[ii] = ADC_Ground[ii-1]
-        if np.isnan(Cmd_count[ii]):
-            Cmd_count[ii] = Cmd_count[ii-1]
-        if np.isnan(Pinpuller_Armed[ii]):
-            Pinpuller_Armed[ii] = Pinpuller_Armed[ii-1]
-        if np.isnan(Unused[ii]):
-            Unused[ii] = Unused[ii-1]
-        if np.isnan(HVmcpAuto[ii]):
-            HVmcpAuto[ii] = HVmcpAuto[ii-1]
-        if np.isnan(HVmcpMan[ii]):
-            HVmcpMan[ii] = HVmcpMan[ii-1]
-
-    # Check if the save folder exists, if not then create it
-    if not Path(save_file_path).exists():
-        Path(save_file_path).mkdir(parents=True, exist_ok=True)
-
-    # Name of the output file
-    output_file_name = save_file_path + save_file_name
-    with open(output_file_name, 'w', newline='') as file:
-        dict_writer = csv.DictWriter(
-            file,
-            fieldnames=(
-                "TimeStamp",
-                "HK_id",
-                "PinPullerTemp",
-                "OpticsTemp",
-                "LEXIbaseTemp",
-                "HVsupplyTemp",
-                "+5.2V_Imon",
-                "+10V_Imon",
-                "+3.3V_Imon",
-                "AnodeVoltMon",
-                "+28V_Imon",
-                "ADC_Ground",
-                "Cmd_count",
-                "Pinpuller_Armed",
-                "Unused",
-                "Unused",
-                "HVmcpAuto",
-                "HVmcpMan",
-                "DeltaEvntCount",
-                "DeltaDroppedCount",
-                "DeltaLostevntCount"
-            ),
-        )
-        dict_writer.writeheader()
-
-        dict_writer.writerows(
-            {
-                "TimeStamp": TimeStamp[ii],
-                "HK_id": HK_id[ii],
-                "PinPullerTemp": PinPullerTemp[ii],
-                "OpticsTemp": OpticsTemp[ii],
-                "LEXIbaseTemp": LEXIbaseTemp[ii],
-                "HVsupplyTemp": HVsupplyTemp[ii],
-                "+5.2V_Imon": V_Imon_5_2[ii],
-                "+10V_Imon": V_Imon_10[ii],
-                "+3.3V_Imon": V_Imon_3_3[ii],
-                "AnodeVoltMon": AnodeVoltMon[ii],
-                "+28V_Imon": V_Imon_28[ii],
-                "ADC_Ground": ADC_Ground[ii],
-                "Cmd_count": Cmd_count[ii],
-                "Pinpuller_Armed": Pinpuller_Armed[ii],
-                "Unused": Unused[ii],
-                "Unused": Unused[ii],
-                "HVmcpAuto": HVmcpAuto[ii],
-                "HVmcpMan": HVmcpMan[ii],
-                "DeltaEvntCount": DeltaEvntCount[ii],
-                "DeltaDroppedCount": DeltaDroppedCount[ii],
-                "DeltaLostevntCount": DeltaLostevntCount[ii],
-            }
-            for ii in range(len(hk_idx))
+    Raises
+    ------
+    FileNotFoundError :
+        If the input file does not exist.
+    TypeError :
+        If the name of the input file or input directory is not a string. Or if the number of
+        deminals is not an integer.
+    ValueError :
+        If the format is not supported.
+
+    Returns
+    -------
+    sci_columns : dict
+        Science data, as returned by "sci_packet_columns", along with the house-keeping columns
+        given by "hk_state".
+    hk_table : dict
+        House-keeping table, as returned by "hk_table".
+    """
+    if in_file_path is None:
+        in_file_path = "../data/raw_data/"
+    if in_file_name is None:
+        in_file_name = "2022_03_03_1030_LEXI_raw_2100_newMCP_copper.txt"
+    if save_file_name is None:
+        save_file_name = f"{Path(in_file_name).stem}.csv"
+
+    input_file_name = check_input_file(in_file_path, in_file_name, number_of_decimals)
+    save_file_name = check_format(format, save_file_name)
+
+    with metrics if metrics is not None else nullcontext():
+        with open(input_file_name, 'rb') as file:
+            raw = file.read()
+
+        packets = decode_packets(raw, metrics=metrics)
+
+        # Split the packets based on the telemetry type
+        is_hk = (packets["time"] & 0x80000000).astype(bool)
+        sci_columns = sci_packet_columns(packets[~is_hk], calibration=calibration)
+        hk_data = hk_table(packets[is_hk], calibration=calibration)
+
+        # Check if the save folders exist, if not then create them
+        for save_file_path in (save_file_path_sci, save_file_path_hk):
+            if not Path(save_file_path).exists():
+                Path(save_file_path).mkdir(parents=True, exist_ok=True)
+
+        write_sci_data(
+            sci_columns, save_file_path_sci + save_file_name,
+            number_of_decimals=number_of_decimals, format=format
         )
-    return packets
+        write_hk_data(hk_data, save_file_path_hk + save_file_name, format=format)
+        if hk_frame is not None:
+            write_hk_frames(
+                hk_frame_table(
+                    packets[is_hk], frame=hk_frame, delta_stats=delta_stats,
+                    calibration=calibration
+                ),
+                hk_frame_file_name(save_file_path_hk + save_file_name), format=format
+            )
 
-in_file_path = "../data/raw_data/2022_04_21_1431_LEXI_HK_unit_1_mcp_unit_1_eBox_1987_hk_/"
-in_file_name = "2022_04_21_1431_LEXI_raw_LEXI_unit_1_mcp_unit_1_eBox-1987.txt"
-save_file_path_sci = "../data/processed_data/sci/"
-save_file_path_hk = "../data/processed_data/hk/"
-save_file_name = f"{in_file_name[:-4]}_qudsi.csv"
-
-pkts = read_binary_data_hk(
-    in_file_path=in_file_path,
-    in_file_name=in_file_name,
-    save_file_path=save_file_path_hk,
-    save_file_name=save_file_name,
-    number_of_decimals=6
-    )
+        if hk_state is not None:
+            sci_columns = join_hk_state(sci_columns, hk_data, columns=hk_state)
+
+    return sci_columns, hk_data
+
+
+def stream_raw_file(
+    in_file_path=None,
+    in_file_name=None,
+    save_file_path_sci="../data/processed_data/sci/",
+    save_file_path_hk="../data/processed_data/hk/",
+    save_file_name=None,
+    number_of_decimals=6,
+    chunk_size=2**24,
+    metrics=None,
+    write_index=False,
+    calibration=None
+    ):
+    """
+    Same as "decode_raw_file", but for captures which are too large to be read into the memory.
+
+    The file is memory-mapped and decoded in windows of "chunk_size" bytes (see
+    "iter_raw_packets"), and the rows of each window are appended to the csv files as soon as
+    they are decoded. The csv files are identical to the ones written by "decode_raw_file", while
+    the memory used depends only on "chunk_size". Only the csv format is supported, since rows can
+    not be appended to the columnar formats.
+
+    Parameters
+    ----------
+    in_file_path : str
+        Path to the input file. Default is None.
+    in_file_name : str
+        Name of the input file. Default is None.
+    save_file_path_sci : str
+        Path to the output file of the science data. Default is "../data/processed_data/sci/".
+    save_file_path_hk : str
+        Path to the output file of the housekeeping data. Default is
+        "../data/processed_data/hk/".
+    save_file_name : str
+        Name of the output files. Default is None, in which case the name of the input file with
+        a ".csv" extension is used.
+    number_of_decimals : int
+        Number of decimals to save for the science data. Default is 6.
+    chunk_size : int
+        Number of bytes decoded at a time. Default is 16 MB.
+    metrics : DecodeMetrics
+        Metrics of the decode, updated with the packets and the time and memory spent.
+        Default is None.
+    write_index : bool
+        If True, the time index of the input file is saved to its sidecar file (see
+        "build_packet_index") while decoding. Default is False.
+    calibration : Calibration
+        Calibration used to convert the ADC codes (see "lxi_calibration"). Default is None, in
+        which case the latest calibration of "lxi" is used.
 
-pkts = read_binary_data_sci(
-    in_file_path=in_file_path,
-    in_file_name=in_file_name,
-    save_file_path=save_file_path_sci,
-    save_file_name=save_file_name,
-    number_of_decimals=6
-    )
\ No newline at end of file
+    Raises
+    ------
+    FileNotFoundError :
+        If the input file does not exist.
+    TypeError :
+        If the name of the input file or input directory is not a string. Or if the number of
+        deminals is not an integer.
+
+    Returns
+    -------
+    n_sci : int
+        Number of science packets.
+    n_hk : int
+        Number of house-keeping packets.
+    """
+    if in_file_path is None:
+        in_file_path = "../data/raw_data/"
+    if in_file_name is None:
+        in_file_name = "2022_03_03_1030_LEXI_raw_2100_newMCP_copper.txt"
+    if save_file_name is None:
+        save_file_name = f"{Path(in_file_name).stem}.csv"
+
+    input_file_name = check_input_file(in_file_path, in_file_name, number_of_decimals)
+
+    with metrics if metrics is not None else nullcontext():
+        # Check if the save folders exist, if not then create them
+        for save_file_path in (save_file_path_sci, save_file_path_hk):
+            if not Path(save_file_path).exists():
+                Path(save_file_path).mkdir(parents=True, exist_ok=True)
+
+        # Write the headers, so that the rows of each chunk can be appended
+        empty = decode_packets(b"")
+        write_sci_csv(sci_packet_columns(empty), save_file_path_sci + save_file_name)
+        write_hk_csv(hk_table(empty), save_file_path_hk + save_file_name)
+
+        n_sci = 0
+        n_hk = 0
+        previous_row = None
+        index_builder = PacketIndexBuilder() if write_index else None
+        for packets in iter_raw_packets(
+            input_file_name, chunk_size=chunk_size, metrics=metrics, index_builder=index_builder
+        ):
+            is_hk = (packets["time"] & 0x80000000).astype(bool)
+            write_sci_csv(
+                sci_packet_columns(packets[~is_hk], calibration=calibration),
+                save_file_path_sci + save_file_name,
+                number_of_decimals=number_of_decimals, append=True
+            )
+            if is_hk.any():
+                hk_data = hk_table(
+                    packets[is_hk], previous_row=previous_row, calibration=calibration
+                )
+                write_hk_csv(hk_data, save_file_path_hk + save_file_name, append=True)
+                previous_row = {key: hk_data[key][-1] for key in hk_value_columns}
+            n_sci += np.count_nonzero(~is_hk)
+            n_hk += np.count_nonzero(is_hk)
+
+        if index_builder is not None:
+            np.savez(
+                packet_index_file_name(input_file_name), **index_builder.index(input_file_name)
+            )
+
+    return n_sci, n_hk
+
+if __name__ == "__main__":
+    in_file_path = "../data/raw_data/2022_04_21_1431_LEXI_HK_unit_1_mcp_unit_1_eBox_1987_hk_/"
+    in_file_name = "2022_04_21_1431_LEXI_raw_LEXI_unit_1_mcp_unit_1_eBox-1987.txt"
+    save_file_path_sci = "../data/processed_data/sci/"
+    save_file_path_hk = "../data/processed_data/hk/"
+    save_file_name = f"{in_file_name[:-4]}_qudsi.csv"
+
+    sci_data, hk_data = decode_raw_file(
+        in_file_path=in_file_path,
+        in_file_name=in_file_name,
+        save_file_path_sci=save_file_path_sci,
+        save_file_path_hk=save_file_path_hk,
+        save_file_name=save_file_name,
+        number_of_decimals=6
+        )
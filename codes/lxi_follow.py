@@ -0,0 +1,325 @@
+import base64
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from sys import argv
+
+import numpy as np
+
+from lxi_data_read_funcs import (
+    PacketFramer,
+    check_input_file,
+    decode_packets,
+    hk_table,
+    hk_value_columns,
+    sci_packet_columns,
+    write_hk_csv,
+    write_sci_csv,
+)
+
+# Number of bytes at the start of the input file whose hash identifies it, with its inode, so
+# that a file replaced by another one of the same or a larger size is decoded from the start
+head_block = 4096
+
+
+class FollowDecoder():
+    """
+    Decodes a raw binary file which is still being written, e.g. by the GSE during bench tests.
+
+    Every call to "update" decodes only the bytes appended to the file since the last call, and
+    appends the new packets to the science and house-keeping csv files. The byte offset up to
+    which the file has been consumed, the bytes of a packet which was only partially written and
+    the last row of the house-keeping table are saved to a state file after every chunk appended
+    to the csv files, so that following the file can be stopped and resumed later without
+    decoding it again from the start. The state also keeps the sizes of the csv files, which are
+    truncated to them when the state is loaded, so that rows appended after the last saved state
+    (e.g. if the process was killed) are not written twice.
+
+    Attributes
+    ----------
+    input_file_name : str
+        Name of the input file, including its path.
+    sci_file_name : str
+        Name of the output file of the science data, including its path.
+    hk_file_name : str
+        Name of the output file of the house-keeping data, including its path.
+    state_file_name : str
+        Name of the state file, including its path.
+    number_of_decimals : int
+        Number of decimals to save for the science data.
+    chunk_size : int
+        Maximum number of bytes read from the input file at a time.
+    framer : PacketFramer
+        Framer holding the byte offset and the pending bytes of the input file.
+    previous_row : dict
+        Last row of the house-keeping table, or None if no house-keeping packet was decoded yet.
+    n_sci : int
+        Number of science packets decoded so far.
+    n_hk : int
+        Number of house-keeping packets decoded so far.
+    source : dict
+        Identity of the input file (see "source_identity").
+    """
+    def __init__(
+        self,
+        in_file_path=None,
+        in_file_name=None,
+        save_file_path_sci="../data/processed_data/sci/",
+        save_file_path_hk="../data/processed_data/hk/",
+        save_file_name=None,
+        number_of_decimals=6,
+        chunk_size=2**24,
+    ):
+        if in_file_path is None:
+            in_file_path = "../data/raw_data/"
+        if in_file_name is None:
+            in_file_name = "2022_03_03_1030_LEXI_raw_2100_newMCP_copper.txt"
+        if save_file_name is None:
+            save_file_name = f"{Path(in_file_name).stem}.csv"
+
+        self.input_file_name = check_input_file(in_file_path, in_file_name, number_of_decimals)
+
+        # Check if the save folders exist, if not then create them
+        for save_file_path in (save_file_path_sci, save_file_path_hk):
+            if not Path(save_file_path).exists():
+                Path(save_file_path).mkdir(parents=True, exist_ok=True)
+
+        self.sci_file_name = save_file_path_sci + save_file_name
+        self.hk_file_name = save_file_path_hk + save_file_name
+        self.state_file_name = f"{save_file_path_sci}{Path(save_file_name).stem}_follow.json"
+        self.number_of_decimals = number_of_decimals
+        self.chunk_size = chunk_size
+
+        if not self.load_state():
+            self.reset()
+
+    def reset(self):
+        """
+        Starts decoding the input file from the beginning, overwriting the output files.
+        """
+        self.framer = PacketFramer()
+        self.previous_row = None
+        self.n_sci = 0
+        self.n_hk = 0
+        self.source = self.source_identity(0)
+
+        # Write the headers, so that the rows of each update can be appended
+        empty = decode_packets(b"")
+        write_sci_csv(sci_packet_columns(empty), self.sci_file_name)
+        write_hk_csv(hk_table(empty), self.hk_file_name)
+        self.save_state()
+
+    def source_identity(self, head_size=None):
+        """
+        Identifies the input file by its inode and the hash of its first bytes.
+
+        Parameters
+        ----------
+        head_size : int
+            Number of bytes hashed. Default is None, in which case it is the number of bytes
+            consumed, up to "head_block".
+
+        Returns
+        -------
+        source : dict
+            Inode, number of bytes hashed and hash of the input file.
+        """
+        if head_size is None:
+            head_size = min(self.consumed, head_block)
+        stat = Path(self.input_file_name).stat()
+        with open(self.input_file_name, 'rb') as file:
+            head = file.read(head_size)
+        return {
+            "inode": stat.st_ino,
+            "head_size": len(head),
+            "head_hash": hashlib.blake2b(head, digest_size=16).hexdigest(),
+        }
+
+    def is_same_source(self, source):
+        """
+        Checks if the input file is still the one identified by "source", and was not replaced.
+        """
+        return source is not None and self.source_identity(source["head_size"]) == source
+
+    def load_state(self):
+        """
+        Loads the state saved by a previous run.
+
+        The state is only used if it belongs to the same input file, which was not replaced, and
+        the output files still exist with at least the sizes saved in the state. The output files
+        are truncated to these sizes.
+
+        Returns
+        -------
+        loaded : bool
+            True if the state was loaded.
+        """
+        if not (
+            Path(self.state_file_name).is_file()
+            and Path(self.sci_file_name).is_file()
+            and Path(self.hk_file_name).is_file()
+        ):
+            return False
+
+        with open(self.state_file_name) as file:
+            state = json.load(file)
+        if state["input_file_name"] != str(Path(self.input_file_name).resolve()):
+            return False
+        if not self.is_same_source(state.get("source")):
+            return False
+        output_sizes = ((self.sci_file_name, state["sci_size"]), (self.hk_file_name, state["hk_size"]))
+        if any(Path(name).stat().st_size < size for name, size in output_sizes):
+            return False
+        # Drop the rows appended after the state was saved
+        for name, size in output_sizes:
+            os.truncate(name, size)
+
+        self.framer = PacketFramer(
+            pending=base64.b64decode(state["pending"]), position=state["position"]
+        )
+        self.previous_row = state["previous_row"]
+        self.n_sci = state["n_sci"]
+        self.n_hk = state["n_hk"]
+        self.source = state["source"]
+        return True
+
+    def save_state(self):
+        """
+        Saves the state to the state file.
+
+        The state is first written to a temporary file which then replaces the state file, so
+        that the state file is never left half-written.
+        """
+        state = {
+            "input_file_name": str(Path(self.input_file_name).resolve()),
+            "position": self.framer.position,
+            "pending": base64.b64encode(self.framer.pending).decode("ascii"),
+            "previous_row": self.previous_row,
+            "n_sci": self.n_sci,
+            "n_hk": self.n_hk,
+            "source": self.source,
+            "sci_size": Path(self.sci_file_name).stat().st_size,
+            "hk_size": Path(self.hk_file_name).stat().st_size,
+        }
+        temporary_file_name = f"{self.state_file_name}.tmp"
+        with open(temporary_file_name, "w") as file:
+            json.dump(state, file)
+        Path(temporary_file_name).replace(self.state_file_name)
+
+    @property
+    def consumed(self):
+        """
+        Number of bytes of the input file which have been read.
+        """
+        return self.framer.position + len(self.framer.pending)
+
+    def update(self):
+        """
+        Decodes the bytes appended to the input file since the last update.
+
+        If the input file got smaller than the number of bytes already read, or its inode or
+        first bytes changed, it is assumed to have been replaced and is decoded again from the
+        beginning. The state is saved after every chunk.
+
+        Returns
+        -------
+        n_sci : int
+            Number of new science packets.
+        n_hk : int
+            Number of new house-keeping packets.
+        """
+        size = Path(self.input_file_name).stat().st_size
+        if size < self.consumed or not self.is_same_source(self.source):
+            self.reset()
+        if size == self.consumed:
+            return 0, 0
+
+        n_sci = 0
+        n_hk = 0
+        with open(self.input_file_name, 'rb') as file:
+            file.seek(self.consumed)
+            # Only read up to the size found above, anything written in the meantime is left for
+            # the next update
+            remaining = size - self.consumed
+            while remaining > 0:
+                chunk = file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                packets = self.framer.feed(chunk)
+                is_hk = (packets["time"] & 0x80000000).astype(bool)
+                write_sci_csv(
+                    sci_packet_columns(packets[~is_hk]), self.sci_file_name,
+                    number_of_decimals=self.number_of_decimals, append=True
+                )
+                if is_hk.any():
+                    hk_data = hk_table(packets[is_hk], previous_row=self.previous_row)
+                    write_hk_csv(hk_data, self.hk_file_name, append=True)
+                    self.previous_row = {
+                        key: float(hk_data[key][-1]) for key in hk_value_columns
+                    }
+                n_chunk_hk = int(np.count_nonzero(is_hk))
+                n_sci += len(packets) - n_chunk_hk
+                n_hk += n_chunk_hk
+                self.n_sci += len(packets) - n_chunk_hk
+                self.n_hk += n_chunk_hk
+                if self.source["head_size"] < head_block:
+                    self.source = self.source_identity()
+                self.save_state()
+
+        return n_sci, n_hk
+
+    def follow(self, poll_interval=1.0, idle_timeout=None):
+        """
+        Keeps decoding the input file as it grows.
+
+        Parameters
+        ----------
+        poll_interval : float
+            Number of seconds to wait between two updates. Default is 1 second.
+        idle_timeout : float
+            Stop after this many seconds without any new data. Default is None, in which case the
+            file is followed until the process is interrupted.
+
+        Returns
+        -------
+        n_sci : int
+            Total number of science packets.
+        n_hk : int
+            Total number of house-keeping packets.
+        """
+        last_update = time.monotonic()
+        try:
+            while True:
+                n_sci, n_hk = self.update()
+                if n_sci or n_hk:
+                    last_update = time.monotonic()
+                    print(f"{self.n_sci} science and {self.n_hk} house-keeping packets decoded")
+                elif idle_timeout is not None and time.monotonic() - last_update > idle_timeout:
+                    break
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+
+        return self.n_sci, self.n_hk
+
+
+if __name__ == "__main__":
+    if len(argv) > 1:
+        in_file_path = str(Path(argv[1]).parent) + "/"
+        in_file_name = Path(argv[1]).name
+    else:
+        in_file_path = "../data/raw_data/2022_04_21_1431_LEXI_HK_unit_1_mcp_unit_1_eBox_1987_hk_/"
+        in_file_name = "2022_04_21_1431_LEXI_raw_LEXI_unit_1_mcp_unit_1_eBox-1987.txt"
+
+    follow_decoder = FollowDecoder(
+        in_file_path=in_file_path,
+        in_file_name=in_file_name,
+        save_file_path_sci="../data/processed_data/sci/",
+        save_file_path_hk="../data/processed_data/hk/",
+        save_file_name=f"{in_file_name[:-4]}_qudsi.csv",
+        number_of_decimals=6,
+    )
+    follow_decoder.follow(poll_interval=1.0)
@@ -9,10 +9,19 @@ from pathlib import Path
 import importlib
 import numpy as np
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import sys
 import lxi_gui_plot_routines as plot_routines
 
+# The decoder module lives in the parent folder
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from lxi_data_read_funcs import read_table
+from mcp_event_pipeline import PositionPipeline
+
 importlib.reload(plot_routines)
 
+# The channels of the csv files are already in volts
+position_pipeline = PositionPipeline("lxi_ratio", stages=("ratio",))
+
 #sci_file_name = "/home/cephadrius/Desktop/git/lxi/data/processed_data/sci/2022_04_21_1431_LEXI_raw_LEXI_unit_1_mcp_unit_1_eBox-1987_qudsi.csv"
 #hk_file_name = "/home/cephadrius/Desktop/git/lxi/data/processed_data/hk/2022_04_21_1431_LEXI_raw_LEXI_unit_1_mcp_unit_1_eBox-1987_qudsi.csv"
 
@@ -26,6 +35,9 @@ def open_file_sci():
     file_val = filedialog.askopenfilename(initialdir="../../data/processed_data/sci/",
                                           title="Select file",
                                           filetypes=(("csv files", "*.csv"),
+                                                     ("parquet files", "*.parquet"),
+                                                     ("feather files", "*.feather"),
+                                                     ("hdf5 files", "*.h5"),
                                                      ("all files", "*.*"))
                                           )
     print(f"Loaded {file_val} in the data base")
@@ -41,6 +53,9 @@ def open_file_hk():
     file_val = filedialog.askopenfilename(initialdir="../../data/processed_data/hk/",
                                           title="Select file",
                                           filetypes=(("csv files", "*.csv"),
+                                                     ("parquet files", "*.parquet"),
+                                                     ("feather files", "*.feather"),
+                                                     ("hdf5 files", "*.h5"),
                                                      ("all files", "*.*"))
                                             )
     print(f"Loaded {file_val} in the data base")
@@ -52,8 +67,8 @@ def open_file_hk():
 
 def read_csv_sci(file_val=None, t_start=None, t_end=None):
     """
-    Reads a csv file and returns a pandas dataframe for the selected time range along with x and
-    y-coordinates.
+    Reads a csv (or a parquet, feather or hdf5) file and returns a pandas dataframe for the
+    selected time range along with x and y-coordinates.
 
     Parameters
     ----------
@@ -68,7 +83,7 @@ def read_csv_sci(file_val=None, t_start=None, t_end=None):
         file_val = sci_file_name
 
     global df_slice_sci
-    df = pd.read_csv(file_val)
+    df = read_table(file_val)
 
     # Replace index with timestamp
     df.set_index('TimeStamp', inplace=True)
@@ -85,8 +100,10 @@ def read_csv_sci(file_val=None, t_start=None, t_end=None):
     df_slice_sci = df.loc[t_start:t_end]
 
     # Find the x and y coordinates from the voltage values.
-    df_slice_sci['x_val'] = df_slice_sci.Channel1 / (df_slice_sci.Channel1 + df_slice_sci.Channel2)
-    df_slice_sci['y_val'] = df_slice_sci.Channel3 / (df_slice_sci.Channel3 + df_slice_sci.Channel4)
+    df_slice_sci['x_val'], df_slice_sci['y_val'] = position_pipeline.positions(
+        df_slice_sci.Channel1.values, df_slice_sci.Channel2.values,
+        df_slice_sci.Channel3.values, df_slice_sci.Channel4.values
+    )
 
     return df_slice_sci
 
@@ -97,7 +114,7 @@ def read_csv_hk(file_val=None, t_start=None, t_end=None):
         file_val = hk_file_name
 
     global df_slice_hk
-    df = pd.read_csv(file_val)
+    df = read_table(file_val)
 
     # Replace index with timestamp
     df.set_index('TimeStamp', inplace=True)
@@ -0,0 +1,221 @@
+import re
+from sys import argv
+
+import numpy as np
+
+from lxi_data_read_funcs import packet_dtype, packet_size, sync
+
+size_units = {"B": 1, "KB": 2**10, "MB": 2**20, "GB": 2**30}
+
+
+def parse_size(size):
+    """
+    Converts a size like "1MB" or "10 GB" to a number of bytes.
+
+    Parameters
+    ----------
+    size : str or int
+        Size, either as a number of bytes or as a number followed by one of "B", "KB", "MB" or
+        "GB".
+
+    Raises
+    ------
+    ValueError :
+        If the size can not be parsed.
+
+    Returns
+    -------
+    n_bytes : int
+        Number of bytes.
+    """
+    if isinstance(size, (int, np.integer)):
+        return int(size)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMG]?B)?\s*", size.upper())
+    if match is None:
+        raise ValueError(f"Can not parse the size {size}.")
+    return int(float(match.group(1)) * size_units[match.group(2) or "B"])
+
+
+def synthetic_packets(
+    n_packets,
+    rng,
+    start_time=0,
+    hk_fraction=0.03,
+    commanded_fraction=0.01,
+    mean_time_step=20
+    ):
+    """
+    Generates random science, commanded and house-keeping packets.
+
+    The timestamps (in milliseconds) increase by a random step from one packet to the next. The
+    science channels are centered around the middle of the ADC range, as for the events of the
+    MCP, and the house-keeping packets cycle through all the values of "hk_id".
+
+    Parameters
+    ----------
+    n_packets : int
+        Number of packets.
+    rng : numpy.random.Generator
+        Random number generator.
+    start_time : int
+        Timestamp of the first packet. Default is 0.
+    hk_fraction : float
+        Fraction of house-keeping packets. Default is 0.03.
+    commanded_fraction : float
+        Fraction of commanded science packets. Default is 0.01.
+    mean_time_step : float
+        Mean time between two packets, in milliseconds. Default is 20.
+
+    Returns
+    -------
+    packets : numpy.ndarray
+        Structured array with "packet_dtype".
+    """
+    packets = np.empty(n_packets, dtype=packet_dtype)
+    packets["sync"] = int.from_bytes(sync, "big")
+
+    timestamp = start_time + np.cumsum(rng.poisson(mean_time_step, n_packets))
+    kind = rng.random(n_packets)
+    is_hk = kind < hk_fraction
+    is_commanded = ~is_hk & (kind < hk_fraction + commanded_fraction)
+    packets["time"] = (
+        (timestamp & 0x3fffffff)
+        | (is_hk.astype(np.int64) << 31)
+        | (is_commanded.astype(np.int64) << 30)
+    )
+
+    channels = rng.normal(0.6 * 65535, 0.1 * 65535, (n_packets, 4))
+    channels = np.clip(channels, 0, 65535).astype(np.uint16)
+    n_hk = np.count_nonzero(is_hk)
+    hk_id = np.arange(n_hk) % 16
+    channels[is_hk, 0] = (hk_id << 12) | rng.integers(0, 4096, n_hk)
+    channels[is_hk, 1:] = rng.integers(0, 2000, (n_hk, 3))
+    packets["channels"] = channels
+    return packets
+
+
+def synthetic_raw_data(packets, rng, garbage_probability=0.001, max_garbage=32):
+    """
+    Converts the packets to raw bytes, injecting garbage bytes between some of them.
+
+    Half of the garbage blocks shorter than a packet start with the sync word, like a packet cut
+    short by the link. Just as in real captures, the packet after such a block is usually lost by
+    the decoder, since its sync word is inside the 16 bytes read for the truncated packet.
+
+    Parameters
+    ----------
+    packets : numpy.ndarray
+        Structured array with "packet_dtype".
+    rng : numpy.random.Generator
+        Random number generator.
+    garbage_probability : float
+        Probability of garbage bytes before each packet. Default is 0.001.
+    max_garbage : int
+        Maximum number of garbage bytes before a packet. Default is 32.
+
+    Returns
+    -------
+    raw : bytes
+        Raw binary data.
+    starts : numpy.ndarray
+        Byte offset of every packet in the raw data.
+    """
+    n_packets = len(packets)
+    garbage = np.where(
+        rng.random(n_packets) < garbage_probability,
+        rng.integers(1, max_garbage + 1, n_packets),
+        0,
+    )
+    starts = np.arange(n_packets) * packet_size + np.cumsum(garbage)
+
+    # The packets are copied in runs between the garbage blocks
+    blocks = packets.tobytes()
+    raw = bytearray()
+    previous = 0
+    for idx in np.flatnonzero(garbage).tolist():
+        raw += blocks[previous * packet_size:idx * packet_size]
+        n_garbage = int(garbage[idx])
+        if len(sync) <= n_garbage < packet_size and rng.random() < 0.5:
+            raw += sync + rng.bytes(n_garbage - len(sync))
+        else:
+            raw += rng.bytes(n_garbage)
+        previous = idx
+    raw += blocks[previous * packet_size:]
+    return bytes(raw), starts
+
+
+def write_synthetic_file(
+    file_name,
+    size,
+    seed=0,
+    hk_fraction=0.03,
+    commanded_fraction=0.01,
+    garbage_probability=0.001,
+    chunk_packets=2**20
+    ):
+    """
+    Writes a raw binary file of synthetic telemetry, in the format of the LEXI and Cupid captures.
+
+    The file is written in chunks of "chunk_packets" packets, so files of several GB can be
+    written with little memory. The file is cut at exactly "size" bytes, so it usually ends with
+    a partial packet.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the output file, including its path.
+    size : str or int
+        Size of the file (see "parse_size").
+    seed : int
+        Seed of the random number generator. Default is 0.
+    hk_fraction : float
+        Fraction of house-keeping packets. Default is 0.03.
+    commanded_fraction : float
+        Fraction of commanded science packets. Default is 0.01.
+    garbage_probability : float
+        Probability of garbage bytes before each packet. Default is 0.001.
+    chunk_packets : int
+        Number of packets generated at a time. Default is 2**20.
+
+    Returns
+    -------
+    counts : dict
+        Number of complete packets written in the file, by type ("sci", "commanded" and "hk").
+    """
+    n_bytes = parse_size(size)
+    rng = np.random.default_rng(seed)
+    counts = {"sci": 0, "commanded": 0, "hk": 0}
+    written = 0
+    start_time = 0
+    with open(file_name, "wb") as file:
+        while written < n_bytes:
+            packets = synthetic_packets(
+                chunk_packets, rng, start_time=start_time, hk_fraction=hk_fraction,
+                commanded_fraction=commanded_fraction
+            )
+            raw, starts = synthetic_raw_data(
+                packets, rng, garbage_probability=garbage_probability
+            )
+            start_time = int(packets["time"][-1] & 0x3fffffff)
+
+            if written + len(raw) > n_bytes:
+                # Only count the packets which fit in the file
+                raw = raw[:n_bytes - written]
+                packets = packets[starts + packet_size <= len(raw)]
+            file.write(raw)
+            written += len(raw)
+
+            time = packets["time"]
+            is_hk = (time & 0x80000000).astype(bool)
+            is_commanded = ~is_hk & (time & 0x40000000).astype(bool)
+            counts["hk"] += int(np.count_nonzero(is_hk))
+            counts["commanded"] += int(np.count_nonzero(is_commanded))
+            counts["sci"] += int(np.count_nonzero(~is_hk & ~is_commanded))
+    return counts
+
+
+if __name__ == "__main__":
+    file_name = argv[1] if len(argv) > 1 else "../data/raw_data/synthetic_raw.txt"
+    size = argv[2] if len(argv) > 2 else "1MB"
+    counts = write_synthetic_file(file_name, size)
+    print(f"Wrote {file_name}: {counts}")
@@ -0,0 +1,235 @@
+import asyncio
+from sys import argv
+from typing import NamedTuple
+
+from lxi_data_read_funcs import PacketFramer, PacketTable
+
+
+class packet_batch(NamedTuple):
+    """
+    Batch of packets decoded from the stream.
+    - position: int, byte offset in the stream of the first byte which is not decoded yet
+    - sci: PacketTable of the science packets
+    - hk: PacketTable of the house-keeping packets
+    """
+    position: int
+    sci: PacketTable
+    hk: PacketTable
+
+
+class PacketIngest():
+    """
+    Decodes the packets of a telemetry stream received over TCP and publishes them to subscribers.
+
+    The bytes are framed as they arrive with "PacketFramer", so a packet split between two reads
+    from the socket is decoded once its last byte arrives. Every subscriber gets its own bounded
+    queue. When a queue is full, the ingest waits for the subscriber to catch up before reading
+    more from the socket, so a slow subscriber slows down the source through TCP flow control
+    instead of the memory growing without limit. At the end of the stream, None is put in every
+    queue without waiting, even if the ingest failed or was cancelled, the oldest batch of a full
+    queue being dropped to make room for it.
+
+    Attributes
+    ----------
+    chunk_size : int
+        Maximum number of bytes read from the socket at a time.
+    framer : PacketFramer
+        Framer of the stream.
+    subscribers : list
+        Queues of the subscribers.
+    """
+    def __init__(self, chunk_size=2**16, metrics=None):
+        self.chunk_size = chunk_size
+        self.framer = PacketFramer(metrics=metrics)
+        self.subscribers = []
+
+    def subscribe(self, maxsize=16):
+        """
+        Adds a subscriber.
+
+        Parameters
+        ----------
+        maxsize : int
+            Maximum number of batches waiting in the queue of the subscriber. Default is 16.
+
+        Returns
+        -------
+        queue : asyncio.Queue
+            Queue in which the "packet_batch" are put.
+        """
+        queue = asyncio.Queue(maxsize=maxsize)
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.remove(queue)
+
+    def close_subscribers(self):
+        # Puts the end of stream marker in every queue without waiting, since a subscriber which
+        # stopped reading would otherwise block the end (or the cancellation) of the ingest
+        for queue in list(self.subscribers):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    async def publish(self, batch):
+        # Waits until every subscriber has room for the batch
+        for queue in list(self.subscribers):
+            await queue.put(batch)
+
+    async def publish_packets(self, packets):
+        if len(packets) == 0:
+            return
+        is_hk = (packets["time"] & 0x80000000).astype(bool)
+        await self.publish(packet_batch(
+            position=self.framer.position,
+            sci=PacketTable(packets[~is_hk], kind="sci"),
+            hk=PacketTable(packets[is_hk], kind="hk"),
+        ))
+
+    async def ingest(self, reader):
+        """
+        Decodes the stream of a reader until its end.
+
+        Parameters
+        ----------
+        reader : asyncio.StreamReader
+            Reader of the stream.
+
+        Returns
+        -------
+        n_bytes : int
+            Number of bytes received.
+        """
+        n_bytes = 0
+        try:
+            while True:
+                chunk = await reader.read(self.chunk_size)
+                if not chunk:
+                    break
+                n_bytes += len(chunk)
+                await self.publish_packets(self.framer.feed(chunk))
+            await self.publish_packets(self.framer.flush())
+        finally:
+            self.close_subscribers()
+        return n_bytes
+
+    async def run(self, host="127.0.0.1", port=5000):
+        """
+        Connects to a TCP source and decodes its stream until the connection is closed.
+
+        Parameters
+        ----------
+        host : str
+            Host of the source. Default is "127.0.0.1".
+        port : int
+            Port of the source. Default is 5000.
+
+        Returns
+        -------
+        n_bytes : int
+            Number of bytes received.
+        """
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            return await self.ingest(reader)
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+
+async def replay_raw_file(
+    input_file_name, host="127.0.0.1", port=0, chunk_size=4096, bytes_per_second=None
+    ):
+    """
+    Starts a TCP server which replays a raw binary file to every client, to test the ingest
+    without the eBox.
+
+    Parameters
+    ----------
+    input_file_name : str
+        Name of the raw binary file, including its path.
+    host : str
+        Host of the server. Default is "127.0.0.1".
+    port : int
+        Port of the server. Default is 0, in which case a free port is used (see
+        "server.sockets[0].getsockname()").
+    chunk_size : int
+        Number of bytes sent at a time. Default is 4096.
+    bytes_per_second : float
+        Rate at which the file is sent. Default is None, in which case it is sent as fast as the
+        client reads it.
+
+    Returns
+    -------
+    server : asyncio.base_events.Server
+        Server replaying the file.
+    """
+    async def send_file(reader, writer):
+        try:
+            with open(input_file_name, 'rb') as file:
+                for chunk in iter(lambda: file.read(chunk_size), b""):
+                    writer.write(chunk)
+                    # Wait for the client if it is slower than the file is sent
+                    await writer.drain()
+                    if bytes_per_second:
+                        await asyncio.sleep(len(chunk) / bytes_per_second)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(send_file, host, port)
+
+
+async def replay_and_ingest(input_file_name, chunk_size=4096, bytes_per_second=None):
+    """
+    Replays a raw binary file over localhost and counts the packets decoded by the ingest.
+
+    Parameters
+    ----------
+    input_file_name : str
+        Name of the raw binary file, including its path.
+    chunk_size : int
+        Number of bytes sent at a time. Default is 4096.
+    bytes_per_second : float
+        Rate at which the file is sent. Default is None, in which case it is sent as fast as
+        possible.
+
+    Returns
+    -------
+    n_sci : int
+        Number of science packets.
+    n_hk : int
+        Number of house-keeping packets.
+    """
+    server = await replay_raw_file(
+        input_file_name, chunk_size=chunk_size, bytes_per_second=bytes_per_second
+    )
+    port = server.sockets[0].getsockname()[1]
+    packet_ingest = PacketIngest()
+    queue = packet_ingest.subscribe()
+
+    async def count():
+        n_sci = 0
+        n_hk = 0
+        while (batch := await queue.get()) is not None:
+            n_sci += len(batch.sci)
+            n_hk += len(batch.hk)
+        return n_sci, n_hk
+
+    async with server:
+        counts, _ = await asyncio.gather(count(), packet_ingest.run(port=port))
+    return counts
+
+
+if __name__ == "__main__":
+    if len(argv) > 1:
+        input_file_name = argv[1]
+    else:
+        input_file_name = (
+            "../data/raw_data/2022_04_21_1431_LEXI_HK_unit_1_mcp_unit_1_eBox_1987_hk_/"
+            "2022_04_21_1431_LEXI_raw_LEXI_unit_1_mcp_unit_1_eBox-1987.txt"
+        )
+    n_sci, n_hk = asyncio.run(replay_and_ingest(input_file_name))
+    print(f"{n_sci} science and {n_hk} house-keeping packets received")
@@ -0,0 +1,334 @@
+from typing import NamedTuple
+
+import numpy as np
+
+from lxi_calibration import get_calibration
+
+
+class mcp_geometry(NamedTuple):
+    """
+    Parameters of the reconstruction of the position of the events on the MCP from the voltages
+    of its four channels (x0, x1, y0, y1).
+    - name: str, name of the geometry
+    - version: int, version of the geometry
+    - channel_offset: tuple, offset in volts subtracted from each of the four channels
+    - position_offset: tuple, (x, y) offset subtracted from the position ratios before the
+      alignment
+    - alignment: tuple, 2x2 alignment matrix (M_inv), as ((m00, m01), (m10, m11))
+    - scale: float, factor converting the aligned position to the output units, per bin if
+      "n_bins" is given
+    - unit: str, units of the reconstructed positions
+    - n_bins: int, number of bins across the positions, by which "scale" is multiplied, or None
+      if the positions are not in bins (default)
+    """
+    name: str
+    version: int
+    channel_offset: tuple
+    position_offset: tuple
+    alignment: tuple
+    scale: float
+    unit: str
+    n_bins: int = None
+
+
+# Alignment correction developed by C. O'Brien
+cupid_alignment = ((1.0275, -0.14678), (-0.13380, 1.0293))
+
+# Geometries of all the names and versions, with (name, version) as key
+mcp_geometries = {}
+
+
+def register_geometry(geometry):
+    """
+    Adds a geometry to the registry, replacing the one of the same name and version if any.
+
+    Parameters
+    ----------
+    geometry : mcp_geometry
+        Geometry to add.
+
+    Returns
+    -------
+    geometry : mcp_geometry
+        The added geometry.
+    """
+    mcp_geometries[(geometry.name, geometry.version)] = geometry
+    return geometry
+
+
+def get_geometry(name, version=None):
+    """
+    Gets a geometry from the registry.
+
+    Parameters
+    ----------
+    name : str
+        Name of the geometry.
+    version : int
+        Version of the geometry. Default is None, in which case the latest version is used.
+
+    Raises
+    ------
+    KeyError :
+        If there is no such geometry in the registry.
+
+    Returns
+    -------
+    geometry : mcp_geometry
+        Geometry.
+    """
+    if version is None:
+        versions = [key[1] for key in mcp_geometries if key[0] == name]
+        if not versions:
+            raise KeyError(f"No geometry registered with the name {name}.")
+        version = max(versions)
+    return mcp_geometries[(name, version)]
+
+
+# Cupid X-ray detector positions in cm on the MCP (used by "plot_xrbr"). The factor 2/0.0614 is a
+# normalization like Siegmund et al. 1986.
+register_geometry(mcp_geometry(
+    name="cupid_cm",
+    version=1,
+    channel_offset=(1, 1, 1, 1),
+    position_offset=(0.4866, 0.5201),
+    alignment=cupid_alignment,
+    scale=2 / 0.0614,
+    unit="cm",
+))
+
+# Cupid X-ray detector positions in bins (used by "plot_xrbrcommanded" and "rate_xrbr"). The
+# factor 7 per bin is a normalization like Siegmund et al. 1986. The callers give their number of
+# bins to "PositionPipeline", 80 being the default.
+register_geometry(mcp_geometry(
+    name="cupid_bins",
+    version=1,
+    channel_offset=(1, 1, 1, 1),
+    position_offset=(0.5006, 0.5061),
+    alignment=cupid_alignment,
+    scale=7,
+    unit="bin",
+    n_bins=80,
+))
+
+# Plain position ratios of LEXI, x0/(x0+x1) and y0/(y0+y1) (used by the GUI)
+register_geometry(mcp_geometry(
+    name="lxi_ratio",
+    version=1,
+    channel_offset=(0, 0, 0, 0),
+    position_offset=(0, 0),
+    alignment=((1, 0), (0, 1)),
+    scale=1,
+    unit="",
+))
+
+
+# Names of the four channels of the MCP, in the order of the packets
+channel_names = ("x0", "x1", "y0", "y1")
+
+# Reasons for which an event is rejected by "threshold_filter", as bits of "reasons"
+reject_reasons = tuple(
+    f"{channel} {side}" for channel in channel_names for side in ("low", "high")
+)
+
+
+class threshold_result(NamedTuple):
+    """
+    Result of "threshold_filter".
+    - passed: numpy.ndarray, mask of the events which pass the thresholds on all the channels
+    - reasons: numpy.ndarray, reasons of the rejection of each event, bit i being set if the
+      event is rejected for "reject_reasons[i]" (0 for the events which pass)
+    - rejects: dict, number of events rejected for each of "reject_reasons" (an event can be
+      rejected for several reasons)
+    """
+    passed: np.ndarray
+    reasons: np.ndarray
+    rejects: dict
+
+
+def threshold_filter(x0, x1, y0, y1, lo_thold=2.1, hi_thold=3.3):
+    """
+    Keeps the events with all four channels strictly between a low and a high threshold.
+
+    The reasons of the rejection of every event are gathered as bits of one array, so that the
+    mask of the events which pass and the number of events rejected for each reason both come
+    from a single pass over the channels, instead of the sorts of "np.intersect1d". Since the
+    thresholds are tested as "lo_thold < volts < hi_thold", a nan is rejected as low.
+
+    Parameters
+    ----------
+    x0, x1, y0, y1 : numpy.ndarray
+        Volts of each channel.
+    lo_thold : float or tuple
+        Low threshold, either the same for all the channels or one per channel. Default is 2.1.
+    hi_thold : float or tuple
+        High threshold, either the same for all the channels or one per channel. Default is 3.3.
+
+    Returns
+    -------
+    result : threshold_result
+        Mask of the events which pass, reasons of the rejection of each event, and number of
+        rejected events per reason.
+    """
+    channels = (x0, x1, y0, y1)
+    lo_tholds = np.broadcast_to(lo_thold, len(channels))
+    hi_tholds = np.broadcast_to(hi_thold, len(channels))
+
+    reasons = np.zeros(len(x0), dtype=np.uint8)
+    for ii, (volts, lo, hi) in enumerate(zip(channels, lo_tholds, hi_tholds)):
+        reasons |= (~(volts > lo)).view(np.uint8) << (2 * ii)
+        reasons |= (volts >= hi).view(np.uint8) << (2 * ii + 1)
+
+    # Number of events for each combination of reasons, then for each reason
+    combinations = np.bincount(reasons, minlength=256)
+    codes = np.arange(256)
+    rejects = {
+        reason: int(combinations[(codes >> ii) & 1 == 1].sum())
+        for ii, reason in enumerate(reject_reasons)
+    }
+    return threshold_result(passed=reasons == 0, reasons=reasons, rejects=rejects)
+
+
+class PositionPipeline():
+    """
+    Reconstruction of the position of the events on the MCP, with the stages:
+    - "volts": conversion of the ADC codes of the channels to volts
+    - "offset": subtraction of the offset of each channel
+    - "ratio": position ratios x0/(x0+x1) and y0/(y0+y1)
+    - "align": subtraction of the position offset and multiplication by the alignment matrix
+    - "scale": conversion to the units of the geometry
+
+    Every caller using the same geometry gets the same positions. The stages run over float32
+    columns, with the intermediate results written in place, so that an event takes a few
+    bytes of memory traffic per stage.
+
+    Attributes
+    ----------
+    geometry : mcp_geometry
+        Geometry of the reconstruction.
+    stages : tuple
+        Stages which are run, in the order above. The "ratio" stage is always run.
+    calibration : Calibration
+        Calibration used by the "volts" stage, the one of Cupid by default, or None if the
+        "volts" stage is not run and no calibration is given.
+    dtype : numpy.dtype
+        Data type of the computations.
+
+    The number of bins of a geometry in bins can be given with "n_bins", e.g.
+    PositionPipeline("cupid_bins", n_bins=nbins).
+    """
+    all_stages = ("volts", "offset", "ratio", "align", "scale")
+
+    def __init__(
+        self, geometry, stages=all_stages, calibration=None, dtype=np.float32, n_bins=None
+        ):
+        if isinstance(geometry, str):
+            geometry = get_geometry(geometry)
+        if n_bins is not None:
+            if geometry.n_bins is None:
+                raise ValueError(f"The geometry {geometry.name} is not in bins.")
+            geometry = geometry._replace(n_bins=n_bins)
+        unknown = set(stages) - set(self.all_stages)
+        if unknown:
+            raise ValueError(f"Unknown stages {', '.join(sorted(unknown))}.")
+        self.geometry = geometry
+        self.stages = tuple(stage for stage in self.all_stages if stage in stages)
+        self.dtype = np.dtype(dtype)
+        if calibration is None and "volts" in self.stages:
+            calibration = get_calibration("cupid")
+        self.calibration = None if calibration is None else calibration.astype(self.dtype)
+
+    def __repr__(self):
+        return (
+            f"PositionPipeline({self.geometry.name!r}, version={self.geometry.version}, "
+            f"stages={self.stages})"
+        )
+
+    def volts(self, channels):
+        """
+        Converts the ADC codes of the channels to volts.
+
+        Parameters
+        ----------
+        channels : numpy.ndarray
+            ADC codes, with one row per event and one column per channel (x0, x1, y0, y1).
+
+        Returns
+        -------
+        volts : numpy.ndarray
+            Volts, with one row per channel, so that each channel is contiguous.
+        """
+        if "volts" not in self.stages:
+            return np.asarray(channels, dtype=self.dtype).T.copy()
+        return self.calibration.channel_volts(np.asarray(channels).T)
+
+    def positions(self, x0, x1, y0, y1):
+        """
+        Reconstructs the positions from the voltages of the channels.
+
+        Parameters
+        ----------
+        x0, x1, y0, y1 : numpy.ndarray
+            Volts of each channel.
+
+        Returns
+        -------
+        x : numpy.ndarray
+            X positions.
+        y : numpy.ndarray
+            Y positions.
+        """
+        geometry = self.geometry
+        x = np.array(x0, dtype=self.dtype)
+        y = np.array(y0, dtype=self.dtype)
+        x_sum = np.array(x1, dtype=self.dtype)
+        y_sum = np.array(y1, dtype=self.dtype)
+
+        if "offset" in self.stages:
+            x0_offset, x1_offset, y0_offset, y1_offset = geometry.channel_offset
+            x -= x0_offset
+            x_sum -= x1_offset
+            y -= y0_offset
+            y_sum -= y1_offset
+
+        # x0/(x0+x1) and y0/(y0+y1)
+        x_sum += x
+        y_sum += y
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x /= x_sum
+            y /= y_sum
+
+        if "align" in self.stages:
+            x -= geometry.position_offset[0]
+            y -= geometry.position_offset[1]
+            (m00, m01), (m10, m11) = geometry.alignment
+            # The old x is needed for the new y, so the new x is computed in "x_sum"
+            np.multiply(x, m00, out=x_sum)
+            x_sum += m01 * y
+            y *= m11
+            y += m10 * x
+            x, x_sum = x_sum, x
+
+        if "scale" in self.stages:
+            scale = geometry.scale * (geometry.n_bins or 1)
+            x *= scale
+            y *= scale
+        return x, y
+
+    def __call__(self, channels):
+        """
+        Reconstructs the positions from the ADC codes of the channels.
+
+        Parameters
+        ----------
+        channels : numpy.ndarray
+            ADC codes, with one row per event and one column per channel (x0, x1, y0, y1).
+
+        Returns
+        -------
+        x : numpy.ndarray
+            X positions.
+        y : numpy.ndarray
+            Y positions.
+        """
+        return self.positions(*self.volts(channels))
@@ -0,0 +1,488 @@
+from pathlib import Path
+from sys import argv
+
+import numpy as np
+
+from cupid_xray_decode import clear_xray_cache, decode_xray
+from lxi_calibration import get_calibration
+from lxi_data_read_funcs import iter_raw_packets
+from mcp_event_pipeline import PositionPipeline, get_geometry, threshold_filter
+
+# Version of the ".npz" files of the images, to be increased whenever their content changes
+image_file_version = 1
+
+
+def axis_pixels(values, edges):
+    """
+    Computes the pixel of each value along one axis of evenly spaced edges, in the same way as
+    "np.histogram2d" (the last pixel includes the upper edge).
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Values between the first and the last edge.
+    edges : numpy.ndarray
+        Edges of the pixels.
+
+    Returns
+    -------
+    pixels : numpy.ndarray
+        Index of the pixel of each value.
+    """
+    n_pixels = len(edges) - 1
+    pixels = ((values - edges[0]) * (n_pixels / (edges[-1] - edges[0]))).astype(np.intp)
+    np.minimum(pixels, n_pixels - 1, out=pixels)
+    # Correct the rounding errors of the division, as "np.histogram" does
+    pixels -= values < edges[pixels]
+    pixels += (values >= edges[pixels + 1]) & (pixels != n_pixels - 1)
+    return pixels
+
+
+class ImageAccumulator():
+    """
+    Image of the positions of the events on the MCP, built up from chunks of events, files or
+    other images.
+
+    The image keeps the number of events in each pixel (the 2D histogram of the positions, with
+    x along the first axis as "np.histogram2d"), the exposure time and the number of events
+    outside of the image, so that images of several chunks, files or exposures are merged by
+    adding them. The events of a chunk are binned with a single "np.bincount" on the flat index
+    of their pixel, and are not kept afterwards. The default pixels are the ones of "plot_xrbr"
+    (edges np.linspace(-2.3, 2.3, 100) in cm).
+
+    Attributes
+    ----------
+    geometry : mcp_geometry
+        Geometry of the reconstruction of the positions.
+    calibration : Calibration
+        Calibration of the channels.
+    shape : tuple
+        Number of pixels along x and y.
+    x_range : tuple
+        Lower and upper edges of the image along x, in the units of the geometry.
+    y_range : tuple
+        Lower and upper edges of the image along y, in the units of the geometry.
+    lo_thold : float
+        Low threshold of the channels in volts, or None to keep all the events.
+    hi_thold : float
+        High threshold of the channels in volts, or None to keep all the events.
+    counts : numpy.ndarray
+        Number of events in each pixel.
+    exposure : float
+        Exposure time in seconds.
+    n_outside : int
+        Number of events which passed the thresholds but fell outside of the image.
+    last_time : int
+        Time of the latest event of the current exposure in milliseconds, or None before the
+        first chunk of an exposure (see "update_events").
+    sources : list
+        Names of the files added to the image.
+    """
+    def __init__(
+        self,
+        geometry="cupid_cm",
+        shape=(99, 99),
+        x_range=(-2.3, 2.3),
+        y_range=(-2.3, 2.3),
+        lo_thold=2.1,
+        hi_thold=3.3,
+        calibration=None
+        ):
+        if isinstance(geometry, str):
+            geometry = get_geometry(geometry)
+        if calibration is None:
+            calibration = get_calibration("cupid")
+        self.geometry = geometry
+        self.calibration = calibration
+        self.shape = tuple(int(n) for n in shape)
+        self.x_range = tuple(float(edge) for edge in x_range)
+        self.y_range = tuple(float(edge) for edge in y_range)
+        self.lo_thold = lo_thold
+        self.hi_thold = hi_thold
+        self.counts = np.zeros(self.shape, dtype=np.int64)
+        self.exposure = 0.0
+        self.n_outside = 0
+        self.last_time = None
+        self.sources = []
+        self.pipeline = PositionPipeline(geometry, calibration=calibration)
+
+    def __repr__(self):
+        return (
+            f"ImageAccumulator({self.geometry.name!r}, shape={self.shape}, "
+            f"events={self.n_events}, exposure={self.exposure:.3f} s)"
+        )
+
+    @property
+    def settings(self):
+        """
+        Settings of the image, which must be the same for two images to be merged.
+        """
+        return {
+            "geometry": (self.geometry.name, self.geometry.version),
+            "calibration": (self.calibration.unit, self.calibration.version),
+            "shape": self.shape,
+            "x_range": self.x_range,
+            "y_range": self.y_range,
+            "lo_thold": self.lo_thold,
+            "hi_thold": self.hi_thold,
+        }
+
+    @property
+    def n_events(self):
+        """
+        Number of events in the image.
+        """
+        return int(self.counts.sum())
+
+    @property
+    def x_edges(self):
+        return np.linspace(*self.x_range, self.shape[0] + 1)
+
+    @property
+    def y_edges(self):
+        return np.linspace(*self.y_range, self.shape[1] + 1)
+
+    @property
+    def rate(self):
+        """
+        Count rate of each pixel in counts per second (nan without exposure).
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.counts / np.float64(self.exposure)
+
+    def pixel_index(self, x, y):
+        """
+        Computes the flat index of the pixel of each position.
+
+        Parameters
+        ----------
+        x : numpy.ndarray
+            X positions.
+        y : numpy.ndarray
+            Y positions.
+
+        Returns
+        -------
+        index : numpy.ndarray
+            Flat index of the pixel of each position inside the image.
+        inside : numpy.ndarray
+            Mask of the positions inside the image (nan positions are outside).
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        inside = (
+            (x >= self.x_range[0]) & (x <= self.x_range[1])
+            & (y >= self.y_range[0]) & (y <= self.y_range[1])
+        )
+        index = axis_pixels(x[inside], self.x_edges) * self.shape[1]
+        index += axis_pixels(y[inside], self.y_edges)
+        return index, inside
+
+    def update(self, x, y, exposure=0.0):
+        """
+        Adds a chunk of positions to the image.
+
+        Parameters
+        ----------
+        x : numpy.ndarray
+            X positions, in the units of the geometry.
+        y : numpy.ndarray
+            Y positions, in the units of the geometry.
+        exposure : float
+            Exposure time of the chunk in seconds. Default is 0.
+
+        Returns
+        -------
+        image : ImageAccumulator
+            The image itself.
+        """
+        index, inside = self.pixel_index(x, y)
+        self.counts += np.bincount(index, minlength=self.counts.size).reshape(self.shape)
+        self.n_outside += int(len(inside) - np.count_nonzero(inside))
+        self.exposure += float(exposure)
+        return self
+
+    def update_events(self, times, channels, exposure=None):
+        """
+        Adds a chunk of events of an exposure to the image, keeping the events which pass the
+        thresholds.
+
+        Unless it is given, the exposure time of the chunk is the time from the latest event of
+        the previous chunk (or the first event of the chunk, for the first chunk of an exposure)
+        to the latest event of the chunk, so that the chunks of one exposure add up to its
+        duration. "last_time" must be reset to None before the first chunk of a new exposure.
+
+        Parameters
+        ----------
+        times : numpy.ndarray
+            Times of the events in milliseconds.
+        channels : numpy.ndarray
+            ADC codes of the events, with one row per event and one column per channel (x0, x1,
+            y0, y1).
+        exposure : float
+            Exposure time of the chunk in seconds. Default is None (see above).
+
+        Returns
+        -------
+        image : ImageAccumulator
+            The image itself.
+        """
+        times = np.asarray(times).astype(np.int64)
+        if exposure is None:
+            exposure = 0.0
+            if len(times):
+                last_time = int(times.max())
+                first_time = int(times.min()) if self.last_time is None else self.last_time
+                exposure = max(last_time - first_time, 0) / 1000
+                self.last_time = max(last_time, first_time)
+
+        x0, x1, y0, y1 = self.pipeline.volts(channels)
+        if self.lo_thold is not None or self.hi_thold is not None:
+            lo_thold = -np.inf if self.lo_thold is None else self.lo_thold
+            hi_thold = np.inf if self.hi_thold is None else self.hi_thold
+            passed = threshold_filter(x0, x1, y0, y1, lo_thold=lo_thold, hi_thold=hi_thold).passed
+            x0, x1, y0, y1 = x0[passed], x1[passed], y0[passed], y1[passed]
+        x, y = self.pipeline.positions(x0, x1, y0, y1)
+        return self.update(x, y, exposure=exposure)
+
+    def update_packets(self, packets, commanded=False, exposure=None):
+        """
+        Adds a chunk of decoded packets to the image, e.g. from "iter_raw_packets", keeping the
+        science packets (see "update_events").
+
+        Parameters
+        ----------
+        packets : numpy.ndarray
+            Structured array with "packet_dtype".
+        commanded : bool
+            If True, the commanded events are kept too. Default is False, as "read_xray".
+        exposure : float
+            Exposure time of the chunk in seconds. Default is None.
+
+        Returns
+        -------
+        image : ImageAccumulator
+            The image itself.
+        """
+        time = packets["time"].astype(np.int64)
+        # Bit 31 of the time tag marks the house-keeping packets, and bit 30 the commanded events
+        science = time < (2**31 if commanded else 2**30)
+        return self.update_events(
+            time[science] & 0x3fffffff, packets["channels"][science], exposure=exposure
+        )
+
+    def merge(self, other):
+        """
+        Adds another image, e.g. of another file or exposure, to the image.
+
+        Parameters
+        ----------
+        other : ImageAccumulator
+            Image with the same settings.
+
+        Raises
+        ------
+        ValueError :
+            If the settings of the images are not the same, or if a file was added to both.
+
+        Returns
+        -------
+        image : ImageAccumulator
+            The image itself.
+        """
+        if other.settings != self.settings:
+            raise ValueError(
+                f"Can not merge images with different settings: {self.settings} and "
+                f"{other.settings}."
+            )
+        shared = set(self.sources) & set(other.sources)
+        if shared:
+            raise ValueError(f"The files {', '.join(sorted(shared))} are in both images.")
+        self.counts += other.counts
+        self.exposure += other.exposure
+        self.n_outside += other.n_outside
+        self.sources.extend(other.sources)
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __add__(self, other):
+        return self.copy().merge(other)
+
+    def copy(self):
+        """
+        Returns a copy of the image.
+        """
+        image = ImageAccumulator(
+            self.geometry, self.shape, self.x_range, self.y_range, self.lo_thold, self.hi_thold,
+            self.calibration
+        )
+        image.counts = self.counts.copy()
+        image.exposure = self.exposure
+        image.n_outside = self.n_outside
+        image.last_time = self.last_time
+        image.sources = list(self.sources)
+        return image
+
+    def save(self, file_name):
+        """
+        Saves the image to a ".npz" file.
+
+        The file is first written to a temporary file which then replaces it, so that an
+        interrupted save never leaves a half-written image.
+
+        Parameters
+        ----------
+        file_name : str
+            Name of the file, including its path.
+        """
+        temporary_file_name = f"{file_name}.tmp.npz"
+        np.savez_compressed(
+            temporary_file_name,
+            version=image_file_version,
+            geometry=self.geometry.name,
+            geometry_version=self.geometry.version,
+            calibration=self.calibration.unit,
+            calibration_version=self.calibration.version,
+            x_range=self.x_range,
+            y_range=self.y_range,
+            thresholds=[np.nan if thold is None else thold
+                        for thold in (self.lo_thold, self.hi_thold)],
+            counts=self.counts,
+            exposure=self.exposure,
+            n_outside=self.n_outside,
+            last_time=-1 if self.last_time is None else self.last_time,
+            sources=np.array(self.sources, dtype=str),
+        )
+        Path(temporary_file_name).replace(file_name)
+
+    @classmethod
+    def load(cls, file_name):
+        """
+        Loads an image saved with "save".
+
+        Parameters
+        ----------
+        file_name : str
+            Name of the file, including its path.
+
+        Raises
+        ------
+        ValueError :
+            If the file was written by another version.
+
+        Returns
+        -------
+        image : ImageAccumulator
+            The image.
+        """
+        with np.load(file_name) as data:
+            if int(data["version"]) != image_file_version:
+                raise ValueError(f"{file_name} is an image of version {int(data['version'])}.")
+            lo_thold, hi_thold = (
+                None if np.isnan(thold) else float(thold) for thold in data["thresholds"]
+            )
+            image = cls(
+                geometry=get_geometry(str(data["geometry"]), int(data["geometry_version"])),
+                shape=data["counts"].shape,
+                x_range=data["x_range"],
+                y_range=data["y_range"],
+                lo_thold=lo_thold,
+                hi_thold=hi_thold,
+                calibration=get_calibration(
+                    str(data["calibration"]), int(data["calibration_version"])
+                ),
+            )
+            image.counts = data["counts"].astype(np.int64)
+            image.exposure = float(data["exposure"])
+            image.n_outside = int(data["n_outside"])
+            image.last_time = None if int(data["last_time"]) < 0 else int(data["last_time"])
+            image.sources = data["sources"].tolist()
+        return image
+
+
+def file_unit(file_name):
+    """
+    Returns the instrument unit of a raw binary file from its name, "cupid" for the XRBR files
+    and "lxi" for the others.
+    """
+    return "cupid" if Path(file_name).name[0:4] == "xrbr" else "lxi"
+
+
+def accumulate_files(file_names, image_file_name, chunk_size=2**24, **settings):
+    """
+    Adds raw binary files (XRBR or LEXI) to an image saved in a ".npz" file, e.g. the exposures of
+    a flat field.
+
+    The image is loaded if the file exists, and created with "settings" otherwise. Each file is a
+    new exposure. The XRBR files are decoded with "decode_xray", so that the image has the same
+    events as the plots of "Cupid_Xray_Calibration", and the other files are decoded in chunks
+    with "iter_raw_packets", so that the memory used does not depend on their size. The files
+    already added to the image are skipped, and the image is saved after every file, so that an
+    interrupted accumulation continues where it stopped.
+
+    The channels of every file are converted with the calibration of the image, so all the files
+    must be of the unit of that calibration (see "file_unit"). Unless it is given in "settings",
+    the calibration of a new image is the one of the unit of the first file.
+
+    Parameters
+    ----------
+    file_names : list
+        Names of the raw binary files, including their paths.
+    image_file_name : str
+        Name of the ".npz" file of the image, including its path.
+    chunk_size : int
+        Number of bytes decoded at a time. Default is 16 MB.
+    **settings :
+        Arguments of "ImageAccumulator" for a new image.
+
+    Raises
+    ------
+    ValueError :
+        If a file is not of the unit of the calibration of the image.
+
+    Returns
+    -------
+    image : ImageAccumulator
+        The image with all the files.
+    """
+    if Path(image_file_name).is_file():
+        image = ImageAccumulator.load(image_file_name)
+    else:
+        if settings.get("calibration") is None and file_names:
+            settings["calibration"] = get_calibration(file_unit(file_names[0]))
+        image = ImageAccumulator(**settings)
+
+    # Check all the files first, so that the image is not left with a part of them
+    for file_name in file_names:
+        if file_unit(file_name) != image.calibration.unit:
+            raise ValueError(
+                f"{file_name} is a file of the {file_unit(file_name)} unit, but the image has "
+                f"the {image.calibration.unit} calibration."
+            )
+
+    for file_name in file_names:
+        source = str(Path(file_name).resolve())
+        if source in image.sources:
+            continue
+        image.last_time = None
+        if file_unit(file_name) == "cupid":
+            columns = decode_xray(file_name)
+            image.update_events(columns.time[columns.sci], columns.channels[columns.sci])
+            clear_xray_cache()
+        else:
+            for packets in iter_raw_packets(file_name, chunk_size=chunk_size):
+                image.update_packets(packets)
+        image.last_time = None
+        image.sources.append(source)
+        image.save(image_file_name)
+    return image
+
+
+if __name__ == "__main__":
+    image = accumulate_files(argv[2:], argv[1])
+    print(
+        f"{len(image.sources)} files, {image.n_events} events in the image, "
+        f"{image.n_outside} outside, exposure {image.exposure:.3f} s"
+    )